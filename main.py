@@ -5,11 +5,12 @@ PySide6 + PySide6-Fluent-Widgets (Fluent2 UI)
 包含：常规清理(支持拖拽排序与自定义规则)、大文件扫描、重复文件、空文件夹、无效快捷方式等
 """
 
-import os, sys, time, ctypes, threading, subprocess, queue, json, hashlib, winreg, re, heapq, tempfile, gc, shutil
+import os, sys, time, ctypes, threading, subprocess, queue, json, hashlib, winreg, re, heapq, tempfile, gc, shutil, sqlite3, multiprocessing, struct
 import urllib.parse
 import urllib.request
 import webbrowser
-from collections import defaultdict
+from array import array
+from collections import Counter, OrderedDict, defaultdict, deque
 from dataclasses import dataclass
 
 from PySide6.QtCore import Qt, Signal, QObject, QPoint, QRect, QRectF, QMetaObject, Slot, QFileInfo, QSize, QTimer, QAbstractTableModel, QModelIndex, QEvent, QMimeData, QLocale
@@ -172,6 +173,7 @@ _session_log_lines = []
 _session_log_lock = threading.Lock()
 _sampled_error_counts = {}
 _sampled_error_lock = threading.Lock()
+_scan_error_scope = threading.local()
 _memory_trim_lock = threading.Lock()
 _last_memory_trim_ts = 0.0
 MEMORY_TRIM_COOLDOWN_SEC = 8.0
@@ -208,6 +210,9 @@ def log_sampled_background_error(context, e, limit=6):
         count = _sampled_error_counts.get(key, 0)
         _sampled_error_counts[key] = count + 1
         should_log = count < max(1, int(limit))
+    metrics = getattr(_scan_error_scope, "metrics", None)
+    if metrics is not None:
+        metrics.count_error(key)
     if should_log:
         log_background_error(key, e)
 
@@ -1313,7 +1318,102 @@ def _file_stat_signature(st):
         int(st.st_ino),
     )
 
-def _stable_file_digest(path, expected_size=None, stop_event=None, chunk_size=1024 * 1024):
+READ_BUFFER_SIZE = 1024 * 1024
+READ_MMAP_MIN_SIZE = 64 * 1024 * 1024
+_read_buffers = threading.local()
+
+def _hash_mmap_enabled():
+    """C_CLEANER_PLUS_HASH_MMAP=1 时大文件哈希改用 mmap；默认关闭，映射期间文件被截断在 POSIX 上会触发 SIGBUS。"""
+    return os.environ.get("C_CLEANER_PLUS_HASH_MMAP", "").strip().lower() in ("1", "true", "yes", "on")
+
+def _thread_read_buffer(size, slot=0):
+    """返回当前线程复用的读缓冲区；需要同时读两个文件的调用方用不同的 slot。"""
+    buffers = getattr(_read_buffers, "items", None)
+    if buffers is None:
+        buffers = _read_buffers.items = {}
+    buf = buffers.get(slot)
+    if buf is None or len(buf) < size:
+        buf = buffers[slot] = bytearray(size)
+    return buf
+
+def advise_sequential(stream):
+    """在支持 posix_fadvise 的平台上提示内核顺序预读整个文件，其余平台静默忽略。"""
+    fadvise = getattr(os, "posix_fadvise", None)
+    if fadvise is None:
+        return
+    try:
+        fadvise(stream.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    except (OSError, AttributeError, ValueError):
+        pass
+
+def iter_stream_chunks(stream, chunk_size=READ_BUFFER_SIZE, length=None, slot=0):
+    """用 readinto 把 stream 逐块读入线程复用的缓冲区，产出 memoryview，不为每块分配新的 bytes。
+
+    除最后一块外每块都被读满 chunk_size，两个流按相同块大小读取时可以逐块直接比较。
+    产出的 memoryview 只在下一次迭代前有效；length 给出时最多读取这么多字节。
+    """
+    chunk_size = max(1, int(chunk_size))
+    remaining = None if length is None else max(0, int(length))
+    with memoryview(_thread_read_buffer(chunk_size, slot)) as buf:
+        while remaining is None or remaining > 0:
+            want = chunk_size if remaining is None else min(chunk_size, remaining)
+            filled = 0
+            while filled < want:
+                n = stream.readinto(buf[filled:want])
+                if not n:
+                    break
+                filled += n
+            if filled == 0:
+                return
+            if remaining is not None:
+                remaining -= filled
+            yield buf[:filled]
+            if filled < want:
+                return
+
+def chunks_equal(left, right):
+    """比较 iter_stream_chunks 产出的两块内容。
+
+    memoryview 的 == 按元素格式逐项比较，比 bytes 比较慢几十倍；块占满复用缓冲区时直接比较底层 bytearray，
+    只有末尾不满的块才切成 bytes 再比较。
+    """
+    if len(left) != len(right):
+        return False
+    if len(left) == len(left.obj) and len(right) == len(right.obj):
+        return left.obj == right.obj
+    return left.tobytes() == right.tobytes()
+
+def hash_stream(stream, digest, chunk_size=READ_BUFFER_SIZE, length=None, stop_event=None):
+    """把 stream 当前位置起的内容（最多 length 字节）送入 digest；被 stop_event 取消时返回 False。
+
+    从文件开头整读且文件不小于 READ_MMAP_MIN_SIZE 时，若开启了 C_CLEANER_PLUS_HASH_MMAP 则改走 mmap。
+    """
+    if length is None and _hash_mmap_enabled():
+        try:
+            size = os.fstat(stream.fileno()).st_size
+            mappable = size >= READ_MMAP_MIN_SIZE and stream.tell() == 0
+        except (OSError, AttributeError, ValueError):
+            mappable = False
+        if mappable:
+            import mmap
+
+            with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                step = max(1, int(chunk_size))
+                for offset in range(0, len(view), step):
+                    if stop_event is not None and stop_event.is_set():
+                        return False
+                    with view[offset:offset + step] as chunk:
+                        digest.update(chunk)
+            stream.seek(0, os.SEEK_END)
+            return True
+    for chunk in iter_stream_chunks(stream, chunk_size, length=length):
+        if stop_event is not None and stop_event.is_set():
+            return False
+        digest.update(chunk)
+    return True
+
+def _stable_file_digest(path, expected_size=None, stop_event=None, chunk_size=1024 * 1024, hash_cache=None,
+                        reuse_cached=True):
     if not os.path.isfile(path):
         return False, "", (), "文件已不存在"
     if os.path.islink(path):
@@ -1323,23 +1423,25 @@ def _stable_file_digest(path, expected_size=None, stop_event=None, chunk_size=10
         before_signature = _file_stat_signature(before)
         if expected_size is not None and before.st_size != int(expected_size):
             return False, "", (), "文件大小在扫描后发生变化"
+        if hash_cache is not None and reuse_cached:
+            cached = hash_cache.get(before_signature, HASH_KIND_FULL)
+            if cached:
+                return True, cached, before_signature, ""
 
         digest = hashlib.sha256()
         with open(path, "rb") as stream:
             if _file_stat_signature(os.fstat(stream.fileno())) != before_signature:
                 return False, "", (), "文件在复核开始前发生变化"
-            while True:
-                if stop_event is not None and stop_event.is_set():
-                    return False, "", (), "已取消重复文件复核"
-                chunk = stream.read(max(64 * 1024, int(chunk_size or 0)))
-                if not chunk:
-                    break
-                digest.update(chunk)
+            advise_sequential(stream)
+            if not hash_stream(stream, digest, max(64 * 1024, int(chunk_size or 0)), stop_event=stop_event):
+                return False, "", (), "已取消重复文件复核"
             if _file_stat_signature(os.fstat(stream.fileno())) != before_signature:
                 return False, "", (), "文件在复核过程中发生变化"
 
         if _file_stat_signature(os.stat(path, follow_symlinks=False)) != before_signature:
             return False, "", (), "文件在复核完成后发生变化"
+        if hash_cache is not None:
+            hash_cache.put(before_signature, HASH_KIND_FULL, digest.hexdigest().lower())
         return True, digest.hexdigest().lower(), before_signature, ""
     except Exception as e:
         return False, "", (), f"重复文件复核失败：{format_exception_text(e)}"
@@ -1350,6 +1452,7 @@ def validate_duplicate_deletion_candidate(
     stop_event=None,
     chunk_size=1024 * 1024,
     reference_cache=None,
+    hash_cache=None,
 ):
     if not isinstance(expectation, dict):
         return False, "缺少重复文件复核信息"
@@ -1371,6 +1474,20 @@ def validate_duplicate_deletion_candidate(
     if os.path.islink(candidate) or os.path.islink(reference):
         return False, "候选文件或保留副本已变为链接"
 
+    try:
+        candidate_before = _file_stat_signature(os.stat(candidate, follow_symlinks=False))
+        reference_before = _file_stat_signature(os.stat(reference, follow_symlinks=False))
+        if candidate_before[3] and candidate_before[2:] == reference_before[2:]:
+            return False, "候选文件与保留副本是同一文件的硬链接，删除不会释放空间"
+        if hash_cache is not None:
+            # 缓存只用来提前否定；确认一致必须重新读取两份文件，因为随后会删除候选文件
+            for signature in (reference_before, candidate_before):
+                cached = hash_cache.get(signature, HASH_KIND_FULL)
+                if cached and cached != expected_digest:
+                    return False, "文件内容在扫描后不再相同"
+    except OSError as e:
+        return False, f"重复文件复核失败：{format_exception_text(e)}"
+
     cache = reference_cache if isinstance(reference_cache, dict) else {}
     cache_key = (_normalize_safety_path(reference), expected_size, expected_digest)
     reference_signature = cache.get(cache_key)
@@ -1381,6 +1498,8 @@ def validate_duplicate_deletion_candidate(
                 expected_size=expected_size,
                 stop_event=stop_event,
                 chunk_size=chunk_size,
+                hash_cache=hash_cache,
+                reuse_cached=False,
             )
             if not ok:
                 return False, reason
@@ -1401,6 +1520,8 @@ def validate_duplicate_deletion_candidate(
             expected_size=expected_size,
             stop_event=stop_event,
             chunk_size=chunk_size,
+            hash_cache=hash_cache,
+            reuse_cached=False,
         )
         if not ok:
             return False, reason
@@ -1421,8 +1542,115 @@ class DirectorySizeResult:
     errors: int = 0
     cancelled: bool = False
 
-def dir_size_detailed(path, stop_flag=None):
-    """迭代统计目录大小，并明确返回取消及读取失败状态。"""
+def _path_key_within(key, root_key):
+    return key == root_key or key.startswith(root_key.rstrip("\\/") + os.sep)
+
+DIR_SIZE_CACHE_MAX_ENTRIES = 4096
+DIR_SIZE_CACHE_TTL_SEC = 300
+
+def _dir_size_cache_ttl():
+    try:
+        return max(0.0, float(os.environ.get("C_CLEANER_PLUS_DIR_SIZE_CACHE_TTL", DIR_SIZE_CACHE_TTL_SEC)))
+    except ValueError:
+        return float(DIR_SIZE_CACHE_TTL_SEC)
+
+def _dir_size_signature(path):
+    st = os.stat(path, follow_symlinks=False)
+    return (int(st.st_mtime_ns), int(st.st_ino), int(st.st_dev))
+
+class DirectorySizeCache:
+    """进程内的目录大小缓存：按规范化路径存储完整的统计结果，LRU 淘汰并带 TTL。
+
+    命中时会重新读取目录自身的 mtime 签名做校验；深层子目录的变化不会改变顶层 mtime，
+    因此依赖 TTL 兜底，本程序自己删除的路径则通过 invalidate 立即失效。
+    命中结果可能滞后于深层变化，只供规则体积预估这类能容忍误差的调用方显式启用。
+    """
+
+    def __init__(self, max_entries=DIR_SIZE_CACHE_MAX_ENTRIES, ttl=None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _ttl(self):
+        return _dir_size_cache_ttl() if self.ttl is None else float(self.ttl)
+
+    def get(self, path):
+        ttl = self._ttl()
+        if ttl <= 0:
+            return None
+        key = os.path.normcase(os.path.abspath(path))
+        with self._lock:
+            cached = self._entries.get(key)
+        if cached is None:
+            return None
+        signature, stored_at, size, errors = cached
+        try:
+            fresh = time.time() - stored_at <= ttl and _dir_size_signature(path) == signature
+        except OSError:
+            fresh = False
+        with self._lock:
+            if not fresh:
+                if self._entries.get(key) is cached:
+                    self._entries.pop(key, None)
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return DirectorySizeResult(size=size, errors=errors, complete=not errors)
+
+    def put(self, path, result, signature=None):
+        """只缓存完整且未取消的结果；signature 应在统计前读取，避免把统计期间的变化当作新鲜。"""
+        if self._ttl() <= 0 or result is None or result.cancelled or not result.complete:
+            return
+        try:
+            signature = signature or _dir_size_signature(path)
+        except OSError:
+            return
+        key = os.path.normcase(os.path.abspath(path))
+        with self._lock:
+            self._entries[key] = (signature, time.time(), int(result.size), int(result.errors))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path):
+        """丢弃 path 自身、其子孙以及所有祖先目录的缓存。"""
+        key = os.path.normcase(os.path.abspath(path))
+        with self._lock:
+            stale = [
+                cached_key for cached_key in self._entries
+                if _path_key_within(cached_key, key) or _path_key_within(key, cached_key)
+            ]
+            for cached_key in stale:
+                self._entries.pop(cached_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_dir_size_cache = DirectorySizeCache()
+
+def invalidate_dir_size_cache(path):
+    try:
+        _dir_size_cache.invalidate(path)
+    except Exception as e:
+        log_sampled_background_error("更新目录大小缓存", e, limit=3)
+
+def dir_size_detailed(path, stop_flag=None, use_cache=False):
+    """迭代统计目录大小，并明确返回取消及读取失败状态。
+
+    默认每次重新遍历；use_cache=True 时优先复用进程内缓存的完整结果，缓存只校验顶层目录的 mtime，
+    深层子目录的变化要等 TTL 过期才会反映出来，只有预估类调用方才应开启。
+    """
+    signature = None
+    if use_cache:
+        cached = _dir_size_cache.get(path)
+        if cached is not None:
+            return cached
+        try:
+            signature = _dir_size_signature(path)
+        except OSError:
+            signature = None
     result = DirectorySizeResult()
     stack = [path]
     while stack:
@@ -1468,10 +1696,200 @@ def dir_size_detailed(path, stop_flag=None):
                 pass
         if result.cancelled:
             break
+    if signature is not None:
+        _dir_size_cache.put(path, result, signature=signature)
     return result
 
-def dir_size(path, stop_flag=None):
-    return dir_size_detailed(path, stop_flag=stop_flag).size
+def dir_size(path, stop_flag=None, use_cache=False):
+    return dir_size_detailed(path, stop_flag=stop_flag, use_cache=use_cache).size
+
+class DirectoryTreeSizes:
+    """对一个根目录做一次遍历，自底向上汇总每个子目录的总大小，之后任意子路径 O(1) 查询。
+
+    统计口径与 dir_size_detailed 一致：跳过符号链接和目录联接，读取失败计入 errors。
+    grafts 为 {规范化路径: 已汇总的 DirectoryTreeSizes}，遍历到这些目录时直接合并结果而不再下钻。
+    """
+
+    def __init__(self, root, stop_flag=None, grafts=None):
+        self.root = os.path.abspath(root)
+        self.root_key = os.path.normcase(self.root)
+        self.cancelled = False
+        self._sizes = {}
+        self._errors = {}
+        self.signatures = {}
+        self._walk(stop_flag, grafts or {})
+
+    def _walk(self, stop_flag, grafts):
+        keys = [self.root_key]
+        parents = [-1]
+        direct = [0]
+        errors = [0]
+        try:
+            self.signatures[self.root_key] = _dir_size_signature(self.root)
+        except OSError:
+            pass
+        stack = [(self.root, 0)]
+        while stack:
+            if stop_flag is not None and stop_flag.is_set():
+                self.cancelled = True
+                break
+            current, idx = stack.pop()
+            try:
+                entries = os.scandir(current)
+            except (OSError, ValueError, TypeError):
+                errors[idx] += 1
+                continue
+            try:
+                for entry in entries:
+                    try:
+                        entry_stat = entry.stat(follow_symlinks=False)
+                        file_attributes = int(getattr(entry_stat, "st_file_attributes", 0))
+                        if entry.is_symlink() or (file_attributes & 0x400 and file_attributes & 0x10):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            key = os.path.normcase(entry.path)
+                            if idx == 0:
+                                # 根目录直属子目录最常被单独查询，记录遍历前的签名供缓存校验
+                                self.signatures[key] = (
+                                    int(entry_stat.st_mtime_ns), int(entry_stat.st_ino), int(entry_stat.st_dev)
+                                )
+                            keys.append(key)
+                            parents.append(idx)
+                            direct.append(0)
+                            errors.append(0)
+                            grafted = grafts.get(key)
+                            if grafted is not None and not grafted.cancelled:
+                                self._merge(grafted)
+                                direct[-1] = grafted._sizes[grafted.root_key]
+                                errors[-1] = grafted._errors.get(grafted.root_key, 0)
+                                keys[-1] = None
+                            else:
+                                stack.append((entry.path, len(keys) - 1))
+                        elif entry.is_file(follow_symlinks=False):
+                            direct[idx] += int(entry_stat.st_size)
+                    except (OSError, ValueError):
+                        errors[idx] += 1
+            except (OSError, ValueError):
+                errors[idx] += 1
+            finally:
+                try:
+                    entries.close()
+                except Exception:
+                    pass
+        # 先序编号保证子目录的下标总是大于父目录，倒序累加即为自底向上汇总
+        for idx in range(len(keys) - 1, 0, -1):
+            parent = parents[idx]
+            direct[parent] += direct[idx]
+            errors[parent] += errors[idx]
+        for idx, key in enumerate(keys):
+            if key is None:
+                continue
+            self._sizes[key] = direct[idx]
+            if errors[idx]:
+                self._errors[key] = errors[idx]
+
+    def _merge(self, other):
+        self._sizes.update(other._sizes)
+        self._errors.update(other._errors)
+        self.signatures.update(other.signatures)
+
+    def covers(self, path):
+        return _path_key_within(os.path.normcase(os.path.abspath(path)), self.root_key)
+
+    def size_detailed(self, path):
+        """返回 path 子树的 DirectorySizeResult；不在本树中的路径返回 None。"""
+        key = os.path.normcase(os.path.abspath(path))
+        size = self._sizes.get(key)
+        if size is None:
+            return None
+        errors = self._errors.get(key, 0)
+        return DirectorySizeResult(
+            size=size,
+            complete=not errors and not self.cancelled,
+            errors=errors,
+            cancelled=self.cancelled,
+        )
+
+    def size(self, path):
+        result = self.size_detailed(path)
+        return None if result is None else result.size
+
+class TreeSizeAggregator:
+    """一次分析中共享的目录大小引擎：每个根目录只遍历一次，重叠或嵌套的根目录复用已有结果。
+
+    查询顺序：已汇总的目录树 → 本次分析预先得到的大小 → 新鲜的文件系统索引 → 以路径本身为根新建目录树。
+    调用方只对需要的子目录逐个查询，不会为了其中几个子目录遍历整个父目录；之后再查询父目录时，已有的子树会被嫁接复用。
+    进程内目录大小缓存只校验顶层目录的 mtime，深层变化会得到过期结果，因此默认不读写，use_cache=True 时才启用。
+    """
+
+    def __init__(self, stop_flag=None, fs_index=None, use_cache=False):
+        self.stop_flag = stop_flag
+        self.fs_index = fs_index
+        self.use_cache = use_cache
+        self._trees = []
+        self._known = {}
+
+    def remember(self, results):
+        """记录本次分析中另行得到的 {目录: DirectorySizeResult}（例如 MFT 预取），只在本对象内复用。"""
+        for path, result in (results or {}).items():
+            self._known[os.path.normcase(os.path.abspath(path))] = result
+
+    def tree_for(self, path):
+        for tree in self._trees:
+            if tree.covers(path):
+                return tree
+        return None
+
+    def aggregate(self, root):
+        """返回覆盖 root 的目录树；已被更大的树覆盖时直接复用，嵌套的旧树被嫁接进新树。"""
+        tree = self.tree_for(root)
+        if tree is not None:
+            return tree
+        root_key = os.path.normcase(os.path.abspath(root))
+        nested = [tree for tree in self._trees if _path_key_within(tree.root_key, root_key)]
+        tree = DirectoryTreeSizes(
+            root,
+            stop_flag=self.stop_flag,
+            grafts={t.root_key: t for t in nested},
+        )
+        if not tree.cancelled:
+            self._trees = [t for t in self._trees if t not in nested]
+        self._trees.append(tree)
+        return tree
+
+    def _indexed_size(self, path):
+        if self.fs_index is None:
+            return None
+        try:
+            return self.fs_index.subtree_size(path)
+        except Exception as e:
+            log_sampled_background_error("读取文件系统索引", e, limit=3)
+            return None
+
+    def size_detailed(self, path):
+        tree = self.tree_for(path)
+        if tree is None:
+            known = self._known.get(os.path.normcase(os.path.abspath(path)))
+            if known is not None:
+                return known
+            cached = _dir_size_cache.get(path) if self.use_cache else None
+            if cached is not None:
+                return cached
+            indexed = self._indexed_size(path)
+            if indexed is not None:
+                return DirectorySizeResult(size=int(indexed))
+            tree = self.aggregate(path)
+        result = tree.size_detailed(path)
+        if result is None:
+            return DirectorySizeResult(complete=False, errors=1, cancelled=tree.cancelled)
+        signature = tree.signatures.get(os.path.normcase(os.path.abspath(path))) if self.use_cache else None
+        if signature is not None:
+            _dir_size_cache.put(path, result, signature=signature)
+        return result
+
+    def size(self, path):
+        return self.size_detailed(path).size
+
 
 def estimate_rule_size(entry, stop_flag=None):
     import fnmatch
@@ -1488,7 +1906,7 @@ def estimate_rule_size(entry, stop_flag=None):
     try:
         if tp == "dir":
             target = expand_env(pa)
-            return dir_size(target, stop_flag=stop_flag) if os.path.isdir(target) else 0
+            return dir_size(target, stop_flag=stop_flag, use_cache=True) if os.path.isdir(target) else 0
         if tp == "glob":
             target = expand_env(pa)
             if not os.path.isdir(target):
@@ -1641,6 +2059,13 @@ def is_protected_system_path(path):
         return True
 
 def delete_path(path, perm, log_fn):
+    deleted = _delete_path_from_disk(path, perm, log_fn)
+    if deleted:
+        forget_indexed_path(path)
+        invalidate_dir_size_cache(path)
+    return deleted
+
+def _delete_path_from_disk(path, perm, log_fn):
     import shutil
     import stat
     import sys
@@ -2486,95 +2911,50 @@ def _save_scan_cache(drives):
     except Exception as e:
         log_background_error("写入扫描缓存", e)
 
-def detect_disk_type(drive_letter="C"):
-    drive_letter = _normalize_drive_letter(drive_letter)
-    try:
-        ps_script = f"""
-$partition = Get-Partition -DriveLetter {drive_letter} -ErrorAction SilentlyContinue
-if (-not $partition) {{
-    "Unknown"
-    exit
-}}
-
-$disk = Get-Disk -Number $partition.DiskNumber -ErrorAction SilentlyContinue
-if ($disk) {{
-    if ($disk.MediaType) {{
-        $disk.MediaType
-        exit
-    }}
-    if ($disk.BusType -and $disk.BusType.ToString() -match 'NVMe') {{
-        "SSD"
-        exit
-    }}
-    if ($disk.FriendlyName -and $disk.FriendlyName -match 'SSD|NVMe|Solid') {{
-        "SSD"
-        exit
-    }}
-    if ($disk.Model -and $disk.Model -match 'SSD|NVMe|Solid') {{
-        "SSD"
-        exit
-    }}
-}}
-
-$cim = Get-CimInstance Win32_DiskDrive -ErrorAction SilentlyContinue | Where-Object {{ $_.Index -eq $partition.DiskNumber }}
-if ($cim) {{
-    if ($cim.Model -and $cim.Model -match 'SSD|NVMe|Solid') {{
-        "SSD"
-        exit
-    }}
-    if ($cim.MediaType -and $cim.MediaType -match 'Fixed hard disk') {{
-        "HDD"
-        exit
-    }}
-}}
-
-if ($disk -and $disk.BusType) {{
-    if ($disk.BusType.ToString() -match 'SATA|SAS|RAID') {{
-        "HDD"
-        exit
-    }}
-}}
-
-$physical = Get-PhysicalDisk -ErrorAction SilentlyContinue | Where-Object {{ $_.FriendlyName -eq $disk.FriendlyName -or $_.FriendlyName -eq $cim.Model }}
-if ($physical -and $physical.MediaType) {{
-    $physical.MediaType
-    exit
-}}
-
-"Unknown"
-"""
-        r = subprocess.run(["powershell", "-NoProfile", "-ExecutionPolicy", "Bypass", "-Command", ps_script],
-            capture_output=True, text=True, timeout=10, creationflags=subprocess.CREATE_NO_WINDOW)
-        media = r.stdout.strip()
-        if "SSD" in media or "Solid" in media: return "SSD"
-        elif "HDD" in media or "Unspecified" in media: return "HDD"
-        else: return "Unknown"
-    except Exception: return "Unknown"
+DEFAULT_SCAN_THREADS = 4
+TUNED_SCAN_THREADS_TTL_SEC = 30 * 86400
 
 def get_scan_threads(drive_letter="C"):
-    dtype = detect_disk_type(drive_letter)
-    return {"SSD": 12, "HDD": 2, "Unknown": 4}.get(dtype, 4), dtype
+    """返回该卷上次扫描时调优得到的线程数；尚未调优的卷使用默认值，由扫描过程中的调优器修正。"""
+    drive_letter = _normalize_drive_letter(drive_letter)
+    cache = _load_scan_cache().get(drive_letter, {})
+    if cache.get("dtype") == "Tuned" and time.time() - cache.get("ts", 0) < TUNED_SCAN_THREADS_TTL_SEC:
+        try:
+            return max(1, int(cache.get("threads", DEFAULT_SCAN_THREADS))), "Tuned"
+        except (TypeError, ValueError):
+            pass
+    return DEFAULT_SCAN_THREADS, "Auto"
 
 def get_scan_threads_cached(drive_letter="C"):
-    drive_letter = _normalize_drive_letter(drive_letter)
     with _scan_threads_lock:
         try:
-            drives = _load_scan_cache()
-            cache = drives.get(drive_letter, {})
-            dtype = cache.get("dtype", "Unknown")
-            ttl = 300 if dtype == "Unknown" else 86400
-            if time.time() - cache.get("ts", 0) < ttl:
-                return cache.get("threads", 4), cache.get("dtype", "Unknown")
+            return get_scan_threads(drive_letter)
         except Exception as e:
             log_background_error("读取线程缓存", e)
-        threads, dtype = get_scan_threads(drive_letter)
+            return DEFAULT_SCAN_THREADS, "Auto"
+
+def _scan_volume_letter(roots):
+    letters = {os.path.splitdrive(os.path.abspath(str(root)))[0][:1].upper() for root in roots or []}
+    if len(letters) != 1:
+        return ""
+    letter = letters.pop()
+    return letter if letter.isalpha() else ""
+
+def record_tuned_scan_threads(roots, tuned):
+    """把调优结果写入 CACHE_FILE；只记录单一盘符的扫描，多卷混扫的吞吐无法归属到某个卷。"""
+    if not tuned:
+        return
+    letter = _scan_volume_letter(roots)
+    if not letter:
+        return
+    threads, rate = tuned
+    with _scan_threads_lock:
         try:
             drives = _load_scan_cache()
-            drives[drive_letter] = {"threads": threads, "dtype": dtype, "ts": time.time()}
+            drives[letter] = {"threads": int(threads), "dtype": "Tuned", "rate": round(float(rate), 1), "ts": time.time()}
             _save_scan_cache(drives)
         except Exception as e:
             log_background_error("更新线程缓存", e)
-        return threads, dtype
 
 def get_scan_threads_for_drives_cached(drives):
     letters = []
@@ -2594,14 +2974,12 @@ def get_scan_threads_for_drives_cached(drives):
 
     dtypes = [dtype for _, dtype in stats]
     total_threads = sum(threads for threads, _ in stats)
-    threads = min(24, max(max(threads for threads, _ in stats), total_threads))
+    threads = min(AUTOTUNE_MAX_WORKERS, max(max(threads for threads, _ in stats), total_threads))
 
     if len(set(dtypes)) == 1:
         dtype = dtypes[0]
-    elif "SSD" in dtypes and "HDD" in dtypes:
-        dtype = "Mixed"
     else:
-        dtype = "/".join(sorted(set(dtypes)))
+        dtype = "Mixed"
 
     return threads, dtype
 
@@ -2680,377 +3058,3436 @@ UI_BATCH_INTERVAL_MS = 30
 UI_BATCH_CHUNK = 120
 LEFTOVER_PROMPT_TIMEOUT_SEC = 600
 
-def should_exclude(p, prefixes):
-    n = os.path.normcase(os.path.abspath(p))
-    for e in prefixes:
-        if not e:
-            continue
-        candidate = os.path.normcase(os.path.abspath(e))
-        try:
-            if os.path.commonpath([n, candidate]) == candidate:
-                return True
-        except ValueError:
-            continue
-    return False
-
-# ══════════════════════════════════════════════════════════
-#  多线程文件扫描
-# ══════════════════════════════════════════════════════════
-_SENTINEL = None
+_GLOB_MAGIC_CHARS = frozenset("*?[")
 
-def _push_bigfile_result(results, item, result_limit):
-    if result_limit and result_limit > 0:
-        if len(results) < result_limit:
-            heapq.heappush(results, item)
-        elif item[0] > results[0][0]:
-            heapq.heapreplace(results, item)
-    else:
-        results.append(item)
+def _is_glob_exclusion(rule):
+    return any(ch in _GLOB_MAGIC_CHARS for ch in rule)
 
-def should_skip_bigfile(path, skip_optional=False):
-    name = os.path.basename(path).lower()
-    ext = os.path.splitext(name)[1]
-    if ext in BIGFILE_SKIP_EXT:
+def _is_name_or_glob_exclusion(rule):
+    text = os.path.expandvars(str(rule or "")).strip()
+    if _is_glob_exclusion(text):
         return True
-    if not skip_optional:
+    return bool(text) and not os.path.isabs(text) and len(_path_parts(os.path.normcase(text))) <= 1
+
+def _path_parts(normalized):
+    return [part for part in normalized.replace("/", os.sep).split(os.sep) if part]
+
+class ScanExclusionMatcher:
+    """扫描排除规则的编译结果，每轮扫描只构建一次。
+
+    普通路径规则被拆成规范化的路径分量并放入前缀树，查询耗时只与路径深度有关，
+    与规则数量无关；不含分隔符的相对名称（例如 node_modules）按目录名精确匹配；
+    含 * ? [ 的规则视为通配符：含路径分隔符的匹配完整路径，否则匹配单个名称（例如 *.git），
+    同类通配符合并成一个正则。
+    """
+
+    _END = ""
+
+    def __init__(self, rules=()):
+        import fnmatch
+
+        self.rules = []
+        self._trie = {}
+        self._names = set()
+        path_globs = []
+        name_globs = []
+        for rule in rules or []:
+            text = os.path.expandvars(str(rule or "")).strip()
+            if not text or text in self.rules:
+                continue
+            self.rules.append(text)
+            if _is_glob_exclusion(text):
+                pattern = os.path.normcase(text.replace("/", os.sep))
+                if os.sep in pattern.strip(os.sep):
+                    path_globs.append(fnmatch.translate(pattern))
+                else:
+                    name_globs.append(fnmatch.translate(pattern.strip(os.sep)))
+                continue
+            if not os.path.isabs(text) and not _path_parts(os.path.normcase(text))[1:]:
+                self._names.add(os.path.normcase(text).strip(os.sep))
+                continue
+            node = self._trie
+            for part in _path_parts(os.path.normcase(os.path.abspath(text))):
+                node = node.setdefault(part, {})
+            node[self._END] = True
+        self._path_regex = re.compile("|".join(f"(?:{item})" for item in path_globs)) if path_globs else None
+        self._name_regex = re.compile("|".join(f"(?:{item})" for item in name_globs)) if name_globs else None
+
+    @property
+    def prefix_rules(self):
+        return [rule for rule in self.rules if not _is_name_or_glob_exclusion(rule)]
+
+    @property
+    def has_globs(self):
+        return bool(self._names) or self._path_regex is not None or self._name_regex is not None
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def _normalized(self, path):
+        text = str(path or "")
+        if not os.path.isabs(text):
+            text = os.path.abspath(text)
+        return os.path.normcase(text)
+
+    def matches(self, path):
+        """path 自身命中规则，或位于某个排除目录之下时返回 True。"""
+        normalized = self._normalized(path)
+        parts = _path_parts(normalized)
+        node = self._trie
+        for part in parts:
+            node = node.get(part)
+            if node is None:
+                break
+            if self._END in node:
+                return True
+        if parts and parts[-1] in self._names:
+            return True
+        if self._name_regex is not None and parts and self._name_regex.match(parts[-1]):
+            return True
+        if self._path_regex is not None and self._path_regex.match(normalized):
+            return True
         return False
-    if name in BIGFILE_OPTIONAL_SKIP_NAMES:
-        return True
-    if ext in BIGFILE_OPTIONAL_SKIP_EXT:
-        return True
-    return False
 
-def _is_drive_root_path(path):
-    try:
-        norm = os.path.normpath(os.path.abspath(path))
-        drive, tail = os.path.splitdrive(norm)
-        return bool(drive) and tail in ("\\", "/")
-    except Exception:
+    def may_exclude_within(self, path):
+        """path 自身或其子树中可能有条目被排除时返回 True，用于判断遍历得到的子树大小是否完整。
+
+        名称与通配规则可能命中任意层级，只要存在就视为可能排除；路径规则只在位于 path 之内或是其祖先时命中。
+        """
+        if self.has_globs:
+            return True
+        node = self._trie
+        for part in _path_parts(self._normalized(path)):
+            node = node.get(part)
+            if node is None:
+                return False
+            if self._END in node:
+                return True
+        return bool(node)
+
+    def matches_path_or_ancestor(self, path):
+        """除自身外还检查每一级父目录是否命中通配规则，用于过滤索引等非遍历来源的结果。"""
+        if self.matches(path):
+            return True
+        if not self.has_globs:
+            return False
+        normalized = self._normalized(path)
+        parts = _path_parts(normalized)
+        if self._names and not self._names.isdisjoint(parts[:-1]):
+            return True
+        if self._name_regex is not None and any(self._name_regex.match(part) for part in parts[:-1]):
+            return True
+        if self._path_regex is not None:
+            parent = os.path.dirname(normalized)
+            while parent and parent != os.path.dirname(parent):
+                if self._path_regex.match(parent):
+                    return True
+                parent = os.path.dirname(parent)
         return False
 
-def _fast_mft_bigfile_exe_path():
-    exe_name = "fast_large_files.exe"
-    candidates = []
+def compile_scan_exclusions(excl):
+    if isinstance(excl, ScanExclusionMatcher):
+        return excl
+    return ScanExclusionMatcher(excl or ())
 
-    bundle_dir = getattr(sys, "_MEIPASS", None)
-    if bundle_dir:
-        candidates.append(os.path.join(bundle_dir, exe_name))
+_exclusion_matcher_cache = {}
+_exclusion_matcher_cache_lock = threading.Lock()
 
-    if getattr(sys, "frozen", False):
-        candidates.append(os.path.join(os.path.dirname(sys.executable), exe_name))
+def should_exclude(p, prefixes):
+    """p 命中排除规则时返回 True；不含分隔符的相对名称按任意层级的目录名匹配，不再相对当前目录解析。"""
+    if isinstance(prefixes, ScanExclusionMatcher):
+        return prefixes.matches(p)
+    key = tuple(prefixes or ())
+    with _exclusion_matcher_cache_lock:
+        matcher = _exclusion_matcher_cache.get(key)
+        if matcher is None:
+            if len(_exclusion_matcher_cache) >= 32:
+                _exclusion_matcher_cache.clear()
+            matcher = _exclusion_matcher_cache[key] = ScanExclusionMatcher(key)
+    return matcher.matches(p)
+
+def normalize_scan_exclude_patterns(value):
+    items = re.split(r"[;\n]", value) if isinstance(value, str) else list(value or [])
+    patterns = []
+    for item in items:
+        text = str(item or "").strip().strip('"').strip()
+        if text and text not in patterns:
+            patterns.append(text)
+    return patterns
+
+def build_scan_excludes(settings=None):
+    """默认排除目录加上用户在设置中填写的排除规则（路径或通配符）。"""
+    user_patterns = []
+    if isinstance(settings, dict):
+        user_patterns = normalize_scan_exclude_patterns(settings.get("scan_exclude_patterns", []))
+    return list(DEFAULT_EXCLUDES) + [item for item in user_patterns if item not in DEFAULT_EXCLUDES]
 
-    base = os.path.dirname(os.path.abspath(__file__))
-    candidates.extend([
-        os.path.join(base, exe_name),
-        os.path.join(base, "tools", "fast_large_files", "target", "release", exe_name),
-        os.path.join(base, "tools", "fast_large_files", "target", "debug", exe_name),
-    ])
+# ══════════════════════════════════════════════════════════
+#  持久化文件系统索引
+# ══════════════════════════════════════════════════════════
+FS_INDEX_FILE = "cdisk_cleaner_fs_index.sqlite3"
+FS_INDEX_SCHEMA_VERSION = 4
+FS_INDEX_MAX_AGE_SEC = 30 * 60
+FS_INDEX_FLUSH_ROWS = 4000
+FS_INDEX_FETCH_ROWS = 2000
 
-    for candidate in candidates:
-        if os.path.isfile(candidate):
-            return candidate
-    return None
+_fs_index_lock = threading.Lock()
+_fs_index_instance = None
 
-def _scan_big_files_fast_mft(roots, min_b, excl, stop, result_limit=None, progress_cb=None, skip_optional=False):
-    if os.name != "nt" or os.environ.get("C_CLEANER_PLUS_DISABLE_FAST_MFT"):
-        return None
+def filesystem_index_path(config_dir=None):
+    base_dir = os.path.abspath(os.path.expandvars(config_dir or get_runtime_config_dir()))
+    return os.path.join(base_dir, FS_INDEX_FILE)
 
-    roots = list(roots or [])
-    if not roots or not all(_is_drive_root_path(root) for root in roots):
-        return None
+def _sqlite_file_id(value):
+    """把 st_dev / st_ino 存为十进制文本：NTFS 带序列号的文件 ID 与 ReFS 的 128 位 ID 超出 SQLite INTEGER 的范围。"""
+    return str(int(value or 0))
 
-    exe = _fast_mft_bigfile_exe_path()
-    if not exe:
-        return None
+def _fs_index_key(path):
+    return os.path.normcase(os.path.abspath(str(path or "")))
 
-    cmd = [
-        exe,
-        "--min-bytes", str(int(min_b)),
-        "--limit", str(int(result_limit or 0)),
-        "--skip-optional", "1" if skip_optional else "0",
-    ]
-    for root in roots:
-        cmd.extend(["--root", os.path.abspath(root)])
-    for item in excl or []:
-        if item:
-            cmd.extend(["--exclude", os.path.abspath(os.path.expandvars(item))])
+def _fs_index_prefix_range(key):
+    """返回 key 所有子孙路径在字典序下的半开区间 [low, high)。"""
+    base = key if key.endswith(os.sep) else key + os.sep
+    return base, base[:-1] + chr(ord(os.sep) + 1)
 
-    if progress_cb:
-        progress_cb(0)
+def _fs_index_exclude_key(item):
+    text = os.path.expandvars(item)
+    if _is_name_or_glob_exclusion(text):
+        return os.path.normcase(text.strip())
+    return _fs_index_key(text)
 
-    startupinfo = None
-    creationflags = 0
-    try:
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-    except Exception:
-        startupinfo = None
-    creationflags = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+def _fs_index_excludes_text(excludes):
+    keys = sorted({_fs_index_exclude_key(item) for item in excludes or [] if item})
+    return json.dumps(keys, ensure_ascii=False)
 
-    try:
-        proc = subprocess.Popen(
+class _IndexedStat:
+    __slots__ = ("st_size", "st_mtime_ns", "st_dev", "st_ino")
+
+    def __init__(self, size, mtime_ns, dev, ino):
+        self.st_size = size
+        self.st_mtime_ns = mtime_ns
+        self.st_dev = dev
+        self.st_ino = ino
+
+class _IndexedDirEntry:
+    """与 os.DirEntry 接口兼容的缓存条目，用于增量扫描复用上次的目录清单。
+
+    stat() 直接返回索引中记录的值，不再逐个读取文件。目录 mtime 不变只说明子项名单没变，
+    文件被原地改写不会更新父目录，所以这里的大小可能过期：增量扫描只供按名称与类型工作的
+    定时任务（空文件夹、快捷方式）使用，需要准确大小的索引读取会在返回前重新 stat。
+    """
+    __slots__ = ("name", "path", "_is_dir", "_stat", "child_count")
+
+    def __init__(self, path, is_dir, stat_result, child_count=-1):
+        # 路径由 scandir 以 os.sep 拼接而成，rpartition 比 basename 便宜得多
+        self.name = path.rpartition(os.sep)[2]
+        self.path = path
+        self._is_dir = bool(is_dir)
+        self._stat = stat_result
+        self.child_count = child_count
+
+    def is_symlink(self):
+        return False
+
+    def is_dir(self, follow_symlinks=True):
+        return self._is_dir
+
+    def is_file(self, follow_symlinks=True):
+        return not self._is_dir
+
+    def stat(self, follow_symlinks=True):
+        st = self._stat
+        if type(st) is tuple:
+            # 索引行 (size, mtime_ns, dev, ino) 在首次调用时才转换，多数条目不会用到
+            st = self._stat = _IndexedStat(st[0], st[1], int(st[2]), int(st[3]))
+        return st
+
+class _CachedListing(list):
+    def close(self):
+        pass
+
+class _FileSystemIndexWriter:
+    """扫描线程共享的批量写入器，缓冲条目后按批提交到索引。
+
+    增量模式只对 incremental_roots 中的根生效：复用清单的目录及其文件行保持原样，不再重写；
+    重新列出的目录记在 _relisted 中，扫描完整结束后只在这些目录下删除已不存在的子项。
+    其余的根照常整棵重写，结束时按 scan_id 清理旧行。
+    """
+
+    def __init__(self, index, root_keys, scan_id, incremental=False, incremental_roots=None):
+        self.index = index
+        self.root_keys = sorted(root_keys, key=len, reverse=True)
+        self.scan_id = scan_id
+        self.incremental = bool(incremental)
+        self.incremental_roots = set(incremental_roots if incremental_roots is not None else root_keys) if incremental else set()
+        self.count = 0
+        self.reused_dirs = 0
+        self.failed = False
+        self._rows = []
+        self._lock = threading.Lock()
+        # 复用清单中子目录上次记录的 (mtime_ns, dev, ino, child_count)，访问该子目录时省去一次查询
+        self._known_dirs = {}
+        # 重新列出的目录 -> 本轮在其下访问到的子目录
+        self._relisted = {}
+
+    def _roots_for(self, key):
+        """返回包含 key 的全部根（由长到短）；同一轮扫描的根互相嵌套时，条目写入每个根各自的记录。"""
+        return [
+            root_key for root_key in self.root_keys
+            if key == root_key or key.startswith(_fs_index_prefix_range(root_key)[0])
+        ]
+
+    def add(self, path, is_dir, st, child_count=-1):
+        # 来自复用清单的条目与索引中的行完全相同，无需重写
+        if self.failed or isinstance(st, _IndexedStat):
+            return
+        key = _fs_index_key(path)
+        root_keys = self._roots_for(key)
+        if not root_keys:
+            return
+        rows = [
+            (
+                key,
+                path,
+                os.path.dirname(key),
+                0 if is_dir else int(st.st_size),
+                int(getattr(st, "st_mtime_ns", 0) or 0),
+                _sqlite_file_id(getattr(st, "st_dev", 0)),
+                _sqlite_file_id(getattr(st, "st_ino", 0)),
+                1 if is_dir else 0,
+                int(child_count),
+                root_key,
+                self.scan_id,
+            )
+            for root_key in root_keys
+        ]
+        batch = None
+        with self._lock:
+            self._rows.extend(rows)
+            self.count += 1
+            if len(self._rows) >= FS_INDEX_FLUSH_ROWS:
+                batch, self._rows = self._rows, []
+        if batch:
+            self._write(batch)
+
+    def _write(self, rows):
+        try:
+            self.index._insert_rows(rows)
+        except Exception as e:
+            self.failed = True
+            log_sampled_background_error("写入文件系统索引", e, limit=3)
+
+    def open_listing(self, dirpath):
+        """打开目录清单：增量模式下目录 mtime 与子项数量均未变化时复用索引中的上次清单。
+
+        返回 (entries, dir_stat)；entries 与 os.scandir 的结果一样需要 close()。
+        复用时 dir_stat 为 None：目录行没有变化，finish_listing 不会重写它。
+        """
+        key = _fs_index_key(dirpath)
+        root_keys = self._roots_for(key)
+        incremental = self.incremental and bool(root_keys) and self.incremental_roots.issuperset(root_keys)
+        known = None
+        if incremental:
+            with self._lock:
+                known = self._known_dirs.pop(key, None)
+                present = self._relisted.get(os.path.dirname(key))
+                if present is not None:
+                    present.add(key)
+        try:
+            dir_stat = os.stat(dirpath, follow_symlinks=False)
+        except (OSError, ValueError):
+            dir_stat = None
+        if incremental and dir_stat is not None and not self.failed:
+            cached = None
+            try:
+                for i, root_key in enumerate(root_keys):
+                    cached = self.index.cached_listing(dirpath, dir_stat, root_key, row=known if i == 0 else None)
+                    if cached is None:
+                        break
+            except Exception as e:
+                cached = None
+                log_sampled_background_error("读取文件系统索引", e, limit=3)
+            if cached is not None:
+                with self._lock:
+                    self.reused_dirs += 1
+                    self.count += 1 + sum(1 for entry in cached if not entry.is_dir())
+                    if len(root_keys) == 1:
+                        for entry in cached:
+                            if entry.is_dir():
+                                st = entry.stat()
+                                self._known_dirs[_fs_index_key(entry.path)] = (
+                                    st.st_mtime_ns, _sqlite_file_id(st.st_dev), _sqlite_file_id(st.st_ino), entry.child_count,
+                                )
+                return _CachedListing(cached), None
+            with self._lock:
+                self._relisted[key] = set()
+        return os.scandir(dirpath), dir_stat
+
+    def finish_listing(self, dirpath, dir_stat, child_count):
+        """目录清单完整读取后记录其 mtime 与子项数量，供下次增量扫描校验。"""
+        if dir_stat is not None:
+            self.add(dirpath, True, dir_stat, child_count=child_count)
+
+    def close(self, complete=True):
+        with self._lock:
+            batch, self._rows = self._rows, []
+            relisted, self._relisted = self._relisted, {}
+            self._known_dirs.clear()
+        if batch:
+            self._write(batch)
+        complete = bool(complete) and not self.failed
+        if complete and relisted:
+            try:
+                self.index._forget_missing_children(relisted, self.root_keys, self.scan_id)
+            except Exception as e:
+                complete = False
+                log_sampled_background_error("写入文件系统索引", e, limit=3)
+        self.index._finish_roots(
+            self.root_keys, complete, self.count, self.scan_id,
+            prune_keys=[key for key in self.root_keys if key not in self.incremental_roots],
+        )
+
+class FileSystemIndex:
+    """保存在配置目录的 SQLite 索引，供大文件、重复文件、空文件夹等功能复用同一次遍历。
+
+    条目以 (root, key) 为主键：每个扫描根各自持有其子树的完整记录，先后扫描互相嵌套的根
+    （如 C:\\ 与 C:\\Users）不会把对方的条目改挂到自己名下。
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._lock = threading.RLock()
+        self._conn = None
+
+    def _open_connection(self):
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        return conn
+
+    def _connection(self):
+        if self._conn is None:
+            conn = self._open_connection()
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != FS_INDEX_SCHEMA_VERSION:
+                conn.executescript(
+                    """
+                    DROP TABLE IF EXISTS entries;
+                    DROP TABLE IF EXISTS roots;
+                    """
+                )
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    parent TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    dev TEXT NOT NULL,
+                    ino TEXT NOT NULL,
+                    is_dir INTEGER NOT NULL,
+                    child_count INTEGER NOT NULL,
+                    root TEXT NOT NULL,
+                    scan_id INTEGER NOT NULL,
+                    PRIMARY KEY (root, key)
+                );
+                CREATE INDEX IF NOT EXISTS entries_key ON entries(key);
+                CREATE INDEX IF NOT EXISTS entries_parent ON entries(root, parent);
+                CREATE INDEX IF NOT EXISTS entries_root_size ON entries(root, is_dir, size);
+                CREATE TABLE IF NOT EXISTS roots (
+                    root TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    excludes TEXT NOT NULL,
+                    scanned_at REAL NOT NULL,
+                    complete INTEGER NOT NULL,
+                    entries INTEGER NOT NULL
+                );
+                """
+            )
+            conn.execute(f"PRAGMA user_version={FS_INDEX_SCHEMA_VERSION}")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                finally:
+                    self._conn = None
+
+    def begin_scan(self, roots, excludes, incremental=False):
+        """开始一轮扫描并返回写入器；扫描结束后必须调用 writer.close()。
+
+        旧条目保留到本轮完整结束才清理，因此增量模式可以在扫描过程中读取上次的目录清单。
+        若上次记录时排除的目录不是本次排除集合的子集，则缓存清单缺少内容，旧条目直接删除；
+        只有上次完整结束且排除规则相同的根才按增量方式复用并保留未变化的行，其余的根整棵重写。
+        """
+        root_keys = []
+        for root in roots or []:
+            key = _fs_index_key(root)
+            if key and key not in root_keys:
+                root_keys.append(key)
+        excludes_text = _fs_index_excludes_text(excludes)
+        wanted = set(json.loads(excludes_text))
+        incremental_roots = set()
+        with self._lock:
+            conn = self._connection()
+            scan_id = int(conn.execute("SELECT COALESCE(MAX(scan_id), 0) + 1 FROM entries").fetchone()[0])
+            with conn:
+                for key in root_keys:
+                    previous = conn.execute("SELECT excludes, complete FROM roots WHERE root = ?", (key,)).fetchone()
+                    if previous is not None and not set(json.loads(previous[0] or "[]")).issubset(wanted):
+                        conn.execute("DELETE FROM entries WHERE root = ?", (key,))
+                    elif previous is not None and previous[1] and previous[0] == excludes_text:
+                        incremental_roots.add(key)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO roots(root, path, excludes, scanned_at, complete, entries) VALUES (?, ?, ?, ?, 0, 0)",
+                        (key, key, excludes_text, time.time()),
+                    )
+        return _FileSystemIndexWriter(self, root_keys, scan_id, incremental=incremental, incremental_roots=incremental_roots)
+
+    def _insert_rows(self, rows):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries(key, path, parent, size, mtime_ns, dev, ino, is_dir, child_count, root, scan_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+    def _forget_missing_children(self, relisted, root_keys, scan_id):
+        """删除重新列出的目录下本轮没有再出现的子项及其子树。
+
+        本轮写入的文件行带有新的 scan_id；子目录的行可能因清单被复用而保持旧值，以本轮实际访问到的子目录为准。
+        """
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                for parent, present in relisted.items():
+                    for root_key in root_keys:
+                        if parent != root_key and not parent.startswith(_fs_index_prefix_range(root_key)[0]):
+                            continue
+                        stale = conn.execute(
+                            "SELECT key, is_dir FROM entries WHERE root = ? AND parent = ? AND key != ? AND scan_id != ?",
+                            (root_key, parent, parent, scan_id),
+                        ).fetchall()
+                        for key, is_dir in stale:
+                            if is_dir and key in present:
+                                continue
+                            conn.execute("DELETE FROM entries WHERE root = ? AND key = ?", (root_key, key))
+                            if is_dir:
+                                low, high = _fs_index_prefix_range(key)
+                                conn.execute("DELETE FROM entries WHERE root = ? AND key >= ? AND key < ?", (root_key, low, high))
+
+    def _finish_roots(self, root_keys, complete, count, scan_id, prune_keys=None):
+        """记录各根的完成状态；完整结束时 prune_keys（默认全部）中的根删除本轮没有重写的旧行。"""
+        prune_keys = set(root_keys if prune_keys is None else prune_keys)
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    for key in root_keys:
+                        if complete and key in prune_keys:
+                            conn.execute("DELETE FROM entries WHERE root = ? AND scan_id != ?", (key, scan_id))
+                        conn.execute(
+                            "UPDATE roots SET complete = ?, entries = ?, scanned_at = ? WHERE root = ?",
+                            (1 if complete else 0, int(count), time.time(), key),
+                        )
+        except Exception as e:
+            log_sampled_background_error("写入文件系统索引", e, limit=3)
+
+    def cached_listing(self, dirpath, dir_stat, root_key, row=None):
+        """目录 mtime、设备与 inode 未变且缓存子项数量完整时，返回 root_key 名下上次记录的子项列表。
+
+        row 为调用方已从父目录清单得知的 (mtime_ns, dev, ino, child_count)，提供时省去一次查询。
+        """
+        key = _fs_index_key(dirpath)
+        with self._lock:
+            conn = self._connection()
+            if row is None:
+                row = conn.execute(
+                    "SELECT mtime_ns, dev, ino, child_count FROM entries WHERE root = ? AND key = ? AND is_dir = 1",
+                    (root_key, key),
+                ).fetchone()
+            if row is None:
+                return None
+            mtime_ns, dev, ino, child_count = row
+            if (
+                child_count < 0
+                or mtime_ns != int(dir_stat.st_mtime_ns)
+                or dev != _sqlite_file_id(dir_stat.st_dev)
+                or ino != _sqlite_file_id(dir_stat.st_ino)
+            ):
+                return None
+            children = conn.execute(
+                "SELECT path, size, mtime_ns, dev, ino, is_dir, child_count FROM entries WHERE root = ? AND parent = ? AND key != ?",
+                (root_key, key, key),
+            ).fetchall()
+        if len(children) != child_count:
+            return None
+        return [
+            _IndexedDirEntry(path, is_dir, (size, mtime, dev, ino), count)
+            for path, size, mtime, dev, ino, is_dir, count in children
+        ]
+
+    def _fresh_root_rows(self, max_age=None):
+        if max_age is None:
+            max_age = FS_INDEX_MAX_AGE_SEC
+        cutoff = time.time() - float(max_age)
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT root, excludes FROM roots WHERE complete = 1 AND scanned_at >= ?",
+                (cutoff,),
+            ).fetchall()
+        return {root: set(json.loads(excludes or "[]")) for root, excludes in rows}
+
+    def covers(self, roots, excludes, max_age=None):
+        """roots 全部有新鲜且完整的记录，并且记录时排除的目录是本次排除集合的子集。"""
+        if not roots:
+            return False
+        try:
+            fresh = self._fresh_root_rows(max_age)
+        except Exception as e:
+            log_sampled_background_error("读取文件系统索引", e, limit=3)
+            return False
+        wanted = set(json.loads(_fs_index_excludes_text(excludes)))
+        for root in roots:
+            recorded = fresh.get(_fs_index_key(root))
+            if recorded is None or not recorded.issubset(wanted):
+                return False
+        return True
+
+    def covering_root(self, path, max_age=None):
+        """返回包含 path 的新鲜根目录键；若 path 的子树在记录时有内容被排除则返回空串。"""
+        key = _fs_index_key(path)
+        try:
+            fresh = self._fresh_root_rows(max_age)
+        except Exception as e:
+            log_sampled_background_error("读取文件系统索引", e, limit=3)
+            return ""
+        for root_key, excluded in sorted(fresh.items(), key=lambda item: len(item[0]), reverse=True):
+            if key != root_key and not key.startswith(_fs_index_prefix_range(root_key)[0]):
+                continue
+            subtree_prefix = _fs_index_prefix_range(key)[0]
+            for item in excluded:
+                # 名称与通配规则可能剔除子树任意层级的内容，记录不完整，不能用来汇总大小
+                if _is_name_or_glob_exclusion(item) or item.startswith(subtree_prefix):
+                    return ""
+                if key == item or key.startswith(_fs_index_prefix_range(item)[0]):
+                    return ""
+            return root_key
+        return ""
+
+    def _root_filters(self, roots, excludes):
+        clauses = []
+        params = []
+        keys = sorted({_fs_index_key(root) for root in roots or []}, key=len)
+        outermost = []
+        for key in keys:
+            # 查询根互相嵌套时只取最外层，内层根的条目已包含在外层根的记录中
+            if not any(key == outer or key.startswith(_fs_index_prefix_range(outer)[0]) for outer in outermost):
+                outermost.append(key)
+        for key in outermost:
+            clauses.append("(root = ? AND key != root)")
+            params.append(key)
+        where = "(" + " OR ".join(clauses) + ")" if clauses else "0"
+        for item in excludes or []:
+            if not item or _is_name_or_glob_exclusion(item):
+                continue
+            key = _fs_index_key(os.path.expandvars(item))
+            low, high = _fs_index_prefix_range(key)
+            where += " AND key != ? AND NOT (key >= ? AND key < ?)"
+            params.extend([key, low, high])
+        return where, params
+
+    def iter_entries(self, roots, excludes, want_files=True, want_dirs=True, ext_filter=None, min_size=0, stop_event=None):
+        """分批产出 (size, path, is_dir)，读取使用独立连接，不阻塞写入。"""
+        where, params = self._root_filters(roots, excludes)
+        if not want_files:
+            where += " AND is_dir = 1"
+        elif not want_dirs:
+            where += " AND is_dir = 0"
+        if min_size:
+            where += " AND (is_dir = 1 OR size >= ?)"
+            params.append(int(min_size))
+        if ext_filter:
+            where += " AND (is_dir = 1 OR key LIKE ?)"
+            params.append("%" + os.path.normcase(ext_filter))
+        conn = self._open_connection()
+        try:
+            cursor = conn.execute(f"SELECT size, path, is_dir FROM entries WHERE {where}", params)
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    return
+                rows = cursor.fetchmany(FS_INDEX_FETCH_ROWS)
+                if not rows:
+                    return
+                yield [(int(size), path, bool(is_dir)) for size, path, is_dir in rows]
+        finally:
+            conn.close()
+
+    def top_files(self, roots, excludes, min_size, limit=None):
+        where, params = self._root_filters(roots, excludes)
+        sql = f"SELECT size, path FROM entries WHERE {where} AND is_dir = 0 AND size >= ? ORDER BY size DESC"
+        params.append(int(min_size))
+        if limit and int(limit) > 0:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        conn = self._open_connection()
+        try:
+            return [(int(size), path) for size, path in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    def subtree_size(self, path, max_age=None):
+        """返回索引中 path 子树的文件总大小；未被新鲜索引覆盖时返回 None。"""
+        root_key = self.covering_root(path, max_age=max_age)
+        if not root_key:
+            return None
+        key = _fs_index_key(path)
+        low, high = _fs_index_prefix_range(key)
+        conn = self._open_connection()
+        try:
+            row = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries WHERE root = ? AND is_dir = 0 AND key >= ? AND key < ?",
+                (root_key, low, high),
+            ).fetchone()
+            return int(row[0] or 0)
+        finally:
+            conn.close()
+
+    def refresh_files(self, updates, missing):
+        """写回重新 stat 的结果：updates 为 [(size, mtime_ns, path)]，missing 中的路径连同子孙一起删除。"""
+        if updates:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.executemany(
+                        "UPDATE entries SET size = ?, mtime_ns = ? WHERE key = ?",
+                        [(int(size), int(mtime_ns), _fs_index_key(path)) for size, mtime_ns, path in updates],
+                    )
+        for path in missing:
+            self.forget(path)
+
+    def forget(self, path):
+        """删除 path 及其子孙条目，避免已清理的内容继续出现在后续查询中。"""
+        key = _fs_index_key(path)
+        low, high = _fs_index_prefix_range(key)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM entries WHERE key = ? OR (key >= ? AND key < ?)", (key, low, high))
+
+def get_filesystem_index():
+    global _fs_index_instance
+    if os.environ.get("C_CLEANER_PLUS_DISABLE_FS_INDEX"):
+        return None
+    with _fs_index_lock:
+        if _fs_index_instance is None:
+            try:
+                index = FileSystemIndex(filesystem_index_path())
+                with index._lock:
+                    index._connection()
+                _fs_index_instance = index
+            except Exception as e:
+                log_sampled_background_error("打开文件系统索引", e, limit=3)
+                return None
+        return _fs_index_instance
+
+def forget_indexed_path(path):
+    index = _fs_index_instance
+    if index is None:
+        return
+    try:
+        index.forget(path)
+    except Exception as e:
+        log_sampled_background_error("更新文件系统索引", e, limit=3)
+
+# ══════════════════════════════════════════════════════════
+#  持久化内容哈希缓存
+# ══════════════════════════════════════════════════════════
+HASH_CACHE_FILE = "cdisk_cleaner_hash_cache.sqlite3"
+HASH_CACHE_SCHEMA_VERSION = 2
+HASH_CACHE_MAX_AGE_SEC = 90 * 86400
+HASH_CACHE_MAX_ENTRIES = 500000
+HASH_CACHE_FLUSH_ROWS = 2000
+HASH_CACHE_FLUSH_SEC = 5.0
+HASH_CACHE_TOUCH_SEC = 86400
+HASH_CACHE_RACY_NS = 2 * 1000 * 1000 * 1000
+HASH_KIND_QUICK = "quick"
+HASH_KIND_FULL = "sha256"
+
+_hash_cache_lock = threading.Lock()
+_hash_cache_instance = None
+
+def content_hash_cache_path(config_dir=None):
+    base_dir = os.path.abspath(os.path.expandvars(config_dir or get_runtime_config_dir()))
+    return os.path.join(base_dir, HASH_CACHE_FILE)
+
+class ContentHashCache:
+    """按文件身份 _file_stat_signature (size, mtime_ns, dev, ino) 缓存采样哈希与全量 sha256。
+
+    每个 (dev, ino, kind) 只保留最新一条，大小或 mtime 不符即视为未命中。mtime 距写入时刻不足
+    HASH_CACHE_RACY_NS 的结果不入库，避免粗粒度时间戳的文件系统上同一时刻被原地改写的文件命中旧摘要。
+    写入与命中刷新先缓冲再按批提交；打开时按最近使用时间淘汰过期与超量的条目。
+    """
+
+    def __init__(self, path, max_age=None, max_entries=None):
+        self.path = os.path.abspath(path)
+        self.max_age = HASH_CACHE_MAX_AGE_SEC if max_age is None else float(max_age)
+        self.max_entries = HASH_CACHE_MAX_ENTRIES if max_entries is None else int(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def _connection(self):
+        if self._conn is None:
+            parent = os.path.dirname(self.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != HASH_CACHE_SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS hashes")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS hashes (
+                    dev TEXT NOT NULL,
+                    ino TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    digest TEXT NOT NULL,
+                    used_at REAL NOT NULL,
+                    PRIMARY KEY (dev, ino, kind)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS hashes_used_at ON hashes(used_at);
+                """
+            )
+            conn.execute(f"PRAGMA user_version={HASH_CACHE_SCHEMA_VERSION}")
+            conn.commit()
+            self._conn = conn
+            self._prune(conn)
+        return self._conn
+
+    def _prune(self, conn):
+        with conn:
+            conn.execute("DELETE FROM hashes WHERE used_at < ?", (time.time() - self.max_age,))
+            total = conn.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+            if total > self.max_entries:
+                conn.execute(
+                    "DELETE FROM hashes WHERE (dev, ino, kind) IN (SELECT dev, ino, kind FROM hashes ORDER BY used_at LIMIT ?)",
+                    (total - self.max_entries,),
+                )
+
+    @staticmethod
+    def _usable(signature):
+        return bool(signature) and len(signature) == 4 and signature[3] != 0
+
+    def get(self, signature, kind):
+        """返回与 signature 完全一致的缓存摘要，未命中返回空串。"""
+        if not self._usable(signature):
+            return ""
+        size, mtime_ns, dev, ino = signature
+        key = (_sqlite_file_id(dev), _sqlite_file_id(ino), kind)
+        try:
+            with self._lock:
+                row = self._pending.get(key)
+                if row is None:
+                    row = self._connection().execute(
+                        "SELECT dev, ino, kind, size, mtime_ns, digest, used_at FROM hashes WHERE dev = ? AND ino = ? AND kind = ?",
+                        key,
+                    ).fetchone()
+                if row is None or row[3] != size or row[4] != mtime_ns:
+                    self.misses += 1
+                    return ""
+                self.hits += 1
+                now = time.time()
+                if now - row[6] > HASH_CACHE_TOUCH_SEC:
+                    self._pending[key] = (*row[:6], now)
+                    self._maybe_flush()
+                return row[5]
+        except Exception as e:
+            log_sampled_background_error("读取内容哈希缓存", e, limit=3)
+            return ""
+
+    def put(self, signature, kind, digest):
+        """记录 signature 对应的摘要；调用方需保证摘要计算前后文件身份未变。"""
+        if not digest or not self._usable(signature):
+            return
+        size, mtime_ns, dev, ino = signature
+        if mtime_ns >= time.time_ns() - HASH_CACHE_RACY_NS:
+            return
+        with self._lock:
+            dev_text, ino_text = _sqlite_file_id(dev), _sqlite_file_id(ino)
+            self._pending[(dev_text, ino_text, kind)] = (dev_text, ino_text, kind, size, mtime_ns, str(digest), time.time())
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self._pending) >= HASH_CACHE_FLUSH_ROWS or time.monotonic() - self._last_flush >= HASH_CACHE_FLUSH_SEC:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows = list(self._pending.values())
+            self._pending.clear()
+            self._last_flush = time.monotonic()
+            if not rows:
+                return
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO hashes(dev, ino, kind, size, mtime_ns, digest, used_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+            except Exception as e:
+                log_sampled_background_error("写入内容哈希缓存", e, limit=3)
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                finally:
+                    self._conn = None
+
+def get_content_hash_cache():
+    global _hash_cache_instance
+    if os.environ.get("C_CLEANER_PLUS_DISABLE_HASH_CACHE"):
+        return None
+    with _hash_cache_lock:
+        if _hash_cache_instance is None:
+            try:
+                cache = ContentHashCache(content_hash_cache_path())
+                with cache._lock:
+                    cache._connection()
+                _hash_cache_instance = cache
+            except Exception as e:
+                log_sampled_background_error("打开内容哈希缓存", e, limit=3)
+                return None
+        return _hash_cache_instance
+
+# ══════════════════════════════════════════════════════════
+#  紧凑扫描结果存储
+# ══════════════════════════════════════════════════════════
+class CompactPathTable:
+    """路径拆成 “父目录 id + 驻留名称” 存储，目录本身也按同样方式递归编号，
+    同一目录下的大量条目只共享一份目录链。无法原样还原的路径（如带重复分隔符）按原文保存。
+    """
+
+    __slots__ = ("_parents", "_names", "_ids", "_last_dir", "_last_id")
+
+    def __init__(self):
+        self._parents = array("l")
+        self._names = []
+        self._ids = {}
+        self._last_dir = None
+        self._last_id = -1
+
+    def __len__(self):
+        return len(self._names)
+
+    def dir_id(self, dirpath):
+        """返回目录的编号；无法还原为原文的目录返回 -1。"""
+        if dirpath == self._last_dir:
+            return self._last_id
+        parts = []
+        head = dirpath
+        while True:
+            parent, name = os.path.split(head)
+            if not name or parent == head:
+                parts.append(head)
+                break
+            parts.append(name)
+            head = parent
+        node = -1
+        created = False
+        for name in reversed(parts):
+            key = (node, name)
+            found = self._ids.get(key)
+            if found is None:
+                found = len(self._names)
+                self._names.append(sys.intern(name))
+                self._parents.append(node)
+                self._ids[key] = found
+                created = True
+            node = found
+        if created and self.dir_path(node) != dirpath:
+            node = -1
+        self._last_dir = dirpath
+        self._last_id = node
+        return node
+
+    def add_child(self, parent_id, name):
+        """遍历器专用：直接登记 parent_id 下的子目录并返回新编号，节点只保存父编号与名称。"""
+        node = len(self._names)
+        self._names.append(sys.intern(name))
+        self._parents.append(parent_id)
+        return node
+
+    def dir_path(self, dir_id):
+        parts = []
+        while dir_id >= 0:
+            parts.append(self._names[dir_id])
+            dir_id = self._parents[dir_id]
+        if not parts:
+            return ""
+        parts.reverse()
+        return os.path.join(*parts)
+
+    def split(self, path):
+        """返回 (目录 id, 驻留名称)；目录 id 为 -1 时名称即完整原文路径。"""
+        path = str(path or "")
+        dirpath, name = os.path.split(path)
+        if not name:
+            return -1, path
+        dir_id = self.dir_id(dirpath)
+        if dir_id < 0 or os.path.join(dirpath, name) != path:
+            return -1, path
+        return dir_id, sys.intern(name)
+
+    def join(self, dir_id, name):
+        return os.path.join(self.dir_path(dir_id), name) if dir_id >= 0 else name
+
+    def clear(self):
+        self._parents = array("l")
+        self._names = []
+        self._ids.clear()
+        self._last_dir = None
+        self._last_id = -1
+
+class CompactResultRow:
+    """CompactScanResults 中一行的轻量视图，提供与原先结果字典相同的读写接口。"""
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._store.value(self._index, key)
+
+    def __setitem__(self, key, value):
+        self._store.set_value(self._index, key, value)
+
+    def __contains__(self, key):
+        return key in self._store.keys(self._index)
+
+    def get(self, key, default=None):
+        try:
+            return self._store.value(self._index, key)
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self._store.keys(self._index)
+
+    def to_dict(self):
+        return {key: self._store.value(self._index, key) for key in self.keys()}
+
+class CompactScanResults:
+    """大规模扫描结果的列式容器：大小与 mtime 存 array('q')，路径存父目录 id + 驻留名称，
+    勾选状态存 bytearray；fields 中的列（如类型、详情）按列表保存，其余少见字段放在稀疏字典。
+
+    按下标访问得到 CompactResultRow 视图，扫描器与表格模型共用同一份存储。
+    """
+
+    _BUILTIN_KEYS = ("checked", "size", "mtime", "name", "path", "size_text")
+
+    def __init__(self, fields=(), path_table=None):
+        self._owns_path_table = path_table is None
+        self.path_table = CompactPathTable() if path_table is None else path_table
+        self._fields = tuple(fields)
+        self._field_pos = {field: idx for idx, field in enumerate(self._fields)}
+        self._reset()
+
+    def _reset(self):
+        self._sizes = array("q")
+        self._mtimes = array("q")
+        self._dirs = array("l")
+        self._names = []
+        self._checked = bytearray()
+        self._columns = [[] for _ in self._fields]
+        self._extra = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def __bool__(self):
+        return bool(self._names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [CompactResultRow(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return CompactResultRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield CompactResultRow(self, index)
+
+    def append(self, path, size=0, mtime=0, checked=False, **values):
+        dir_id, name = self.path_table.split(path)
+        index = len(self._names)
+        self._sizes.append(int(size or 0))
+        self._mtimes.append(int(mtime or 0))
+        self._dirs.append(dir_id)
+        self._names.append(name)
+        self._checked.append(1 if checked else 0)
+        for pos, field in enumerate(self._fields):
+            value = values.pop(field, None)
+            if type(value) is str and len(value) <= 64:
+                value = sys.intern(value)
+            self._columns[pos].append(value)
+        values.pop("size_text", None)
+        display_name = values.pop("name", None)
+        if display_name is not None and display_name != self._basename(index):
+            values["name"] = display_name
+        if values:
+            self._extra[index] = values
+
+    def append_child(self, dir_id, name, size=0):
+        """按 “目录编号 + 名称” 追加一行，供已经维护路径树的遍历器使用，不再拆分路径字符串。"""
+        self._sizes.append(int(size or 0))
+        self._mtimes.append(0)
+        self._dirs.append(dir_id)
+        self._names.append(sys.intern(name))
+        self._checked.append(0)
+        for column in self._columns:
+            column.append(None)
+
+    def paths(self):
+        return [self.path(index) for index in range(len(self))]
+
+    def extend(self, rows):
+        """接受结果字典、行视图或 (size, path) 元组。"""
+        for row in rows:
+            if isinstance(row, CompactResultRow):
+                row = row.to_dict()
+            if isinstance(row, dict):
+                row = dict(row)
+                path = row.pop("path", "")
+                self.append(path, **row)
+            else:
+                size, path = row[0], row[1]
+                self.append(path, size=size)
+
+    def _basename(self, index):
+        name = self._names[index]
+        return name if self._dirs[index] >= 0 else os.path.basename(name)
+
+    def path(self, index):
+        return self.path_table.join(self._dirs[index], self._names[index])
+
+    def size(self, index):
+        return self._sizes[index]
+
+    def keys(self, index):
+        keys = list(self._BUILTIN_KEYS) + list(self._fields)
+        extra = self._extra.get(index)
+        if extra:
+            keys.extend(key for key in extra if key not in keys)
+        return keys
+
+    def value(self, index, key):
+        if key == "path":
+            return self.path(index)
+        if key == "size":
+            return self._sizes[index]
+        if key == "checked":
+            return bool(self._checked[index])
+        if key == "name":
+            extra = self._extra.get(index)
+            if extra and "name" in extra:
+                return extra["name"]
+            return self._basename(index)
+        if key == "size_text":
+            return human_size(self._sizes[index])
+        if key == "mtime":
+            return self._mtimes[index]
+        pos = self._field_pos.get(key)
+        if pos is not None:
+            return self._columns[pos][index]
+        extra = self._extra.get(index)
+        if extra and key in extra:
+            return extra[key]
+        raise KeyError(key)
+
+    def set_value(self, index, key, value):
+        if key == "checked":
+            self._checked[index] = 1 if value else 0
+        elif key == "size":
+            self._sizes[index] = int(value or 0)
+        elif key == "mtime":
+            self._mtimes[index] = int(value or 0)
+        elif key in self._field_pos:
+            self._columns[self._field_pos[key]][index] = value
+        elif key in ("path", "size_text"):
+            raise KeyError(key)
+        else:
+            self._extra.setdefault(index, {})[key] = value
+
+    def set_all_checked(self, checked):
+        self._checked = bytearray([1 if checked else 0]) * len(self)
+
+    def all_checked(self):
+        return bool(self._checked) and all(self._checked)
+
+    def iter_checked(self):
+        checked = self._checked
+        return (index for index in range(len(checked)) if checked[index])
+
+    def sort(self, key=None, reverse=False):
+        """按行视图排序，所有列按同一排列重排。"""
+        count = len(self)
+        if count < 2:
+            return
+        if key is None:
+            key = lambda row: row["size"]
+        order = sorted(range(count), key=lambda index: key(CompactResultRow(self, index)), reverse=reverse)
+        self._sizes = array("q", (self._sizes[index] for index in order))
+        self._mtimes = array("q", (self._mtimes[index] for index in order))
+        self._dirs = array("l", (self._dirs[index] for index in order))
+        self._names = [self._names[index] for index in order]
+        self._checked = bytearray(self._checked[index] for index in order)
+        self._columns = [[column[index] for index in order] for column in self._columns]
+        if self._extra:
+            position = {old: new for new, old in enumerate(order) if old in self._extra}
+            self._extra = {position[old]: values for old, values in self._extra.items()}
+
+    def group_indices_by_size(self, min_count=2):
+        """返回 {size: array('l') 行号}，只包含出现次数不少于 min_count 的非零大小。"""
+        counts = Counter(self._sizes)
+        groups = {}
+        for index, size in enumerate(self._sizes):
+            if size > 0 and counts[size] >= min_count:
+                group = groups.get(size)
+                if group is None:
+                    group = groups[size] = array("l")
+                group.append(index)
+        return groups
+
+    def paths_at(self, indices):
+        return [self.path(index) for index in indices]
+
+    def clear(self):
+        self._reset()
+        if self._owns_path_table:
+            self.path_table.clear()
+
+# ══════════════════════════════════════════════════════════
+#  多线程文件扫描
+# ══════════════════════════════════════════════════════════
+AUTOTUNE_MAX_WORKERS = 32
+AUTOTUNE_WINDOW_SEC = 0.5
+AUTOTUNE_BUDGET_SEC = 6.0
+AUTOTUNE_MIN_GAIN = 0.08
+
+class ScanAutotuner:
+    """扫描开始阶段的线程数爬山调优器。
+
+    每个采样窗口统计 目录数 + 条目数 的吞吐量：先向上尝试（约 1.5 倍），提升不足
+    AUTOTUNE_MIN_GAIN 时改为向下尝试，两个方向都没有收益或超出时间预算即收敛到最佳值。
+    """
+
+    def __init__(self, initial, min_workers=1, max_workers=AUTOTUNE_MAX_WORKERS, window=AUTOTUNE_WINDOW_SEC,
+                 budget=AUTOTUNE_BUDGET_SEC):
+        self.min_workers = max(1, int(min_workers))
+        self.max_workers = max(self.min_workers, int(max_workers))
+        self.window = float(window)
+        self.budget = float(budget)
+        self.current = self._clamp(initial)
+        self.best = self.current
+        self.best_rate = 0.0
+        self.direction = 1
+        self.tried_down = False
+        self.settled = False
+        self.samples = 0
+        self._started_at = None
+        self._window_start = None
+        self._window_units = 0
+
+    def _clamp(self, value):
+        return max(self.min_workers, min(self.max_workers, int(value)))
+
+    def _next(self, base):
+        if self.direction > 0:
+            return self._clamp(max(base + 1, int(base * 1.5 + 0.5)))
+        return self._clamp(min(base - 1, int(base / 1.5)))
+
+    def _settle(self):
+        self.settled = True
+        self.current = self.best
+        return self.best
+
+    def observe(self, now, units):
+        """记录累计工作量，窗口结束时返回新的目标线程数（无需调整时返回 None）。"""
+        if self.settled:
+            return None
+        if self._window_start is None:
+            self._started_at = self._window_start = now
+            self._window_units = units
+            return None
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return None
+        rate = (units - self._window_units) / elapsed
+        self._window_start = now
+        self._window_units = units
+        self.samples += 1
+        if self.samples == 1:
+            self.best_rate = rate
+        elif rate > self.best_rate * (1 + AUTOTUNE_MIN_GAIN):
+            self.best, self.best_rate = self.current, rate
+            # 向上有收益说明更少的线程只会更慢，不再向下尝试
+            self.tried_down = self.tried_down or self.direction > 0
+        elif self.direction > 0 and not self.tried_down:
+            self.direction = -1
+            self.tried_down = True
+            self.current = self.best
+        else:
+            return self._settle()
+        if now - self._started_at >= self.budget:
+            return self._settle()
+        candidate = self._next(self.current)
+        if candidate == self.current and self.direction > 0 and not self.tried_down:
+            self.direction = -1
+            self.tried_down = True
+            candidate = self._next(self.current)
+        if candidate == self.current:
+            return self._settle()
+        self.current = candidate
+        return candidate
+
+SCAN_THREAD_BUDGET = 48
+
+class ScanThreadBudget:
+    """进程内所有遍历引擎共享的活动线程预算。
+
+    AUTOTUNE_MAX_WORKERS 只约束单个引擎；多卷并行或多个页面同时扫描时，各引擎扩容都要从这里领取额度，
+    引擎结束或被取消时归还。每个引擎至少保留 1 个线程，避免额度耗尽时遍历停滞。
+    总额可用环境变量 C_CLEANER_PLUS_SCAN_THREAD_BUDGET 调整。
+    """
+
+    def __init__(self, total=None):
+        if total is None:
+            try:
+                total = int(os.environ.get("C_CLEANER_PLUS_SCAN_THREAD_BUDGET", SCAN_THREAD_BUDGET))
+            except ValueError:
+                total = SCAN_THREAD_BUDGET
+        self.total = max(1, int(total))
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def resize(self, held, want):
+        """把持有量从 held 调整为最多 want，返回实际获得的数量（want > 0 时至少为 1）。"""
+        with self._lock:
+            self.used -= held
+            granted = max(1, min(int(want), self.total - self.used)) if want > 0 else 0
+            self.used += granted
+            return granted
+
+_scan_thread_budget = ScanThreadBudget()
+
+SCAN_METRICS_HISTORY = 20
+SCAN_METRICS_LIVE_INTERVAL = 1.0
+_recent_scan_metrics = deque(maxlen=SCAN_METRICS_HISTORY)
+_scan_metrics_listeners = []
+_scan_metrics_lock = threading.Lock()
+
+class ScanMetrics:
+    """一次扫描的结构化指标：目录/文件吞吐、已 stat 的字节数、遍历队列深度、活动线程、
+    各根目录（按卷分组）耗时，以及本次扫描内 log_sampled_background_error 记录的按类别错误数。
+
+    错误只计入绑定到当前线程的扫描：创建时绑定到创建线程，finish() 时恢复之前的绑定；
+    遍历引擎的工作线程由 run_device_walkers 绑定，同时进行的其他扫描不会混入。
+    """
+
+    def __init__(self, name, roots=(), backend="threads"):
+        self.name = str(name or "扫描")
+        self.roots = [str(root) for root in roots or []]
+        self.backend = backend
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._finished = None
+        self.dirs = 0
+        self.files = 0
+        self.bytes_stat = 0
+        self.queue_depth = 0
+        self.peak_queue_depth = 0
+        self.active_workers = 0
+        self.busy_workers = 0
+        self.root_elapsed = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._last_live = 0.0
+        self._scope_thread = threading.get_ident()
+        self._scope_previous = getattr(_scan_error_scope, "metrics", None)
+        _scan_error_scope.metrics = self
+
+    def count_error(self, key):
+        with self._lock:
+            if self._finished is None:
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def add_files(self, count, size_total=0):
+        with self._lock:
+            self.files += int(count)
+            self.bytes_stat += int(size_total)
+
+    def sample_walkers(self, walkers):
+        dirs = depth = active = busy = 0
+        for walker in walkers:
+            walker_dirs, pending, limit, running = walker.stats()
+            dirs += walker_dirs
+            depth += pending
+            active += limit
+            busy += running
+        with self._lock:
+            self.dirs = dirs
+            self.queue_depth = depth
+            self.peak_queue_depth = max(self.peak_queue_depth, depth)
+            self.active_workers = active
+            self.busy_workers = busy
+
+    def finish_root(self, label, elapsed=None):
+        with self._lock:
+            if label not in self.root_elapsed:
+                self.root_elapsed[label] = self.elapsed if elapsed is None else float(elapsed)
+
+    @property
+    def elapsed(self):
+        end = self._finished if self._finished is not None else time.perf_counter()
+        return max(0.0, end - self._started)
+
+    @property
+    def finished(self):
+        return self._finished is not None
+
+    def finish(self):
+        if self._finished is not None:
+            return self
+        with self._lock:
+            self._finished = time.perf_counter()
+            self.busy_workers = 0
+            self.queue_depth = 0
+        if threading.get_ident() == self._scope_thread and getattr(_scan_error_scope, "metrics", None) is self:
+            _scan_error_scope.metrics = self._scope_previous
+        return self
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = self.elapsed
+            rate_base = elapsed if elapsed > 0 else 1.0
+            return {
+                "name": self.name,
+                "backend": self.backend,
+                "roots": list(self.roots),
+                "started_at": self.started_at,
+                "elapsed": elapsed,
+                "final": self._finished is not None,
+                "dirs": self.dirs,
+                "files": self.files,
+                "bytes_stat": self.bytes_stat,
+                "dirs_per_sec": self.dirs / rate_base,
+                "files_per_sec": self.files / rate_base,
+                "queue_depth": self.queue_depth,
+                "peak_queue_depth": self.peak_queue_depth,
+                "active_workers": self.active_workers,
+                "busy_workers": self.busy_workers,
+                "root_elapsed": dict(self.root_elapsed),
+                "errors": dict(self.errors),
+            }
+
+def format_scan_metrics(snapshot):
+    """把 ScanMetrics.snapshot() 格式化为日志文本行。"""
+    started = time.strftime("%H:%M:%S", time.localtime(snapshot.get("started_at", 0)))
+    lines = [
+        f"[{started}] {snapshot.get('name')} ({snapshot.get('backend')}) 耗时 {snapshot.get('elapsed', 0):.1f} 秒 | "
+        f"目录 {snapshot.get('dirs', 0)} ({snapshot.get('dirs_per_sec', 0):.0f}/秒) | "
+        f"文件 {snapshot.get('files', 0)} ({snapshot.get('files_per_sec', 0):.0f}/秒) | "
+        f"已统计 {human_size(snapshot.get('bytes_stat', 0))} | "
+        f"线程 {snapshot.get('active_workers', 0)} | 队列峰值 {snapshot.get('peak_queue_depth', 0)}"
+    ]
+    for label, elapsed in sorted(snapshot.get("root_elapsed", {}).items()):
+        lines.append(f"    根目录 {label}: {elapsed:.1f} 秒")
+    errors = snapshot.get("errors") or {}
+    if errors:
+        lines.append("    错误: " + "，".join(f"{key} × {count}" for key, count in sorted(errors.items())))
+    return lines
+
+def add_scan_metrics_listener(listener):
+    with _scan_metrics_lock:
+        if listener not in _scan_metrics_listeners:
+            _scan_metrics_listeners.append(listener)
+
+def remove_scan_metrics_listener(listener):
+    with _scan_metrics_lock:
+        if listener in _scan_metrics_listeners:
+            _scan_metrics_listeners.remove(listener)
+
+def publish_scan_metrics(metrics, final=True):
+    """通知监听者；final=True 时结束计时并写入最近扫描记录。过程中的实时快照按间隔节流。"""
+    if final:
+        metrics.finish()
+    else:
+        now = time.perf_counter()
+        if now - metrics._last_live < SCAN_METRICS_LIVE_INTERVAL:
+            return
+        metrics._last_live = now
+    snapshot = metrics.snapshot()
+    with _scan_metrics_lock:
+        if final:
+            _recent_scan_metrics.append(snapshot)
+        listeners = list(_scan_metrics_listeners)
+    for listener in listeners:
+        try:
+            listener(snapshot)
+        except Exception as e:
+            log_sampled_background_error("扫描指标回调", e, limit=3)
+
+def format_recent_scan_metrics():
+    with _scan_metrics_lock:
+        snapshots = list(_recent_scan_metrics)
+    lines = []
+    for snapshot in snapshots:
+        lines.extend(format_scan_metrics(snapshot))
+    return "\n".join(lines)
+
+class WorkStealingWalker:
+    """多线程目录遍历引擎：每个线程维护本地双端队列，空闲时从其他线程窃取任务。
+
+    visit(dirpath, push) 负责处理单个目录，对需要继续遍历的子目录调用 push(path)，
+    可返回本目录处理的条目数用于吞吐统计；push 的对象会原样交回 visit，也可以是路径树节点编号。子目录先写入线程本地缓冲，按批次发布到自己的
+    队列尾部；自身从尾部取（深度优先，局部性好），窃取方从头部取（通常是更浅、更大的子树）。
+    全局只维护一个待完成计数，每处理完一个目录加锁一次；计数归零即遍历完成，空闲线程在
+    条件变量上等待，不做超时轮询。stop_event 被置位后，正在工作的线程会在取下一个目录时取消整轮遍历。
+    autotune=True 时由 ScanAutotuner 在扫描开始阶段调整活动线程数，超出上限的线程挂起等待；
+    活动线程数同时受进程级 ScanThreadBudget 约束，遍历结束或取消时归还额度。
+    """
+
+    PUBLISH_BATCH = 64
+
+    def __init__(self, roots, visit, workers=4, stop_event=None, log_context="遍历目录", autotune=False,
+                 max_workers=AUTOTUNE_MAX_WORKERS, budget=None, metrics=None):
+        self._visit = visit
+        self._metrics = metrics
+        self._budget = budget if budget is not None else _scan_thread_budget
+        self._budget_held = 0
+        self._budget_lock = threading.Lock()
+        self._stop_event = stop_event
+        self._log_context = log_context
+        initial = max(1, int(workers or 1))
+        self._tuner = ScanAutotuner(initial, max_workers=max(initial, max_workers)) if autotune else None
+        capacity = self._tuner.max_workers if self._tuner is not None else initial
+        self._deques = [deque() for _ in range(capacity)]
+        self._active_limit = initial
+        lock = threading.Lock()
+        self._cond = threading.Condition(lock)
+        self._park = threading.Condition(lock)
+        self._done = threading.Event()
+        self._pending = 0
+        self._epoch = 0
+        self._idle = 0
+        self._dirs_done = 0
+        self._entries_done = 0
+        self._finished = False
+        self._cancelled = False
+        self._threads = []
+        for i, root in enumerate(roots or []):
+            self._deques[i % initial].append(root)
+            self._pending += 1
+        if not self._pending:
+            self._finished = True
+            self._done.set()
+
+    @property
+    def completed(self):
+        """遍历是否完整结束（未被取消）。"""
+        return self._finished and not self._cancelled
+
+    @property
+    def tuned_workers(self):
+        """调优收敛后的线程数与对应吞吐量（条目/秒）；未启用或未收敛时返回 None。"""
+        tuner = self._tuner
+        if tuner is None or not tuner.settled or tuner.samples < 2:
+            return None
+        return tuner.best, tuner.best_rate
+
+    def work_done(self):
+        return self._dirs_done + self._entries_done
+
+    def stats(self):
+        """返回 (已完成目录数, 待处理目录数, 活动线程上限, 正在工作的线程数)。"""
+        with self._cond:
+            running = min(self._active_limit, len(self._threads))
+            return self._dirs_done, self._pending, self._active_limit, max(0, running - self._idle)
+
+    def start(self):
+        count = self._claim_budget(self._active_limit)
+        if count:
+            with self._cond:
+                self._active_limit = count
+        self._spawn_workers(self._active_limit)
+        return self
+
+    def _claim_budget(self, want):
+        """向共享预算申请 want 个活动线程，返回获得的数量；遍历已结束时返回 0。"""
+        with self._budget_lock:
+            if self._done.is_set():
+                return 0
+            self._budget_held = self._budget.resize(self._budget_held, want)
+            return self._budget_held
+
+    def _release_budget(self):
+        with self._budget_lock:
+            if self._budget_held:
+                self._budget.resize(self._budget_held, 0)
+                self._budget_held = 0
+
+    def _spawn_workers(self, count):
+        while len(self._threads) < count:
+            t = threading.Thread(target=self._worker_loop, args=(len(self._threads),), daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def set_active_workers(self, count):
+        count = self._claim_budget(max(1, min(len(self._deques), int(count))))
+        if not count:
+            return
+        with self._cond:
+            self._active_limit = count
+            self._park.notify_all()
+        self._spawn_workers(count)
+
+    def cancel(self):
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+            self._park.notify_all()
+        self._done.set()
+        self._release_budget()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def join(self, timeout=None):
+        """等待所有工作线程退出；timeout 为整体上限，返回是否全部退出。"""
+        deadline = None if timeout is None else time.time() + timeout
+        for t in self._threads:
+            t.join(None if deadline is None else max(0.0, deadline - time.time()))
+        return not any(t.is_alive() for t in self._threads)
+
+    def run(self, progress_cb=None, interval=0.3, join_timeout=2):
+        """启动并阻塞到遍历结束或被取消；只在需要汇报进度或调优尚未收敛时定期唤醒。"""
+        return run_walkers([self], progress_cb=progress_cb, interval=interval, join_timeout=join_timeout)
+
+    def _tuning_window(self):
+        tuner = self._tuner
+        return tuner.window if tuner is not None and not tuner.settled else None
+
+    def _tune(self, now):
+        tuner = self._tuner
+        if tuner is None or tuner.settled or self._done.is_set():
+            return
+        target = tuner.observe(now, self.work_done())
+        if target is not None and target != self._active_limit:
+            self.set_active_workers(target)
+            # 预算不足时实际线程数可能少于目标，让调优器按真实线程数继续比较吞吐
+            if not tuner.settled:
+                tuner.current = self._active_limit
+
+    def _stopping(self):
+        if self._cancelled:
+            return True
+        if self._stop_event is not None and self._stop_event.is_set():
+            self.cancel()
+            return True
+        return False
+
+    def _publish(self, local, buffer, finished, entries=0):
+        finished_now = False
+        with self._cond:
+            if buffer:
+                local.extend(buffer)
+                self._pending += len(buffer)
+                self._epoch += 1
+                if self._idle:
+                    self._cond.notify(min(self._idle, len(buffer)))
+                buffer.clear()
+            if finished:
+                self._pending -= finished
+                self._dirs_done += finished
+                self._entries_done += entries
+            if self._pending <= 0 and not self._finished:
+                self._finished = True
+                self._cond.notify_all()
+                self._park.notify_all()
+                self._done.set()
+                finished_now = True
+        if finished_now:
+            self._release_budget()
+
+    def _steal(self, idx):
+        count = len(self._deques)
+        for offset in range(1, count):
+            try:
+                return self._deques[(idx + offset) % count].popleft()
+            except IndexError:
+                continue
+        return None
+
+    def _next_dir(self, idx, local):
+        while not self._stopping():
+            if idx >= self._active_limit:
+                # 被调优器挂起；本地队列中剩余的目录会被其他线程窃取
+                with self._cond:
+                    if self._finished or self._cancelled:
+                        return None
+                    if idx >= self._active_limit:
+                        self._park.wait()
+                continue
+            try:
+                return local.pop()
+            except IndexError:
+                pass
+            epoch = self._epoch
+            path = self._steal(idx)
+            if path is not None:
+                return path
+            with self._cond:
+                if self._finished or self._cancelled:
+                    return None
+                # 读取 epoch 之后若有新任务发布，重新检查而不是进入等待，避免丢失唤醒
+                if self._epoch == epoch:
+                    self._idle += 1
+                    self._cond.wait()
+                    self._idle -= 1
+        return None
+
+    def _worker_loop(self, idx):
+        local = self._deques[idx]
+        buffer = []
+        _scan_error_scope.metrics = self._metrics
+
+        def push(path):
+            buffer.append(path)
+            if len(buffer) >= self.PUBLISH_BATCH:
+                self._publish(local, buffer, 0)
+
+        while True:
+            dirpath = self._next_dir(idx, local)
+            if dirpath is None:
+                return
+            entries = 0
+            try:
+                entries = self._visit(dirpath, push) or 0
+            except Exception as e:
+                log_sampled_background_error(f"{self._log_context}遍历目录", e)
+            finally:
+                self._publish(local, buffer, 1, entries)
+
+def run_walkers(walkers, progress_cb=None, interval=0.3, join_timeout=2):
+    """并行运行多个遍历引擎直到全部结束，返回是否所有工作线程都已退出。"""
+    walkers = list(walkers)
+    for walker in walkers:
+        walker.start()
+    try:
+        while True:
+            running = [walker for walker in walkers if not walker.wait(0)]
+            if not running:
+                break
+            timeout = interval if progress_cb is not None else None
+            for walker in running:
+                window = walker._tuning_window()
+                if window is not None:
+                    timeout = window if timeout is None else min(timeout, window)
+            # 只需等待任一未结束的引擎；其结束或超时后重新评估
+            running[0].wait(timeout)
+            now = time.perf_counter()
+            for walker in running:
+                walker._tune(now)
+            if progress_cb is not None:
+                progress_cb()
+    finally:
+        for walker in walkers:
+            if not walker.wait(0):
+                walker.cancel()
+    deadline = time.time() + join_timeout
+    all_exited = True
+    for walker in walkers:
+        all_exited = walker.join(timeout=max(0.0, deadline - time.time())) and all_exited
+    return all_exited
+
+def _scan_device_key(root):
+    drive = os.path.splitdrive(os.path.abspath(str(root)))[0]
+    if drive:
+        return drive.upper()
+    try:
+        return f"dev:{os.stat(root).st_dev}"
+    except OSError:
+        return os.path.normcase(os.path.abspath(str(root)))
+
+def group_roots_by_device(roots):
+    """按所在卷（盘符，无盘符时用 st_dev）分组，保持根目录首次出现的顺序。"""
+    groups = {}
+    for root in roots or []:
+        groups.setdefault(_scan_device_key(root), []).append(root)
+    return list(groups.items())
+
+def run_device_walkers(roots, visit, workers, stop_event=None, log_context="遍历目录", progress_cb=None, interval=0.3,
+                       join_timeout=2, metrics=None):
+    """每个卷一个独立的遍历引擎和并发上限，结果由共享的 visit 汇总。
+
+    单卷时使用调用方给出的线程数；多卷时每个卷使用自己学习到的线程数，
+    避免机械硬盘被固态盘的高并发拖入随机寻道。返回 (是否完整结束, 是否全部线程退出)。
+    metrics 为 ScanMetrics 时定期采样队列深度与线程状态并记录各卷耗时，由调用方负责最终发布。
+    """
+    groups = group_roots_by_device(roots)
+    walkers = []
+    for device, device_roots in groups:
+        threads = workers
+        if len(groups) > 1 and len(device) == 2 and device.endswith(":"):
+            threads = get_scan_threads_cached(device)[0]
+        walker = WorkStealingWalker(
+            device_roots, visit, workers=threads, stop_event=stop_event, log_context=log_context, autotune=True,
+            metrics=metrics,
+        )
+        walkers.append((device_roots, walker))
+    engines = [walker for _, walker in walkers]
+    tick = progress_cb
+    if metrics is not None:
+        def tick():
+            metrics.sample_walkers(engines)
+            for device_roots, walker in walkers:
+                if walker.wait(0):
+                    metrics.finish_root("; ".join(device_roots))
+            publish_scan_metrics(metrics, final=False)
+            if progress_cb is not None:
+                progress_cb()
+
+    all_exited = run_walkers(engines, progress_cb=tick, interval=interval, join_timeout=join_timeout)
+    if metrics is not None:
+        metrics.sample_walkers(engines)
+        for device_roots, _walker in walkers:
+            metrics.finish_root("; ".join(device_roots))
+    for device_roots, walker in walkers:
+        record_tuned_scan_threads(device_roots, walker.tuned_workers)
+    return all(walker.completed for _, walker in walkers), all_exited
+
+def _push_bigfile_result(results, item, result_limit):
+    if result_limit and result_limit > 0:
+        if len(results) < result_limit:
+            heapq.heappush(results, item)
+        elif item[0] > results[0][0]:
+            heapq.heapreplace(results, item)
+    else:
+        results.append(item)
+
+def should_skip_bigfile(path, skip_optional=False):
+    name = os.path.basename(path).lower()
+    ext = os.path.splitext(name)[1]
+    if ext in BIGFILE_SKIP_EXT:
+        return True
+    if not skip_optional:
+        return False
+    if name in BIGFILE_OPTIONAL_SKIP_NAMES:
+        return True
+    if ext in BIGFILE_OPTIONAL_SKIP_EXT:
+        return True
+    return False
+
+def _is_drive_root_path(path):
+    try:
+        norm = os.path.normpath(os.path.abspath(path))
+        drive, tail = os.path.splitdrive(norm)
+        return bool(drive) and tail in ("\\", "/")
+    except Exception:
+        return False
+
+def _fast_mft_bigfile_exe_path():
+    exe_name = "fast_large_files.exe"
+    candidates = []
+
+    bundle_dir = getattr(sys, "_MEIPASS", None)
+    if bundle_dir:
+        candidates.append(os.path.join(bundle_dir, exe_name))
+
+    if getattr(sys, "frozen", False):
+        candidates.append(os.path.join(os.path.dirname(sys.executable), exe_name))
+
+    base = os.path.dirname(os.path.abspath(__file__))
+    candidates.extend([
+        os.path.join(base, exe_name),
+        os.path.join(base, "tools", "fast_large_files", "target", "release", exe_name),
+        os.path.join(base, "tools", "fast_large_files", "target", "debug", exe_name),
+    ])
+
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+FAST_MFT_BINARY_MAGIC = b"FLF1"
+_FAST_MFT_RECORD = struct.Struct("<QH")
+_FAST_MFT_TOTAL = struct.Struct("<Q")
+_FAST_MFT_PROGRESS = 0xFFFF
+_FAST_MFT_ROOT_DONE = 0xFFFE
+
+def _fast_mft_output_format():
+    return "json" if os.environ.get("C_CLEANER_PLUS_MFT_JSON") else "binary"
+
+def _iter_fast_mft_json(stream, roots, want):
+    """解析 JSON 行输出，产出 ("progress", root, done, total) / ("row", size, path) / ("root_done", root, rows)。"""
+    for raw in stream:
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+            if "progress" in row:
+                yield ("progress", str(row.get("root", "")), int(row["progress"]), int(row.get("total", 0)))
+            elif "root_done" in row:
+                yield ("root_done", str(row["root_done"]), int(row.get("rows", 0)))
+            else:
+                size = int(row.get("size", 0))
+                if want(size):
+                    yield ("row", size, str(row.get("path", "")))
+        except Exception as e:
+            log_sampled_background_error("Fast MFT large-file parse", e)
+
+def _iter_fast_mft_binary(stream, roots, want, chunk_size=1 << 16):
+    """解析二进制输出（FLF1 + 定长头 u64/u16 + UTF-8 路径），事件与 _iter_fast_mft_json 相同。
+
+    在同一个缓冲区上用 struct.unpack_from 直接解头，只有 want(size) 通过的行才解码路径；
+    控制记录不带根路径，按传入顺序对应 roots。
+    """
+    read = getattr(stream, "read1", None) or stream.read
+    header = _FAST_MFT_RECORD.size
+    unpack_header = _FAST_MFT_RECORD.unpack_from
+    unpack_total = _FAST_MFT_TOTAL.unpack_from
+    buf = bytearray()
+    root_index = 0
+    started = False
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        buf += chunk
+        pos = 0
+        if not started:
+            if len(buf) < len(FAST_MFT_BINARY_MAGIC):
+                continue
+            if bytes(buf[:len(FAST_MFT_BINARY_MAGIC)]) != FAST_MFT_BINARY_MAGIC:
+                raise ValueError("unexpected MFT helper output header")
+            started = True
+            pos = len(FAST_MFT_BINARY_MAGIC)
+        events = []
+        end_of_data = len(buf)
+        with memoryview(buf) as view:
+            while end_of_data - pos >= header:
+                value, length = unpack_header(view, pos)
+                root = roots[root_index] if root_index < len(roots) else ""
+                if length == _FAST_MFT_PROGRESS:
+                    if end_of_data - pos < header + _FAST_MFT_TOTAL.size:
+                        break
+                    events.append(("progress", root, value, unpack_total(view, pos + header)[0]))
+                    pos += header + _FAST_MFT_TOTAL.size
+                elif length == _FAST_MFT_ROOT_DONE:
+                    events.append(("root_done", root, value))
+                    root_index += 1
+                    pos += header
+                else:
+                    end = pos + header + length
+                    if end > end_of_data:
+                        break
+                    if want(value):
+                        events.append(("row", value, str(view[pos + header:end], "utf-8", "replace")))
+                    pos = end
+        del buf[:pos]
+        yield from events
+    if buf:
+        raise ValueError(f"truncated MFT helper output ({len(buf)} trailing bytes)")
+
+def _run_fast_mft_helper(exe, args, root_texts, stop, want, on_event, stdin_text=None, log_context="Fast MFT large-file",
+                         output_format=None):
+    """流式运行 fast_large_files，把解析出的事件逐个交给 on_event。
+
+    正常结束返回 "ok"，stop 被设置时立即结束 helper 并返回 "stopped"；启动失败、超时或异常退出返回 None。
+    旧版 helper 不认识 --format 时（解析参数阶段就退出，不会产生事件）自动以 JSON 行重跑。
+    """
+    output_format = output_format or _fast_mft_output_format()
+    cmd = [exe, *args]
+    if output_format == "binary":
+        cmd.extend(["--format", "binary"])
+
+    startupinfo = None
+    creationflags = 0
+    try:
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    except Exception:
+        startupinfo = None
+    creationflags = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+    try:
+        proc = subprocess.Popen(
             cmd,
-            stdin=subprocess.DEVNULL,
+            stdin=subprocess.DEVNULL if stdin_text is None else subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
             startupinfo=startupinfo,
             creationflags=creationflags,
         )
-    except Exception as e:
-        log_sampled_background_error("Fast MFT large-file launch", e)
-        return None
+    except Exception as e:
+        log_sampled_background_error(f"{log_context} launch", e)
+        return None
+
+    mft_wall_timeout = float(os.environ.get("C_CLEANER_PLUS_MFT_TIMEOUT", "60"))
+    finished = threading.Event()
+    timed_out = [False]
+    err_chunks = []
+
+    def _kill():
+        try:
+            proc.kill()
+        except Exception:
+            pass
+
+    def _watch():
+        # 取消时立即结束 helper，不再等待轮询周期；同时负责墙钟超时
+        deadline = time.time() + mft_wall_timeout
+        while not finished.is_set():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                timed_out[0] = True
+                _kill()
+                return
+            wait = getattr(stop, "wait", None)
+            if wait is not None:
+                if wait(min(0.25, remaining)):
+                    _kill()
+                    return
+            else:
+                time.sleep(min(0.1, remaining))
+                if stop.is_set():
+                    _kill()
+                    return
+
+    def _drain_stderr():
+        try:
+            err_chunks.append(proc.stderr.read())
+        except Exception:
+            pass
+
+    threading.Thread(target=_watch, name="fast-mft-watch", daemon=True).start()
+    stderr_thread = threading.Thread(target=_drain_stderr, name="fast-mft-stderr", daemon=True)
+    stderr_thread.start()
+
+    parse = _iter_fast_mft_binary if output_format == "binary" else _iter_fast_mft_json
+    try:
+        if stdin_text is not None:
+            # helper 在解析参数时一次读完 stdin，之后才开始输出，先写完再读 stdout 不会互相阻塞
+            try:
+                proc.stdin.write(stdin_text.encode("utf-8"))
+            finally:
+                proc.stdin.close()
+        for event in parse(proc.stdout, root_texts, want):
+            if stop.is_set():
+                break
+            on_event(event)
+    except Exception as e:
+        log_sampled_background_error(f"{log_context} read", e)
+        _kill()
+    finally:
+        if stop.is_set():
+            _kill()
+        try:
+            proc.wait(timeout=5)
+        except Exception:
+            _kill()
+        finished.set()
+        stderr_thread.join(timeout=1)
+
+    if stop.is_set():
+        return "stopped"
+    if timed_out[0]:
+        log_sampled_background_error(
+            f"{log_context} timeout",
+            RuntimeError(f"MFT helper exceeded {int(mft_wall_timeout)}s wall clock"),
+        )
+        return None
+    if proc.returncode != 0:
+        err = b"".join(chunk for chunk in err_chunks if chunk).decode("utf-8", "replace")
+        if output_format == "binary" and "--format" in err:
+            # 旧版 helper 不认识 --format，退回 JSON 行输出
+            return _run_fast_mft_helper(
+                exe, args, root_texts, stop, want, on_event,
+                stdin_text=stdin_text, log_context=log_context, output_format="json",
+            )
+        if err:
+            log_sampled_background_error(f"{log_context} fallback", RuntimeError(err.strip()))
+        return None
+    return "ok"
+
+def _scan_big_files_fast_mft(roots, min_b, excl, stop, result_limit=None, progress_cb=None, skip_optional=False,
+                             partial_cb=None, progress_range_cb=None):
+    if os.name != "nt" or os.environ.get("C_CLEANER_PLUS_DISABLE_FAST_MFT"):
+        return None
+
+    roots = list(roots or [])
+    if not roots or not all(_is_drive_root_path(root) for root in roots):
+        return None
+
+    exe = _fast_mft_bigfile_exe_path()
+    if not exe:
+        return None
+
+    args = [
+        "--min-bytes", str(int(min_b)),
+        "--limit", str(int(result_limit or 0)),
+        "--skip-optional", "1" if skip_optional else "0",
+    ]
+    root_texts = [os.path.abspath(root) for root in roots]
+    for root in root_texts:
+        args.extend(["--root", root])
+    matcher = compile_scan_exclusions(excl)
+    for item in matcher.prefix_rules:
+        args.extend(["--exclude", os.path.abspath(item)])
+
+    if progress_cb:
+        progress_cb(0)
+
+    # helper 流式输出：读取 MFT 时的进度、每个根的结果行以及根结束标记；
+    # 全局 top-K 在这里用堆边读边维护，每个根结束即可推送一次阶段性结果。
+    # MFT 记录数只走 progress_range_cb 驱动进度条，progress_cb 只报告命中的结果文件数
+    results = []
+    root_progress = {}
+    matched = [0]
+
+    def _want(size):
+        if size < min_b:
+            return False
+        return not (result_limit and result_limit > 0 and len(results) >= result_limit and size <= results[0][0])
+
+    def _on_event(event):
+        kind = event[0]
+        if kind == "progress":
+            root_progress[event[1]] = (event[2], event[3])
+            if progress_range_cb:
+                progress_range_cb(
+                    sum(item[0] for item in root_progress.values()),
+                    sum(item[1] for item in root_progress.values()),
+                )
+            return
+        if kind == "root_done":
+            if progress_cb:
+                progress_cb(matched[0])
+            if partial_cb:
+                partial_cb(sorted(results, key=lambda x: (-x[0], os.path.normcase(x[1]))))
+            return
+        size, path = event[1], event[2]
+        if not path:
+            return
+        if should_skip_bigfile(path, skip_optional=skip_optional):
+            return
+        if matcher.has_globs and matcher.matches_path_or_ancestor(path):
+            return
+        matched[0] += 1
+        _push_bigfile_result(results, (size, path), result_limit)
+
+    status = _run_fast_mft_helper(exe, args, root_texts, stop, _want, _on_event)
+    if status is None:
+        return None
+    if status == "stopped":
+        return []
+
+    results.sort(key=lambda x: (-x[0], os.path.normcase(x[1])))
+    if progress_cb:
+        progress_cb(matched[0])
+    return results
+
+MFT_DIR_SIZE_MIN_QUERIES = 16
+
+def prefetch_mft_dir_sizes(paths, stop_event=None, min_queries=MFT_DIR_SIZE_MIN_QUERIES, use_cache=False):
+    """以管理员身份运行且有 MFT 助手时，一次读盘得到一批目录的子树大小，返回 {目录: DirectorySizeResult}。
+
+    结果可交给 TreeSizeAggregator.remember 在本次分析中复用；use_cache=True 时还会跳过已缓存的目录并把结果
+    写入目录大小缓存，之后 dir_size(..., use_cache=True) 直接命中，只应由能接受过期结果的估算类调用方开启。
+    助手不可用、失败或个别目录没有返回（不在 NTFS 上、经过目录联接、短文件名等）时照常回退到 os.scandir 统计。
+    目录数少于 min_queries 时整卷读取不划算，直接跳过。
+    """
+    if os.name != "nt" or os.environ.get("C_CLEANER_PLUS_DISABLE_FAST_MFT") or not is_admin():
+        return {}
+    signatures = {}
+    queries = []
+    drives = []
+    for path in paths or []:
+        target = os.path.abspath(path)
+        drive = os.path.splitdrive(target)[0]
+        key = os.path.normcase(target)
+        if len(drive) != 2 or key in signatures or (use_cache and _dir_size_cache.get(target) is not None):
+            continue
+        try:
+            signatures[key] = _dir_size_signature(target)
+        except OSError:
+            continue
+        queries.append(target)
+        root = drive.upper() + "\\"
+        if root not in drives:
+            drives.append(root)
+    if len(queries) < max(1, int(min_queries)):
+        return {}
+    exe = _fast_mft_bigfile_exe_path()
+    if not exe:
+        return {}
+
+    results = {}
+
+    def _on_event(event):
+        if event[0] != "row":
+            return
+        key = os.path.normcase(event[2])
+        signature = signatures.get(key)
+        if signature is None:
+            return
+        result = DirectorySizeResult(size=int(event[1]))
+        results[event[2]] = result
+        if use_cache:
+            _dir_size_cache.put(event[2], result, signature=signature)
+
+    _run_fast_mft_helper(
+        exe, ["--dir-sizes", "--query-list", "-"], drives, stop_event or threading.Event(),
+        lambda size: True, _on_event, stdin_text="\n".join(queries), log_context="Fast MFT dir-size",
+    )
+    return results
+
+def _make_big_file_visitor(min_b, excl, stop_flag, results, counter, lock, result_limit=None, skip_optional=False, index_writer=None,
+                           metrics=None):
+    is_excluded = compile_scan_exclusions(excl).matches
+
+    def _visit(dirpath, push):
+        dir_stat = None
+        try:
+            if index_writer is not None: entries, dir_stat = index_writer.open_listing(dirpath)
+            else: entries = os.scandir(dirpath)
+        except Exception:
+            if index_writer is not None and dir_stat is not None: index_writer.add(dirpath, True, dir_stat)
+            return
+        local_count = 0
+        local_bytes = 0
+        local_results = []
+        listed = 0
+        seen = 0
+        listing_ok = True
+        try:
+            for entry in entries:
+                if stop_flag.is_set(): listing_ok = False; break
+                seen += 1
+                try:
+                    if entry.is_symlink(): continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if not is_excluded(entry.path):
+                            push(entry.path)
+                            listed += 1
+                    elif entry.is_file(follow_symlinks=False):
+                        if index_writer is not None:
+                            st = entry.stat(follow_symlinks=False)
+                            index_writer.add(entry.path, False, st)
+                            listed += 1
+                            if should_skip_bigfile(entry.path, skip_optional=skip_optional): continue
+                        else:
+                            if should_skip_bigfile(entry.path, skip_optional=skip_optional): continue
+                            st = entry.stat(follow_symlinks=False)
+                        local_count += 1
+                        local_bytes += st.st_size
+                        if st.st_size >= min_b:
+                            _push_bigfile_result(local_results, (st.st_size, entry.path), result_limit)
+                except Exception as e:
+                    listing_ok = False
+                    log_sampled_background_error("大文件扫描子项", e)
+        finally:
+            try: entries.close()
+            except Exception as e:
+                log_sampled_background_error("关闭目录句柄", e, limit=3)
+        if index_writer is not None:
+            index_writer.finish_listing(dirpath, dir_stat, listed if listing_ok else -1)
+        if metrics is not None and local_count:
+            metrics.add_files(local_count, local_bytes)
+        if local_count or local_results:
+            with lock:
+                counter[0] += local_count
+                if result_limit and result_limit > 0:
+                    for item in local_results:
+                        _push_bigfile_result(results, item, result_limit)
+                else:
+                    results.extend(local_results)
+        return seen
+
+    return _visit
+
+def _revalidate_index_rows(fs_index, rows):
+    """重新 stat 索引给出的 (size, path, is_dir)，返回仍然存在的条目，文件使用当前大小。
+
+    索引最长保留 FS_INDEX_MAX_AGE_SEC，期间在本程序之外被删除、替换或改写的文件不能原样展示和清理：
+    已不存在或类型改变的条目从索引删除，大小变化的文件写回索引。
+    """
+    import stat
+
+    fresh = []
+    updates = []
+    missing = []
+    for size, path, is_dir in rows:
+        try:
+            st = os.stat(path, follow_symlinks=False)
+        except OSError:
+            missing.append(path)
+            continue
+        if stat.S_ISDIR(st.st_mode) != bool(is_dir):
+            missing.append(path)
+            continue
+        if not is_dir and int(st.st_size) != size:
+            size = int(st.st_size)
+            updates.append((size, int(st.st_mtime_ns), path))
+        fresh.append((size, path, is_dir))
+    if updates or missing:
+        try:
+            fs_index.refresh_files(updates, missing)
+        except Exception as e:
+            log_sampled_background_error("更新文件系统索引", e, limit=3)
+    return fresh
+
+def _scan_big_files_from_index(fs_index, roots, min_b, excl, result_limit=None, progress_cb=None, skip_optional=False):
+    if fs_index is None or not fs_index.covers(roots, excl):
+        return None
+    try:
+        rows = fs_index.top_files(roots, excl, min_b)
+    except Exception as e:
+        log_sampled_background_error("读取文件系统索引", e, limit=3)
+        return None
+    matcher = compile_scan_exclusions(excl)
+    candidates = [
+        (size, path, False) for size, path in rows
+        if not should_skip_bigfile(path, skip_optional=skip_optional)
+        and not (matcher.has_globs and matcher.matches_path_or_ancestor(path))
+    ]
+    results = []
+    for size, path, _is_dir in _revalidate_index_rows(fs_index, candidates):
+        if size >= min_b:
+            _push_bigfile_result(results, (size, path), result_limit)
+    results.sort(key=lambda x: (-x[0], os.path.normcase(x[1])))
+    if progress_cb:
+        progress_cb(len(rows))
+    return results
+
+def scan_big_files(roots, min_b, excl, stop, workers=4, result_limit=None, progress_cb=None, skip_optional=False, fs_index=None,
+                   incremental=False, use_processes=None, partial_cb=None, progress_range_cb=None):
+    metrics = ScanMetrics("大文件扫描", roots)
+    last_scanned = [0]
+
+    def _progress(scanned):
+        last_scanned[0] = scanned
+        if progress_cb:
+            progress_cb(scanned)
+
+    def _finish(results, backend):
+        metrics.backend = backend
+        if backend != "threads":
+            metrics.add_files(last_scanned[0])
+        publish_scan_metrics(metrics)
+        return results
+
+    indexed_results = _scan_big_files_from_index(
+        fs_index,
+        roots,
+        min_b,
+        excl,
+        result_limit=result_limit,
+        progress_cb=_progress,
+        skip_optional=skip_optional,
+    )
+    if indexed_results is not None:
+        return _finish(indexed_results, "index")
+
+    fast_results = _scan_big_files_fast_mft(
+        roots,
+        min_b,
+        excl,
+        stop,
+        result_limit=result_limit,
+        progress_cb=_progress,
+        skip_optional=skip_optional,
+        partial_cb=partial_cb,
+        progress_range_cb=progress_range_cb,
+    )
+    if fast_results is not None:
+        return _finish(fast_results, "mft")
+
+    if process_scan_enabled(roots, use_processes):
+        process_results = _scan_big_files_in_processes(
+            roots, min_b, excl, stop, workers,
+            result_limit=result_limit, progress_cb=_progress, skip_optional=skip_optional,
+            fs_index=fs_index, incremental=incremental,
+        )
+        if process_results is not None:
+            return _finish(process_results, "process")
+
+    results = []; counter = [0]; lock = threading.Lock()
+    index_writer = _begin_index_scan(fs_index, roots, excl, incremental=incremental)
+    visit = _make_big_file_visitor(
+        min_b, compile_scan_exclusions(excl), stop, results, counter, lock, result_limit, skip_optional, index_writer,
+        metrics=metrics,
+    )
+
+    def _report():
+        with lock:
+            scanned = counter[0]
+        progress_cb(scanned)
+
+    completed, all_exited = run_device_walkers(
+        roots, visit, workers, stop_event=stop, log_context="大文件扫描", progress_cb=_report if progress_cb else None,
+        metrics=metrics,
+    )
+    if index_writer is not None:
+        index_writer.close(complete=completed and all_exited)
+    results.sort(key=lambda x: (-x[0], os.path.normcase(x[1])))
+    if progress_cb:
+        with lock:
+            scanned = counter[0]
+        progress_cb(scanned)
+    return _finish(results, "threads")
+
+def _iter_walk_headless(roots, excl, workers=4, ext_filter=None, want_files=True, want_dirs=True):
+    """Streaming multi-threaded walker for headless (non-UI) scheduled jobs.
+
+    Runs incrementally against the filesystem index: directories whose mtime and
+    child count are unchanged since the previous run reuse their cached listing
+    without re-reading file metadata or rewriting index rows. File sizes from
+    reused listings may be stale, which is fine for the name-based jobs using it.
+    """
+    return iter_walk(
+        roots,
+        excl,
+        workers,
+        ext_filter=ext_filter,
+        want_files=want_files,
+        want_dirs=want_dirs,
+        log_context="定时任务",
+        fs_index=get_filesystem_index(),
+        incremental=True,
+    )
+
+def _begin_index_scan(fs_index, roots, excl, incremental=False):
+    if fs_index is None:
+        return None
+    try:
+        return fs_index.begin_scan(roots, excl, incremental=incremental)
+    except Exception as e:
+        log_sampled_background_error("写入文件系统索引", e, limit=3)
+        return None
+
+def _walk_files_from_index(fs_index, roots, excl, stop_event=None, ext_filter=None, collect_files=False, collect_dirs=False,
+                           file_cb=None, dir_cb=None, file_result_mode="size_path"):
+    matcher = compile_scan_exclusions(excl)
+    compact = file_result_mode == "compact"
+    res_files = CompactScanResults() if compact else []
+    res_dirs = CompactScanResults(path_table=res_files.path_table) if compact else []
+    for batch in fs_index.iter_entries(
+        roots,
+        excl,
+        want_files=bool(collect_files or file_cb),
+        want_dirs=bool(collect_dirs or dir_cb),
+        ext_filter=ext_filter,
+        stop_event=stop_event,
+    ):
+        for size, path, is_dir in _revalidate_index_rows(fs_index, batch):
+            if matcher.has_globs and matcher.matches_path_or_ancestor(path):
+                continue
+            if is_dir:
+                if collect_dirs:
+                    res_dirs.append(path)
+                if dir_cb:
+                    dir_cb(path)
+            else:
+                if collect_files:
+                    if compact:
+                        res_files.append(path, size=size)
+                    else:
+                        res_files.append(path if file_result_mode == "path" else (size, path))
+                if file_cb:
+                    file_cb(size, path)
+    return res_files, res_dirs
+
+def walk_files_threaded(roots, excl, workers, stop_event=None, ext_filter=None, collect_files=False, collect_dirs=False,
+                        file_cb=None, dir_cb=None, file_result_mode="size_path", log_context="遍历目录", fs_index=None,
+                        incremental=False, use_processes=None):
+    metrics = ScanMetrics(log_context, roots)
+    # 只用回调消费结果时返回的列表为空，索引后端按回调次数统计
+    streamed = [0, 0]
+
+    def _finish(result, backend):
+        metrics.backend = backend
+        if backend != "threads":
+            files, dirs = result
+            metrics.files = max(len(files), streamed[0])
+            metrics.dirs = max(len(dirs), streamed[1])
+        publish_scan_metrics(metrics)
+        return result
+
+    def _counted_file_cb(size, path):
+        streamed[0] += 1
+        file_cb(size, path)
+
+    def _counted_dir_cb(path):
+        streamed[1] += 1
+        dir_cb(path)
+
+    if fs_index is not None and fs_index.covers(roots, excl):
+        try:
+            return _finish(_walk_files_from_index(
+                fs_index, roots, excl,
+                stop_event=stop_event, ext_filter=ext_filter,
+                collect_files=collect_files, collect_dirs=collect_dirs,
+                file_cb=_counted_file_cb if file_cb else None, dir_cb=_counted_dir_cb if dir_cb else None,
+                file_result_mode=file_result_mode,
+            ), "index")
+        except Exception as e:
+            log_sampled_background_error(f"{log_context}读取文件系统索引", e, limit=3)
+
+    # 回调无法跨进程调用，只有纯收集模式才走多进程
+    if not file_cb and not dir_cb and process_scan_enabled(roots, use_processes):
+        def _process_progress(scanned):
+            # 子进程只汇报已找到的文件数，实时快照据此显示进度
+            metrics.files = scanned
+            publish_scan_metrics(metrics, final=False)
+
+        process_results = _walk_files_in_processes(
+            roots, excl, workers, stop_event=stop_event, ext_filter=ext_filter,
+            collect_files=collect_files, collect_dirs=collect_dirs, file_result_mode=file_result_mode,
+            log_context=log_context, fs_index=fs_index, incremental=incremental, progress_cb=_process_progress,
+        )
+        if process_results is not None:
+            return _finish(process_results, "process")
+        metrics.files = 0
 
-    mft_wall_timeout = float(os.environ.get("C_CLEANER_PLUS_MFT_TIMEOUT", "60"))
-    deadline = time.time() + mft_wall_timeout
-    while True:
+    index_writer = _begin_index_scan(fs_index, roots, excl, incremental=incremental)
+    is_excluded = compile_scan_exclusions(excl).matches
+    lock = threading.Lock()
+    # compact 模式下子目录以路径树节点编号入队，结果按 “父节点 + 名称” 保存，完整路径在读取时才拼接
+    compact = file_result_mode == "compact"
+    path_tree = CompactPathTable() if compact else None
+    res_files = CompactScanResults(path_table=path_tree) if compact else []
+    res_dirs = CompactScanResults(path_table=path_tree) if compact else []
+
+    def _visit(d, push):
+        node = -1
+        if compact:
+            if type(d) is int:
+                node = d
+                d = path_tree.dir_path(node)
+            else:
+                with lock:
+                    node = path_tree.dir_id(d)
+        local_files = []
+        file_count = 0
+        file_bytes = 0
+        dir_stat = None
+        try:
+            if index_writer is not None:
+                entries, dir_stat = index_writer.open_listing(d)
+            else:
+                entries = os.scandir(d)
+        except Exception as e:
+            log_sampled_background_error(f"{log_context}遍历目录", e)
+            if index_writer is not None and dir_stat is not None:
+                index_writer.add(d, True, dir_stat)
+            return
+        listed = 0
+        seen = 0
+        listing_ok = True
+        try:
+            for entry in entries:
+                if stop_event is not None and stop_event.is_set():
+                    listing_ok = False
+                    break
+                seen += 1
+                try:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if not is_excluded(entry.path):
+                            # 先回调再发布子目录，保证流式消费者总是先看到目录、后看到其中的条目
+                            child = entry.path
+                            if compact:
+                                with lock:
+                                    child = path_tree.add_child(node, entry.name)
+                                    if collect_dirs:
+                                        res_dirs.append_child(node, entry.name)
+                            elif collect_dirs:
+                                with lock:
+                                    res_dirs.append(entry.path)
+                            if dir_cb:
+                                dir_cb(entry.path)
+                            push(child)
+                            listed += 1
+                    elif entry.is_file(follow_symlinks=False):
+                        if index_writer is not None:
+                            index_writer.add(entry.path, False, entry.stat(follow_symlinks=False))
+                            listed += 1
+                        if ext_filter and not entry.name.lower().endswith(ext_filter):
+                            continue
+                        size = entry.stat(follow_symlinks=False).st_size
+                        file_count += 1
+                        file_bytes += size
+                        if collect_files:
+                            if compact:
+                                local_files.append((entry.name, size))
+                            else:
+                                with lock:
+                                    if file_result_mode == "path":
+                                        res_files.append(entry.path)
+                                    else:
+                                        res_files.append((size, entry.path))
+                        if file_cb:
+                            file_cb(size, entry.path)
+                except Exception as e:
+                    listing_ok = False
+                    log_sampled_background_error(f"{log_context}扫描条目", e)
+        finally:
+            try:
+                entries.close()
+            except Exception as e:
+                log_sampled_background_error(f"{log_context}关闭扫描句柄", e, limit=3)
+        if file_count:
+            metrics.add_files(file_count, file_bytes)
+        if local_files:
+            with lock:
+                for name, size in local_files:
+                    res_files.append_child(node, name, size)
+        if index_writer is not None:
+            index_writer.finish_listing(d, dir_stat, listed if listing_ok else -1)
+        return seen
+
+    completed, all_exited = run_device_walkers(roots, _visit, workers, stop_event=stop_event, log_context=log_context,
+                                               join_timeout=1, metrics=metrics)
+    if index_writer is not None:
+        index_writer.close(complete=completed and all_exited)
+    return _finish((res_files, res_dirs), "threads")
+
+ITER_WALK_BATCH_SIZE = 512
+ITER_WALK_MAX_PENDING_BATCHES = 8
+
+class _AnyStopEvent:
+    """任一事件置位即视为停止，供遍历引擎同时响应调用方停止和消费者提前退出。"""
+    __slots__ = ("_events",)
+
+    def __init__(self, *events):
+        self._events = [event for event in events if event is not None]
+
+    def is_set(self):
+        return any(event.is_set() for event in self._events)
+
+def iter_walk(roots, excl, workers, stop_event=None, ext_filter=None, want_files=True, want_dirs=True,
+              batch_size=ITER_WALK_BATCH_SIZE, max_pending=ITER_WALK_MAX_PENDING_BATCHES, log_context="遍历目录",
+              fs_index=None, incremental=False):
+    """流式遍历：后台线程运行 walk_files_threaded，分批产出 [(size, path, is_dir), ...]。
+
+    队列最多缓存 max_pending 批，消费者跟不上时遍历线程会阻塞在投递处（背压），
+    峰值内存与目录规模无关。目录总是先于其中的条目产出。
+    stop_event 置位或提前关闭生成器都会终止后台遍历。
+    """
+    batches = queue.Queue(maxsize=max(1, int(max_pending)))
+    cancel = threading.Event()
+    pending = []
+    lock = threading.Lock()
+    done = object()
+    batch_size = max(1, int(batch_size))
+
+    def _deliver(item):
+        if not cancel.is_set():
+            batches.put(item)
+
+    def _add(item):
+        with lock:
+            pending.append(item)
+            if len(pending) >= batch_size:
+                # 在锁内投递以保持批次顺序；队列满时所有遍历线程在此等待
+                _deliver(pending[:])
+                pending.clear()
+
+    def _produce():
         try:
-            out, err = proc.communicate(timeout=0.1)
+            walk_files_threaded(
+                roots, excl, workers,
+                stop_event=_AnyStopEvent(stop_event, cancel),
+                ext_filter=ext_filter,
+                file_cb=(lambda size, path: _add((size, path, False))) if want_files else None,
+                dir_cb=(lambda path: _add((0, path, True))) if want_dirs else None,
+                log_context=log_context,
+                fs_index=fs_index,
+                incremental=incremental,
+            )
+        except Exception as e:
+            log_sampled_background_error(f"{log_context}流式遍历", e)
+        finally:
+            with lock:
+                if pending:
+                    _deliver(pending[:])
+                    pending.clear()
+            _deliver(done)
+
+    producer = threading.Thread(target=_produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done:
+                break
+            yield batch
+    finally:
+        cancel.set()
+        while producer.is_alive():
+            try:
+                while True:
+                    batches.get_nowait()
+            except queue.Empty:
+                pass
+            producer.join(0.05)
+
+class _EmptyDirCandidates:
+    """只保留子树中尚未出现文件的目录；含文件的目录及其祖先在遍历过程中即被剔除。"""
+    __slots__ = ("candidates",)
+
+    def __init__(self):
+        self.candidates = set()
+
+    def add_dir(self, path):
+        self.candidates.add(path)
+
+    def add_file(self, path):
+        parent = os.path.dirname(path)
+        while parent in self.candidates:
+            self.candidates.discard(parent)
+            parent = os.path.dirname(parent)
+
+    def deepest_first(self):
+        return sorted(self.candidates, key=len, reverse=True)
+
+def collect_empty_dir_candidates(batches, stop_event=None):
+    """消费 iter_walk 的批次，返回按深度从深到浅排序的空文件夹候选，内存只与候选目录数量有关。"""
+    analyzer = _EmptyDirCandidates()
+    try:
+        for batch in batches:
+            if stop_event is not None and stop_event.is_set():
+                break
+            for _size, path, is_dir in batch:
+                if is_dir:
+                    analyzer.add_dir(path)
+                else:
+                    analyzer.add_file(path)
+    finally:
+        close = getattr(batches, "close", None)
+        if close is not None:
+            close()
+    return analyzer.deepest_first()
+
+def confirm_empty_dirs(candidates, stop_event=None, progress_cb=None, on_empty=None, log_context="空文件夹扫描"):
+    """按从深到浅的顺序复核候选目录，子目录全部为空的目录同样视为空。"""
+    empty_set = set()
+    total = len(candidates)
+    for i, d in enumerate(candidates):
+        if stop_event is not None and stop_event.is_set():
             break
-        except subprocess.TimeoutExpired:
-            if stop.is_set():
+        if progress_cb and i % 500 == 0:
+            progress_cb(i, total)
+        try:
+            if is_directory_empty(d, known_empty_dirs=empty_set):
+                empty_set.add(d)
+                if on_empty:
+                    on_empty(d)
+        except Exception as e:
+            log_sampled_background_error(log_context, e)
+    return empty_set
+
+def roll_up_dir_totals(direct_totals, roots):
+    """把每个目录直属文件的大小逐层累加到祖先目录（不越过 roots），返回 {目录: 子树总大小}。"""
+    root_keys = {os.path.normcase(os.path.abspath(root)) for root in roots or []}
+    totals = dict(direct_totals)
+    by_depth = defaultdict(set)
+    for path in totals:
+        by_depth[path.count(os.sep)].add(path)
+    depth = max(by_depth) if by_depth else -1
+    while depth >= 0:
+        for path in by_depth.pop(depth, ()):
+            if os.path.normcase(os.path.abspath(path)) in root_keys:
+                continue
+            parent = os.path.dirname(path)
+            if not parent or parent == path:
+                continue
+            if parent not in totals:
+                totals[parent] = 0
+                by_depth[parent.count(os.sep)].add(parent)
+            totals[parent] += totals[path]
+        depth -= 1
+    return totals
+
+@dataclass
+class CombinedScanResult:
+    duplicate_candidates: "CompactScanResults"
+    empty_dir_candidates: list
+    shortcuts: list
+    big_files: list
+    dir_totals: dict
+    dir_signatures: dict
+    files: int = 0
+    dirs: int = 0
+
+def publish_dir_totals(result, stop_event=None):
+    """把综合扫描中根目录及其直属子目录的总大小写入目录大小缓存，返回写入的条目数。
+
+    签名在遍历到该目录时（其内容被统计之前）读取，随后显式启用缓存的调用方（清理规则大小估算）在 TTL 内直接复用；
+    子树中可能有条目被排除规则跳过的目录不记录签名，因而不会写入；扫描被取消时结果不完整，也不写入。
+    """
+    if stop_event is not None and stop_event.is_set():
+        return 0
+    published = 0
+    for path, signature in result.dir_signatures.items():
+        size = result.dir_totals.get(path)
+        if size is None:
+            continue
+        _dir_size_cache.put(path, DirectorySizeResult(size=int(size)), signature=signature)
+        published += 1
+    return published
+
+def run_combined_analysis(roots, excl, workers, stop_event=None, min_big_bytes=500 * 1024 * 1024, big_limit=200,
+                          skip_optional=False, fs_index=None, progress_cb=None):
+    """一次遍历同时喂给多个分析器：重复文件的大小分组、空文件夹候选、.lnk 收集、
+    大文件 Top-K 以及每个目录的总大小。所有分析都在消费线程中完成，无需加锁。
+    根目录及其直属子目录在内容被统计前记录签名，供 publish_dir_totals 写入目录大小缓存；
+    排除规则可能跳过其部分内容的目录总大小偏小，不记录签名。
+    """
+    duplicate_candidates = CompactScanResults()
+    empty = _EmptyDirCandidates()
+    shortcuts = []
+    big_files = []
+    direct_totals = defaultdict(int)
+    root_keys = {os.path.normcase(os.path.abspath(root)) for root in roots or []}
+    matcher = compile_scan_exclusions(excl)
+    dir_signatures = {}
+    for root in roots or []:
+        if matcher.may_exclude_within(root):
+            continue
+        try:
+            dir_signatures[root] = _dir_size_signature(root)
+        except OSError:
+            pass
+    files = dirs = 0
+    for batch in iter_walk(roots, excl, workers, stop_event=stop_event, log_context="综合扫描", fs_index=fs_index):
+        for size, path, is_dir in batch:
+            if is_dir:
+                dirs += 1
+                empty.add_dir(path)
+                if os.path.normcase(os.path.dirname(path)) in root_keys and not matcher.may_exclude_within(path):
+                    try:
+                        dir_signatures[path] = _dir_size_signature(path)
+                    except OSError:
+                        pass
+                continue
+            files += 1
+            empty.add_file(path)
+            direct_totals[os.path.dirname(path)] += size
+            if path[-4:].lower() == ".lnk":
+                shortcuts.append(path)
+            if size >= min_big_bytes and not should_skip_bigfile(path, skip_optional=skip_optional):
+                _push_bigfile_result(big_files, (size, path), big_limit)
+            if size > 0:
+                duplicate_candidates.append(path, size=size)
+        if progress_cb:
+            progress_cb(files, dirs)
+    big_files.sort(key=lambda x: (-x[0], os.path.normcase(x[1])))
+    return CombinedScanResult(
+        duplicate_candidates=duplicate_candidates,
+        empty_dir_candidates=empty.deepest_first(),
+        shortcuts=shortcuts,
+        big_files=big_files,
+        dir_totals=roll_up_dir_totals(direct_totals, roots),
+        dir_signatures=dir_signatures,
+        files=files,
+        dirs=dirs,
+    )
+
+# ══════════════════════════════════════════════════════════
+#  重复文件哈希
+# ══════════════════════════════════════════════════════════
+DUPLICATE_HASH_CHUNK_SIZE = 1024 * 1024
+DUPLICATE_QUICK_SAMPLE_SIZE = 64 * 1024
+DUPLICATE_HASH_MAX_WORKERS = 16
+DUPLICATE_HARD_LINK_TYPE = "硬链接"
+DUPLICATE_SAMPLE_MIN_SIZE = 512 * 1024
+DUPLICATE_LOCKSTEP_MAX_FILES = 64
+DUPLICATE_LOCKSTEP_FIRST_CHUNK = 64 * 1024
+DUPLICATE_LOCKSTEP_BUFFER_BUDGET = 64 * 1024 * 1024
+
+def _duplicate_compare_mode():
+    """默认逐块同步比较；C_CLEANER_PLUS_DUPLICATE_COMPARE=hash 时退回逐文件全量哈希。"""
+    mode = os.environ.get("C_CLEANER_PLUS_DUPLICATE_COMPARE", "").strip().lower()
+    return "hash" if mode == "hash" else "lockstep"
+
+def duplicate_file_hash(path, stop_event=None, head_bytes=None, tail_bytes=0, sample_offsets=None):
+    """返回文件（或其采样片段）的 sha256 十六进制摘要；读取失败或被取消时返回 None。"""
+    m = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            if sample_offsets:
                 try:
-                    proc.kill()
-                    proc.communicate(timeout=1)
+                    file_size = os.path.getsize(path)
                 except Exception:
-                    pass
-                return []
-            if time.time() >= deadline:
+                    file_size = 0
+                seen_offsets = set()
+                for offset, size in sample_offsets:
+                    if stop_event is not None and stop_event.is_set():
+                        return None
+                    if size <= 0 or file_size <= 0:
+                        continue
+                    real_offset = max(0, min(offset, max(0, file_size - size)))
+                    if real_offset in seen_offsets:
+                        continue
+                    seen_offsets.add(real_offset)
+                    f.seek(real_offset)
+                    hash_stream(f, m, size, length=size)
+            elif head_bytes is not None:
+                if stop_event is not None and stop_event.is_set():
+                    return None
+                hash_stream(f, m, head_bytes, length=head_bytes)
+                head_len = f.tell()
+                if tail_bytes > 0:
+                    try:
+                        file_size = os.path.getsize(path)
+                    except Exception:
+                        file_size = head_len
+                    if file_size > head_len:
+                        if stop_event is not None and stop_event.is_set():
+                            return None
+                        f.seek(max(0, file_size - tail_bytes))
+                        hash_stream(f, m, tail_bytes, length=tail_bytes)
+            else:
+                advise_sequential(f)
+                if not hash_stream(f, m, DUPLICATE_HASH_CHUNK_SIZE, stop_event=stop_event):
+                    return None
+        return m.hexdigest()
+    except Exception:
+        return None
+
+def duplicate_quick_hash(path, file_size, stop_event=None):
+    """分层采样哈希：小文件全量，中等文件取开头，大文件取头、中、尾三段。"""
+    if file_size <= 8 * 1024:
+        return duplicate_file_hash(path, stop_event)
+    if file_size <= 512 * 1024:
+        return duplicate_file_hash(path, stop_event, head_bytes=DUPLICATE_QUICK_SAMPLE_SIZE)
+    sample_size = DUPLICATE_QUICK_SAMPLE_SIZE
+    mid_offset = max(0, (file_size // 2) - (sample_size // 2))
+    tail_offset = max(0, file_size - sample_size)
+    return duplicate_file_hash(
+        path,
+        stop_event,
+        sample_offsets=[
+            (0, sample_size),
+            (mid_offset, sample_size),
+            (tail_offset, sample_size)
+        ]
+    )
+
+class DeviceReadLimiter:
+    """按卷限制同时读文件的线程数。
+
+    有盘符的卷使用遍历调优记录的线程数（机械硬盘通常较低），其余卷使用 DEFAULT_SCAN_THREADS，
+    且都不超过哈希线程池的总线程数。slot(path) 返回可用于 with 语句的信号量。
+    """
+
+    def __init__(self, total):
+        self._total = max(1, int(total or 1))
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    def slot(self, path):
+        key = _scan_device_key(path)
+        with self._lock:
+            sem = self._slots.get(key)
+            if sem is None:
+                limit = DEFAULT_SCAN_THREADS
+                if len(key) == 2 and key.endswith(":"):
+                    limit = get_scan_threads_cached(key)[0]
+                sem = self._slots[key] = threading.BoundedSemaphore(max(1, min(self._total, int(limit))))
+        return sem
+
+def compare_files_lockstep(file_size, paths, stop_event=None, chunk_size=DUPLICATE_HASH_CHUNK_SIZE, read_slot=None):
+    """同时打开一组大小相同的文件逐块同步读取，内容一出现分歧就拆成子组，落单的文件立即关闭。
+
+    返回 [(digest, paths, signatures)]，被取消时返回 None。组内内容一致，所以每个子组只在同一遍读取中
+    计算一份 sha256；signatures 为打开时的 _file_stat_signature，读取期间身份变化的文件会被剔除。
+    块大小从 DUPLICATE_LOCKSTEP_FIRST_CHUNK 起逐轮翻倍到 chunk_size，且同时驻留的块不超过
+    DUPLICATE_LOCKSTEP_BUFFER_BUDGET，开头就不同的文件几乎不产生额外 IO。
+    """
+    streams = []
+    members = []
+    try:
+        for path in paths:
+            try:
+                stream = open(path, "rb")
+            except OSError:
+                continue
+            streams.append(stream)
+            try:
+                signature = _file_stat_signature(os.fstat(stream.fileno()))
+            except OSError:
+                continue
+            if signature[0] == file_size:
+                members.append((path, stream, signature))
+        if len(members) < 2:
+            return []
+
+        limit = max(DUPLICATE_LOCKSTEP_FIRST_CHUNK, min(int(chunk_size), DUPLICATE_LOCKSTEP_BUFFER_BUDGET // len(members)))
+        size = min(DUPLICATE_LOCKSTEP_FIRST_CHUNK, limit)
+        groups = [(hashlib.sha256(), members)]
+        finished = []
+        while groups:
+            next_groups = []
+            for digest, group in groups:
+                buckets = []
+                for member in group:
+                    if stop_event is not None and stop_event.is_set():
+                        return None
+                    try:
+                        if read_slot is None:
+                            chunk = member[1].read(size)
+                        else:
+                            with read_slot(member[0]):
+                                chunk = member[1].read(size)
+                    except OSError:
+                        member[1].close()
+                        continue
+                    for bucket_chunk, bucket in buckets:
+                        if bucket_chunk == chunk:
+                            bucket.append(member)
+                            break
+                    else:
+                        buckets.append((chunk, [member]))
+                for chunk, bucket in buckets:
+                    if len(bucket) < 2:
+                        bucket[0][1].close()
+                        continue
+                    sub_digest = digest.copy() if len(buckets) > 1 else digest
+                    if not chunk:
+                        finished.append((sub_digest, bucket))
+                        continue
+                    sub_digest.update(chunk)
+                    next_groups.append((sub_digest, bucket))
+            groups = next_groups
+            size = min(limit, size * 2)
+
+        matched = []
+        for digest, group in finished:
+            stable = []
+            for path, stream, signature in group:
                 try:
-                    proc.kill()
-                    proc.communicate(timeout=1)
-                except Exception:
+                    if _file_stat_signature(os.fstat(stream.fileno())) == signature:
+                        stable.append((path, signature))
+                except OSError:
                     pass
-                log_sampled_background_error(
-                    "Fast MFT large-file timeout",
-                    RuntimeError(f"MFT helper exceeded {int(mft_wall_timeout)}s wall clock"),
-                )
-                return None
+            if len(stable) < 2:
+                continue
+            stable.sort(key=lambda item: os.path.normcase(item[0]))
+            matched.append((digest.hexdigest(), [path for path, _ in stable], [signature for _, signature in stable]))
+        return matched
+    finally:
+        for stream in streams:
+            stream.close()
 
-    if proc.returncode != 0:
-        if err:
-            log_sampled_background_error("Fast MFT large-file fallback", RuntimeError(err.strip()))
-        return None
+def collapse_hard_links(paths):
+    """按 (st_dev, st_ino) 合并指向同一物理文件的路径（硬链接，或经两个扫描根到达的同一文件）。
 
-    results = []
-    for line in (out or "").splitlines():
-        line = line.strip()
-        if not line:
+    返回 (representatives, links)：每个物理文件只保留 normcase 最小的一条路径参与比较；links 收集
+    两条以上不同路径指向同一文件的集合，组内按 normcase 排序。无法 stat 或没有 inode 的路径原样保留。
+    """
+    representatives = []
+    by_identity = {}
+    for path in paths:
+        try:
+            st = os.stat(path, follow_symlinks=False)
+        except OSError:
+            representatives.append(path)
             continue
+        if not st.st_ino:
+            representatives.append(path)
+            continue
+        by_identity.setdefault((st.st_dev, st.st_ino), {}).setdefault(os.path.normcase(path), path)
+    links = []
+    for same in by_identity.values():
+        ordered = [same[key] for key in sorted(same)]
+        representatives.append(ordered[0])
+        if len(ordered) > 1:
+            links.append(ordered)
+    links.sort(key=lambda item: os.path.normcase(item[0]))
+    return representatives, links
+
+def resolve_duplicate_size_group(file_size, paths, stop_event=None, read_slot=None, hash_cache=None, mode=None,
+                                 hard_links=None):
+    """确认一个大小分组中的重复文件，返回 [(size, digest, paths)]，每组路径按 normcase 排序。
+
+    lockstep 模式（默认）下，大于 DUPLICATE_SAMPLE_MIN_SIZE 的文件先按采样哈希分桶，桶内再用
+    compare_files_lockstep 同步比较并顺带得到全量摘要；超过 DUPLICATE_LOCKSTEP_MAX_FILES 的桶逐个做全量哈希。
+    hash 模式只对采样哈希相同的候选做全量哈希。read_slot(path) 给出时，每次读文件都在其返回的上下文中进行，
+    用于按卷限流。hash_cache 为 ContentHashCache 时，文件身份未变的候选直接复用上次的摘要，只花一次 stat。
+    hard_links 为列表时先用 collapse_hard_links 合并同一物理文件的路径，每个物理文件只读一次，
+    合并出的集合以 (size, paths) 追加到 hard_links 中，不再作为重复文件报告。
+    """
+    def _read(path, quick):
+        if read_slot is None:
+            return duplicate_quick_hash(path, file_size, stop_event) if quick else duplicate_file_hash(path, stop_event)
+        with read_slot(path):
+            return duplicate_quick_hash(path, file_size, stop_event) if quick else duplicate_file_hash(path, stop_event)
+
+    def _hash(path, quick):
+        if stop_event is not None and stop_event.is_set():
+            return None
+        if hash_cache is None:
+            return _read(path, quick)
+        kind = HASH_KIND_QUICK if quick else HASH_KIND_FULL
         try:
-            row = json.loads(line)
-            size = int(row.get("size", 0))
-            path = str(row.get("path", ""))
-        except Exception as e:
-            log_sampled_background_error("Fast MFT large-file parse", e)
+            signature = _file_stat_signature(os.stat(path, follow_symlinks=False))
+        except OSError:
+            return None
+        digest = hash_cache.get(signature, kind)
+        if digest:
+            return digest
+        digest = _read(path, quick)
+        try:
+            if digest and _file_stat_signature(os.stat(path, follow_symlinks=False)) == signature:
+                hash_cache.put(signature, kind, digest)
+        except OSError:
+            pass
+        return digest
+
+    if len(paths) < 2:
+        return []
+    if hard_links is not None:
+        paths, links = collapse_hard_links(paths)
+        hard_links.extend((file_size, same) for same in links)
+        if len(paths) < 2:
+            return []
+    if (mode or _duplicate_compare_mode()) == "lockstep":
+        return _resolve_duplicate_group_lockstep(file_size, paths, stop_event, read_slot, hash_cache, _hash)
+
+    quick_dict = defaultdict(list)
+    for p in paths:
+        sig = _hash(p, True)
+        if sig:
+            quick_dict[sig].append(p)
+
+    confirmed = []
+    for quick_paths in quick_dict.values():
+        if len(quick_paths) < 2:
             continue
-        if not path or size < min_b:
+        full_dict = defaultdict(list)
+        for p in quick_paths:
+            fh = _hash(p, False)
+            if fh:
+                full_dict[fh].append(p)
+        for full_digest, duplicates in full_dict.items():
+            if len(duplicates) > 1:
+                duplicates.sort(key=os.path.normcase)
+                confirmed.append((file_size, full_digest, duplicates))
+    confirmed.sort(key=lambda item: os.path.normcase(item[2][0]))
+    return confirmed
+
+def _resolve_duplicate_group_lockstep(file_size, paths, stop_event, read_slot, hash_cache, get_hash):
+    by_digest = defaultdict(list)
+    unknown = []
+    for p in paths:
+        digest = ""
+        if hash_cache is not None:
+            try:
+                digest = hash_cache.get(_file_stat_signature(os.stat(p, follow_symlinks=False)), HASH_KIND_FULL)
+            except OSError:
+                continue
+        if digest:
+            by_digest[digest].append(p)
+        else:
+            unknown.append(p)
+    cached_digests = set(by_digest)
+
+    buckets = [unknown]
+    if file_size > DUPLICATE_SAMPLE_MIN_SIZE and len(unknown) >= 2:
+        quick_dict = defaultdict(list)
+        for p in unknown:
+            sig = get_hash(p, True)
+            if sig:
+                quick_dict[sig].append(p)
+        buckets = list(quick_dict.values())
+
+    singles = []
+    for bucket in buckets:
+        if stop_event is not None and stop_event.is_set():
+            return []
+        if len(bucket) < 2:
+            singles.extend(bucket)
             continue
-        if should_skip_bigfile(path, skip_optional=skip_optional):
+        if len(bucket) > DUPLICATE_LOCKSTEP_MAX_FILES:
+            for p in bucket:
+                fh = get_hash(p, False)
+                if fh:
+                    by_digest[fh].append(p)
             continue
-        _push_bigfile_result(results, (size, path), result_limit)
+        matched = compare_files_lockstep(file_size, bucket, stop_event=stop_event, read_slot=read_slot)
+        if matched is None:
+            return []
+        grouped = set()
+        for digest, group_paths, signatures in matched:
+            by_digest[digest].extend(group_paths)
+            grouped.update(group_paths)
+            if hash_cache is not None:
+                for signature in signatures:
+                    hash_cache.put(signature, HASH_KIND_FULL, digest)
+        singles.extend(p for p in bucket if p not in grouped)
+
+    # 落单的文件只可能与缓存中已知摘要的文件重复，没有缓存命中时无需再读
+    if cached_digests:
+        for p in singles:
+            fh = get_hash(p, False)
+            if fh in cached_digests:
+                by_digest[fh].append(p)
+
+    confirmed = []
+    for full_digest, duplicates in by_digest.items():
+        if len(duplicates) > 1:
+            duplicates.sort(key=os.path.normcase)
+            confirmed.append((file_size, full_digest, duplicates))
+    confirmed.sort(key=lambda item: os.path.normcase(item[2][0]))
+    return confirmed
+
+def _resolve_duplicate_group_task(file_size, paths, stop_event, read_slot, hash_cache):
+    hard_links = []
+    confirmed = resolve_duplicate_size_group(
+        file_size, paths, stop_event=stop_event, read_slot=read_slot, hash_cache=hash_cache, hard_links=hard_links
+    )
+    return confirmed, hard_links
 
-    results.sort(key=lambda x: (-x[0], os.path.normcase(x[1])))
-    if progress_cb:
-        progress_cb(len(results))
-    return results
+def iter_duplicate_groups(groups, stop_event=None, workers=None, hash_cache=None):
+    """在有界线程池中并行确认多个大小分组，按 groups 的顺序逐组产出 (重复分组, 硬链接集合)。
 
-def _dir_worker(dir_queue, min_b, excl, stop_flag, results, counter, lock, result_limit=None, skip_optional=False):
-    while True:
-        try: dirpath = dir_queue.get(timeout=0.05)
-        except queue.Empty: continue
-        if dirpath is _SENTINEL:
-            dir_queue.task_done()
-            break
-        if stop_flag.is_set():
-            dir_queue.task_done()
-            continue
-        try: entries = os.scandir(dirpath)
-        except Exception: dir_queue.task_done(); continue
-        local_count = 0
-        local_results = []
-        try:
-            for entry in entries:
-                if stop_flag.is_set(): break
-                try:
-                    if entry.is_symlink(): continue
-                    if entry.is_dir(follow_symlinks=False):
-                        if not should_exclude(entry.path, excl): dir_queue.put(entry.path)
-                    elif entry.is_file(follow_symlinks=False):
-                        if should_skip_bigfile(entry.path, skip_optional=skip_optional): continue
-                        st = entry.stat(follow_symlinks=False)
-                        local_count += 1
-                        if st.st_size >= min_b:
-                            _push_bigfile_result(local_results, (st.st_size, entry.path), result_limit)
-                except Exception as e:
-                    log_sampled_background_error("大文件扫描子项", e)
-        finally:
-            try: entries.close()
-            except Exception as e:
-                log_sampled_background_error("关闭目录句柄", e, limit=3)
-        if local_count or local_results:
-            with lock:
-                counter[0] += local_count
-                if result_limit and result_limit > 0:
-                    for item in local_results:
-                        _push_bigfile_result(results, item, result_limit)
-                else:
-                    results.extend(local_results)
-        dir_queue.task_done()
+    groups 为可迭代的 (size, paths)，在调用方线程中惰性读取；同时在途的分组不超过线程数的两倍，
+    结果按提交顺序交回，因此输出与单线程逐组处理完全一致。每组先合并指向同一物理文件的路径再比较，
+    两部分分别对应 resolve_duplicate_size_group 的返回值与 hard_links 参数。
+    stop_event 置位后不再提交新分组并尽快返回。hash_cache 在所有工作线程间共享，结束时提交缓冲的新摘要。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = max(1, min(int(workers or DEFAULT_SCAN_THREADS), DUPLICATE_HASH_MAX_WORKERS))
+    limiter = DeviceReadLimiter(workers)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dup-hash")
+    pending = deque()
+    try:
+        for file_size, paths in groups:
+            if stop_event is not None and stop_event.is_set():
+                return
+            pending.append(
+                executor.submit(_resolve_duplicate_group_task, file_size, paths, stop_event, limiter.slot, hash_cache)
+            )
+            while len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            if stop_event is not None and stop_event.is_set():
+                return
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if hash_cache is not None:
+            hash_cache.flush()
+
+# ══════════════════════════════════════════════════════════
+#  多进程扫描后端
+# ══════════════════════════════════════════════════════════
+PROCESS_SCAN_REPORT_INTERVAL = 0.3
+_process_scan_stop = None
+_process_scan_counters = None
+
+def process_scan_enabled(roots, use_processes=None):
+    """多个根目录时按根目录拆分到子进程；默认关闭，可用参数或环境变量 C_CLEANER_PLUS_PROCESS_SCAN=1 开启。"""
+    if use_processes is None:
+        use_processes = os.environ.get("C_CLEANER_PLUS_PROCESS_SCAN", "").strip().lower() in ("1", "true", "on", "yes")
+    return bool(use_processes) and len(roots or []) >= 2
+
+def _process_scan_init(stop_event, counters):
+    global _process_scan_stop, _process_scan_counters
+    _process_scan_stop = stop_event
+    _process_scan_counters = counters
+
+def _process_scan_report(slot, scanned):
+    if _process_scan_counters is not None:
+        _process_scan_counters[slot] = int(scanned)
+
+def _open_process_scan_index(index_path):
+    if not index_path:
+        return None
+    try:
+        return FileSystemIndex(index_path)
+    except Exception as e:
+        log_sampled_background_error("打开文件系统索引", e, limit=3)
+        return None
+
+def _process_scan_big_files_root(slot, root, min_b, excl, workers, result_limit, skip_optional, index_path, incremental):
+    fs_index = _open_process_scan_index(index_path)
+    scanned = [0]
+
+    def _progress(count):
+        scanned[0] = count
+        _process_scan_report(slot, count)
+
+    try:
+        results = scan_big_files(
+            [root], min_b, excl, _process_scan_stop, workers=workers, result_limit=result_limit,
+            progress_cb=_progress, skip_optional=skip_optional, fs_index=fs_index, incremental=incremental,
+            use_processes=False,
+        )
+    finally:
+        if fs_index is not None:
+            fs_index.close()
+    return results, scanned[0]
+
+def _process_scan_walk_root(slot, root, excl, workers, ext_filter, collect_files, collect_dirs, file_result_mode,
+                            log_context, index_path, incremental):
+    fs_index = _open_process_scan_index(index_path)
+    scanned = [0]
+    lock = threading.Lock()
+
+    def _count_file(_size, _path):
+        with lock:
+            scanned[0] += 1
+            _process_scan_report(slot, scanned[0])
+
+    try:
+        files, dirs = walk_files_threaded(
+            [root], excl, workers, stop_event=_process_scan_stop, ext_filter=ext_filter,
+            collect_files=collect_files, collect_dirs=collect_dirs, file_result_mode=file_result_mode,
+            file_cb=_count_file, log_context=log_context, fs_index=fs_index, incremental=incremental,
+            use_processes=False,
+        )
+    finally:
+        if fs_index is not None:
+            fs_index.close()
+    return files, dirs
+
+def _run_process_scan(roots, task, task_args, stop, progress_cb=None, log_context="多进程扫描"):
+    """每个根目录一个子进程执行 task(slot, root, *task_args)，按 roots 顺序返回结果列表。
+
+    stop 置位后转发给子进程，子进程内的遍历会像线程模式一样尽快结束并返回已得到的部分结果。
+    进程池无法启动或子进程异常时返回 None，由调用方回退到线程模式。
+    """
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    roots = list(roots)
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        child_stop = ctx.Event()
+        counters = ctx.Array("q", len(roots), lock=False)
+        executor = ProcessPoolExecutor(
+            max_workers=len(roots), mp_context=ctx,
+            initializer=_process_scan_init, initargs=(child_stop, counters),
+        )
+    except Exception as e:
+        log_sampled_background_error(f"{log_context}启动子进程", e, limit=3)
+        return None
 
-def scan_big_files(roots, min_b, excl, stop, workers=4, result_limit=None, progress_cb=None, skip_optional=False):
-    fast_results = _scan_big_files_fast_mft(
+    outcome = None
+    try:
+        futures = [executor.submit(task, slot, root, *task_args) for slot, root in enumerate(roots)]
+        pending = set(futures)
+        while pending:
+            _done, pending = wait(pending, timeout=PROCESS_SCAN_REPORT_INTERVAL, return_when=FIRST_COMPLETED)
+            if stop is not None and stop.is_set():
+                child_stop.set()
+            if progress_cb:
+                progress_cb(sum(counters))
+        outcome = [future.result() for future in futures]
+    except Exception as e:
+        log_sampled_background_error(f"{log_context}子进程", e, limit=3)
+        child_stop.set()
+        outcome = None
+    finally:
+        executor.shutdown(wait=outcome is not None, cancel_futures=True)
+    return outcome
+
+def _scan_big_files_in_processes(roots, min_b, excl, stop, workers, result_limit=None, progress_cb=None, skip_optional=False,
+                                 fs_index=None, incremental=False):
+    per_root_workers = max(1, int(workers or 1) // len(roots))
+    index_path = fs_index.path if fs_index is not None else ""
+    outcome = _run_process_scan(
         roots,
-        min_b,
-        excl,
+        _process_scan_big_files_root,
+        (min_b, list(excl or []), per_root_workers, result_limit, skip_optional, index_path, incremental),
         stop,
-        result_limit=result_limit,
         progress_cb=progress_cb,
-        skip_optional=skip_optional,
+        log_context="大文件扫描",
     )
-    if fast_results is not None:
-        return fast_results
-
-    dir_queue = queue.Queue(); results = []; counter = [0]; lock = threading.Lock()
-    for root in roots: dir_queue.put(root)
-    threads = []
-    for _ in range(workers):
-        t = threading.Thread(
-            target=_dir_worker,
-            args=(dir_queue, min_b, excl, stop, results, counter, lock, result_limit, skip_optional),
-            daemon=True
-        )
-        t.start(); threads.append(t)
-    join_done = threading.Event()
-    threading.Thread(target=lambda: (dir_queue.join(), join_done.set()), daemon=True).start()
-    last_report = 0.0
-    sent_stop_signal = False
-
-    try:
-        while not join_done.wait(0.1):
-            now = time.time()
-            if progress_cb and now - last_report >= 0.3:
-                with lock:
-                    scanned = counter[0]
-                progress_cb(scanned)
-                last_report = now
-            if stop.is_set() and not sent_stop_signal:
-                for _ in threads:
-                    dir_queue.put(_SENTINEL)
-                sent_stop_signal = True
-    finally:
-        # 确保无论正常退出还是异常退出，worker 线程都能收到终止信号
-        if not sent_stop_signal:
-            for _ in threads:
-                dir_queue.put(_SENTINEL)
-    for t in threads:
-        t.join(timeout=2)
+    if outcome is None:
+        return None
+    results = []
+    scanned = 0
+    for root_results, root_scanned in outcome:
+        scanned += root_scanned
+        for item in root_results:
+            _push_bigfile_result(results, tuple(item), result_limit)
     results.sort(key=lambda x: (-x[0], os.path.normcase(x[1])))
     if progress_cb:
-        with lock:
-            scanned = counter[0]
         progress_cb(scanned)
     return results
 
-def _walk_files_headless(roots, excl, workers, stop_event=None, ext_filter=None, collect_files=False, collect_dirs=False):
-    """Standalone multi-threaded file/dir walker for headless (non-UI) scheduled jobs."""
-    return walk_files_threaded(
+def _walk_files_in_processes(roots, excl, workers, stop_event=None, ext_filter=None, collect_files=False, collect_dirs=False,
+                             file_result_mode="size_path", log_context="遍历目录", fs_index=None, incremental=False,
+                             progress_cb=None):
+    per_root_workers = max(1, int(workers or 1) // len(roots))
+    index_path = fs_index.path if fs_index is not None else ""
+    compact = file_result_mode == "compact"
+    outcome = _run_process_scan(
         roots,
-        excl,
-        workers,
-        stop_event=stop_event,
-        ext_filter=ext_filter,
-        collect_files=collect_files,
-        collect_dirs=collect_dirs,
-        file_result_mode="path",
-        log_context="定时任务",
+        _process_scan_walk_root,
+        (list(excl or []), per_root_workers, ext_filter, collect_files, collect_dirs,
+         "size_path" if compact else file_result_mode, log_context, index_path, incremental),
+        stop_event,
+        progress_cb=progress_cb,
+        log_context=log_context,
     )
-
-def walk_files_threaded(roots, excl, workers, stop_event=None, ext_filter=None, collect_files=False, collect_dirs=False,
-                        file_cb=None, dir_cb=None, file_result_mode="size_path", log_context="遍历目录"):
-    dir_queue = queue.Queue()
-    res_files = []
-    res_dirs = []
-    lock = threading.Lock()
-    for r in roots:
-        dir_queue.put(r)
-
-    def _worker():
-        while True:
-            try:
-                d = dir_queue.get(timeout=0.05)
-            except queue.Empty:
-                continue
-            if d is _SENTINEL:
-                dir_queue.task_done()
-                break
-            if stop_event is not None and stop_event.is_set():
-                dir_queue.task_done()
-                continue
-            try:
-                entries = os.scandir(d)
-            except Exception as e:
-                log_sampled_background_error(f"{log_context}遍历目录", e)
-                dir_queue.task_done()
-                continue
-            try:
-                for entry in entries:
-                    if stop_event is not None and stop_event.is_set():
-                        break
-                    try:
-                        if entry.is_symlink():
-                            continue
-                        if entry.is_dir(follow_symlinks=False):
-                            if not should_exclude(entry.path, excl):
-                                dir_queue.put(entry.path)
-                                if collect_dirs:
-                                    with lock:
-                                        res_dirs.append(entry.path)
-                                if dir_cb:
-                                    dir_cb(entry.path)
-                        elif entry.is_file(follow_symlinks=False):
-                            if ext_filter and not entry.name.lower().endswith(ext_filter):
-                                continue
-                            size = entry.stat(follow_symlinks=False).st_size
-                            if collect_files:
-                                with lock:
-                                    if file_result_mode == "path":
-                                        res_files.append(entry.path)
-                                    else:
-                                        res_files.append((size, entry.path))
-                            if file_cb:
-                                file_cb(size, entry.path)
-                    except Exception as e:
-                        log_sampled_background_error(f"{log_context}扫描条目", e)
-            finally:
-                try:
-                    entries.close()
-                except Exception as e:
-                    log_sampled_background_error(f"{log_context}关闭扫描句柄", e, limit=3)
-            dir_queue.task_done()
-
-    threads = []
-    for _ in range(workers):
-        t = threading.Thread(target=_worker, daemon=True)
-        t.start()
-        threads.append(t)
-    join_done = threading.Event()
-    threading.Thread(target=lambda: (dir_queue.join(), join_done.set()), daemon=True).start()
-    sent_stop = False
-    try:
-        while not join_done.wait(0.1):
-            if stop_event is not None and stop_event.is_set() and not sent_stop:
-                for _ in threads:
-                    dir_queue.put(_SENTINEL)
-                sent_stop = True
-    finally:
-        if not sent_stop:
-            for _ in threads:
-                dir_queue.put(_SENTINEL)
-    for t in threads:
-        t.join(timeout=1)
+    if outcome is None:
+        return None
+    res_files = CompactScanResults() if compact else []
+    res_dirs = CompactScanResults(path_table=res_files.path_table) if compact else []
+    for files, dirs in outcome:
+        res_files.extend(tuple(item) if isinstance(item, list) else item for item in files)
+        if compact:
+            for path in dirs:
+                res_dirs.append(path)
+        else:
+            res_dirs.extend(dirs)
     return res_files, res_dirs
 
 class Sig(QObject):
@@ -3316,6 +6753,7 @@ def list_cache_migration_presets(category="全部", min_size_bytes=0, include_mi
     min_size = max(0, int(min_size_bytes or 0))
     results = []
     seen = set()
+    sizes = TreeSizeAggregator(stop_flag=stop_event)
 
     def _log(message):
         if callable(log_fn):
@@ -3348,7 +6786,7 @@ def list_cache_migration_presets(category="全部", min_size_bytes=0, include_mi
             status = "可迁移"
             _log(f"[缓存预设] 正在估算: {display_path(path)}")
             try:
-                size = dir_size(path, stop_flag=stop_event) if os.path.isdir(path) else safe_getsize(path)
+                size = sizes.size(path) if os.path.isdir(path) else safe_getsize(path)
             except Exception as e:
                 status = "估算失败"
                 _log(f"[缓存预设] 估算失败: {display_path(path)} -> {format_exception_text(e)}")
@@ -3791,7 +7229,7 @@ def _migration_partial_path(target_path):
     name = os.path.basename(target_path)
     return os.path.join(parent, f".{name}{MIGRATION_PARTIAL_SUFFIX}")
 
-def _files_equal_exact(left, right, stop_event=None, chunk_size=MIGRATION_COPY_CHUNK_SIZE):
+def _files_equal_exact(left, right, stop_event=None, chunk_size=MIGRATION_COPY_CHUNK_SIZE, hash_cache=None):
     try:
         if (
             not os.path.isfile(left)
@@ -3804,16 +7242,28 @@ def _files_equal_exact(left, right, stop_event=None, chunk_size=MIGRATION_COPY_C
         right_before = _file_stat_signature(os.stat(right, follow_symlinks=False))
         if left_before[0] != right_before[0]:
             return False, "文件大小不同"
+        if hash_cache is not None:
+            # 缓存只用来提前否定；确认一致仍需逐字节比较，因为随后会删除源文件
+            left_digest = hash_cache.get(left_before, HASH_KIND_FULL)
+            right_digest = hash_cache.get(right_before, HASH_KIND_FULL)
+            if left_digest and right_digest and left_digest != right_digest:
+                return False, "文件内容不同"
         with open(left, "rb") as left_stream, open(right, "rb") as right_stream:
+            advise_sequential(left_stream)
+            advise_sequential(right_stream)
+            left_chunks = iter_stream_chunks(left_stream, chunk_size, slot=0)
+            right_chunks = iter_stream_chunks(right_stream, chunk_size, slot=1)
             while True:
                 if stop_event is not None and stop_event.is_set():
                     return False, "已取消文件一致性校验"
-                left_chunk = left_stream.read(chunk_size)
-                right_chunk = right_stream.read(chunk_size)
-                if left_chunk != right_chunk:
-                    return False, "文件内容不同"
-                if not left_chunk:
+                left_chunk = next(left_chunks, None)
+                right_chunk = next(right_chunks, None)
+                if left_chunk is None or right_chunk is None:
+                    if left_chunk is not right_chunk:
+                        return False, "文件内容不同"
                     break
+                if not chunks_equal(left_chunk, right_chunk):
+                    return False, "文件内容不同"
             if (
                 _file_stat_signature(os.fstat(left_stream.fileno())) != left_before
                 or _file_stat_signature(os.fstat(right_stream.fileno())) != right_before
@@ -3834,13 +7284,16 @@ def _file_prefix_matches(source, partial, length, stop_event=None):
         return True, ""
     try:
         with open(source, "rb") as source_stream, open(partial, "rb") as partial_stream:
+            advise_sequential(source_stream)
+            advise_sequential(partial_stream)
+            source_chunks = iter_stream_chunks(source_stream, MIGRATION_COPY_CHUNK_SIZE, length=remaining, slot=0)
+            partial_chunks = iter_stream_chunks(partial_stream, MIGRATION_COPY_CHUNK_SIZE, length=remaining, slot=1)
             while remaining > 0:
                 if stop_event is not None and stop_event.is_set():
                     return False, "已取消半成品校验"
-                read_size = min(MIGRATION_COPY_CHUNK_SIZE, remaining)
-                source_chunk = source_stream.read(read_size)
-                partial_chunk = partial_stream.read(read_size)
-                if source_chunk != partial_chunk or not source_chunk:
+                source_chunk = next(source_chunks, None)
+                partial_chunk = next(partial_chunks, None)
+                if source_chunk is None or partial_chunk is None or not chunks_equal(source_chunk, partial_chunk):
                     return False, "半成品内容与源文件不一致"
                 remaining -= len(source_chunk)
         return remaining == 0, "" if remaining == 0 else "半成品长度异常"
@@ -3890,7 +7343,9 @@ def _move_regular_file_resumable(source, target, stop_event=None):
     if os.path.lexists(target_path):
         if os.path.islink(target_path) or not os.path.isfile(target_path):
             return False, f"目标中已存在非普通文件：{display_path(target_path)}", 0
-        same, reason = _files_equal_exact(source_path, target_path, stop_event=stop_event)
+        same, reason = _files_equal_exact(
+            source_path, target_path, stop_event=stop_event, hash_cache=get_content_hash_cache()
+        )
         if not same:
             return False, f"目标中已存在同名内容，且无法确认一致：{reason}", 0
         try:
@@ -4248,7 +7703,7 @@ def create_space_saving_link(source_path, destination_root, link_mode="junction"
                 _log(f"[软链接] 已复用执行前分析估算: {human_size(src_size)}")
             elif is_dir:
                 _log("[软链接] 正在计算源路径体积...")
-                size_result = dir_size_detailed(src, stop_flag=stop_event)
+                size_result = dir_size_detailed(src, stop_flag=stop_event, use_cache=False)
                 if size_result.cancelled:
                     return False, "已取消", target_path
                 if not size_result.complete:
@@ -4270,7 +7725,7 @@ def create_space_saving_link(source_path, destination_root, link_mode="junction"
             if dst_free >= 0 and src_size > dst_free:
                 if reused_analysis and is_dir and not resume_in_progress:
                     _log("[软链接] 缓存估算显示空间不足，正在重新确认剩余体积...")
-                    size_result = dir_size_detailed(src, stop_flag=stop_event)
+                    size_result = dir_size_detailed(src, stop_flag=stop_event, use_cache=False)
                     if size_result.cancelled:
                         return False, "已取消", target_path
                     if not size_result.complete:
@@ -4439,6 +7894,7 @@ def recommend_link_targets(scan_roots, min_size_bytes=RECOMMENDED_LINK_MIN_SIZE,
 
     results = []
     errors = []
+    sizes = TreeSizeAggregator(stop_flag=stop_event, fs_index=get_filesystem_index())
     for root in normalized_roots:
         try:
             entries = sorted(os.scandir(root), key=lambda x: x.name.lower())
@@ -4459,7 +7915,7 @@ def recommend_link_targets(scan_roots, min_size_bytes=RECOMMENDED_LINK_MIN_SIZE,
                     if name.lower() in RECOMMENDED_LINK_EXCLUDE_NAMES:
                         continue
                     _log(f"[系统推荐] 正在分析: {display_path(entry.path)}")
-                    size = dir_size(entry.path, stop_flag=stop_event)
+                    size = sizes.size(entry.path)
                     if stop_event is not None and stop_event.is_set():
                         break
                     if size < int(min_size_bytes):
@@ -4586,6 +8042,7 @@ def scan_download_candidates(root_paths, min_size_bytes=0, min_age_days=0, inclu
     errors = []
     min_size = max(0, int(min_size_bytes or 0))
     min_age = max(0, int(min_age_days or 0))
+    sizes = TreeSizeAggregator(stop_flag=stop_event)
 
     for root in roots:
         if stop_event is not None and stop_event.is_set():
@@ -4612,7 +8069,7 @@ def scan_download_candidates(root_paths, min_size_bytes=0, min_age_days=0, inclu
                     age_days = max(0, int((time.time() - float(mtime)) // 86400)) if mtime else 0
                     if min_age and age_days < min_age:
                         continue
-                    size = dir_size(entry.path, stop_flag=stop_event) if is_dir else safe_getsize(entry.path)
+                    size = sizes.size(entry.path) if is_dir else safe_getsize(entry.path)
                     if stop_event is not None and stop_event.is_set():
                         break
                     if size < min_size:
@@ -4670,6 +8127,22 @@ def scan_space_usage_roots(root_paths, min_size_bytes=0, limit=200, log_fn=None,
     rows = []
     errors = []
     min_size = max(0, int(min_size_bytes or 0))
+    sizes = TreeSizeAggregator(stop_flag=stop_event, fs_index=get_filesystem_index())
+    drive_children = []
+    for root in roots:
+        if not _is_drive_root_path(root):
+            continue
+        try:
+            with os.scandir(root) as entries:
+                drive_children.extend(
+                    entry.path for entry in entries if not entry.is_symlink() and entry.is_dir(follow_symlinks=False)
+                )
+        except OSError:
+            continue
+    prefetched = prefetch_mft_dir_sizes(drive_children, stop_event=stop_event, min_queries=1) if drive_children else {}
+    if prefetched:
+        sizes.remember(prefetched)
+        _log("[空间分析] 已通过 MFT 一次读取整盘目录大小")
     for root in roots:
         if stop_event is not None and stop_event.is_set():
             break
@@ -4690,7 +8163,7 @@ def scan_space_usage_roots(root_paths, min_size_bytes=0, limit=200, log_fn=None,
                     if entry.is_symlink():
                         continue
                     is_dir = entry.is_dir(follow_symlinks=False)
-                    size = dir_size(entry.path, stop_flag=stop_event) if is_dir else safe_getsize(entry.path)
+                    size = sizes.size(entry.path) if is_dir else safe_getsize(entry.path)
                     if stop_event is not None and stop_event.is_set():
                         break
                     root_total += int(size)
@@ -5270,7 +8743,7 @@ class BigFileTableModel(CheckableDictTableModel):
 
     def __init__(self, parent=None):
         super().__init__(parent)
-        self._rows = []
+        self._rows = CompactScanResults()
 
     def rowCount(self, parent=QModelIndex()):
         if parent.isValid():
@@ -5376,24 +8849,23 @@ class BigFileTableModel(CheckableDictTableModel):
         self.layoutChanged.emit()
 
     def checked_paths(self):
-        return [row["path"] for row in self._rows if row.get("checked") and row.get("path")]
+        paths = (self._rows.path(index) for index in self._rows.iter_checked())
+        return [path for path in paths if path]
 
     def all_checked(self):
-        return bool(self._rows) and all(row.get("checked") for row in self._rows)
+        return self._rows.all_checked()
 
     def set_all_checked(self, checked):
         if not self._rows:
             return
-        state = bool(checked)
-        for row in self._rows:
-            row["checked"] = state
+        self._rows.set_all_checked(bool(checked))
         top_left = self.index(0, 0)
         bottom_right = self.index(len(self._rows) - 1, 0)
         self.dataChanged.emit(top_left, bottom_right, [Qt.ItemDataRole.CheckStateRole])
 
     def path_at(self, row):
         if 0 <= row < len(self._rows):
-            return self._rows[row].get("path", "")
+            return self._rows.path(row)
         return ""
 
 
@@ -5402,7 +8874,7 @@ class MoreCleanTableModel(CheckableDictTableModel):
 
     def __init__(self, parent=None):
         super().__init__(parent)
-        self._rows = []
+        self._rows = CompactScanResults(fields=("type", "detail"))
 
     def rowCount(self, parent=QModelIndex()):
         if parent.isValid():
@@ -5502,20 +8974,18 @@ class MoreCleanTableModel(CheckableDictTableModel):
         self.endInsertRows()
 
     def all_checked(self):
-        return bool(self._rows) and all(row.get("checked") for row in self._rows)
+        return self._rows.all_checked()
 
     def set_all_checked(self, checked):
         if not self._rows:
             return
-        state = bool(checked)
-        for row in self._rows:
-            row["checked"] = state
+        self._rows.set_all_checked(bool(checked))
         top_left = self.index(0, 0)
         bottom_right = self.index(len(self._rows) - 1, 0)
         self.dataChanged.emit(top_left, bottom_right, [Qt.ItemDataRole.CheckStateRole])
 
     def checked_entries(self):
-        return [row for row in self._rows if row.get("checked")]
+        return [self._rows[index].to_dict() for index in self._rows.iter_checked()]
 
     def row_at(self, row):
         if 0 <= row < len(self._rows):
@@ -6210,15 +9680,10 @@ def _run_scheduled_empty_dirs(permanent_delete, log):
     """Scan and delete empty folders across all drives (空文件夹清理)."""
     log("[空文件夹清理] 开始扫描...")
     roots = get_available_drives()
-    _, dirs = _walk_files_headless(roots, DEFAULT_EXCLUDES, workers=4, collect_dirs=True)
-    dirs.sort(key=len, reverse=True)
-    empty_set = set()
-    for d in dirs:
-        try:
-            if is_directory_empty(d, known_empty_dirs=empty_set):
-                empty_set.add(d)
-        except Exception as e:
-            log_sampled_background_error("定时任务空文件夹扫描", e)
+    # 遍历过程中已出现文件的子树无需复核，只复核候选目录
+    candidates = collect_empty_dir_candidates(_iter_walk_headless(roots, build_scan_excludes(load_runtime_global_settings())))
+    empty_set = confirm_empty_dirs(candidates, log_context="定时任务空文件夹扫描")
+    candidates.clear()
     if not empty_set:
         log("[空文件夹清理] 未发现空文件夹")
         return
@@ -6239,13 +9704,12 @@ def _run_scheduled_shortcuts(permanent_delete, log):
     """Scan and delete broken shortcuts across all drives (无效快捷方式清理)."""
     log("[无效快捷方式] 开始扫描...")
     roots = get_available_drives()
-    files, _ = _walk_files_headless(roots, DEFAULT_EXCLUDES, workers=4, ext_filter=".lnk", collect_files=True)
-
     invalid = []
-    for p in files:
-        detail = get_invalid_shortcut_detail(p, log_context="定时任务解析快捷方式")
-        if detail:
-            invalid.append((p, detail))
+    for batch in _iter_walk_headless(roots, build_scan_excludes(load_runtime_global_settings()), ext_filter=".lnk", want_dirs=False):
+        for _size, p, _is_dir in batch:
+            detail = get_invalid_shortcut_detail(p, log_context="定时任务解析快捷方式")
+            if detail:
+                invalid.append((p, detail))
 
     if not invalid:
         log("[无效快捷方式] 未发现无效快捷方式")
@@ -9510,6 +12974,12 @@ class SettingPage(ScrollArea):
         btn_cfg_reset.clicked.connect(self._reset_config_dir)
         self._style_action_control(btn_cfg_reset, 82)
 
+        self.edit_scan_excludes = LineEdit()
+        self.edit_scan_excludes.setPlaceholderText("例如: D:\\Builds;node_modules;*.git")
+        self.edit_scan_excludes.setText(";".join(normalize_scan_exclude_patterns(self.main_win.global_settings.get("scan_exclude_patterns", []))))
+        self.edit_scan_excludes.setFixedWidth(240)
+        self.edit_scan_excludes.editingFinished.connect(self._on_scan_excludes_changed)
+
         self.cb_update_channel = ComboBox()
         self.cb_update_channel.addItems(["稳定版", "测试版"])
         saved_channel = self.main_win.global_settings.get("update_channel", "stable")
@@ -9587,8 +13057,15 @@ class SettingPage(ScrollArea):
             self._make_setting_row(
                 FIF.SYNC,
                 "刷新系统扫描缓存",
-                "清空硬盘类型检测缓存更换或新增硬盘后，建议执行一次",
+                "清空各硬盘已学习的扫描线程数，更换或新增硬盘后建议执行一次",
                 btn_cache
+            ),
+            self._make_setting_row(
+                FIF.FILTER,
+                "扫描排除规则",
+                "大文件、更多清理与定时任务扫描时跳过的目录，多个规则用分号分隔，支持路径和 * ? 通配符；"
+                "不含路径的名称（如 node_modules）会跳过任意位置的同名目录",
+                self.edit_scan_excludes
             )
         ]))
 
@@ -9773,6 +13250,14 @@ class SettingPage(ScrollArea):
         self.main_win.global_settings["protect_builtin_rules"] = is_checked
         self.main_win.save_global_settings()
 
+    def _on_scan_excludes_changed(self):
+        patterns = normalize_scan_exclude_patterns(self.edit_scan_excludes.text())
+        self.edit_scan_excludes.setText(";".join(patterns))
+        if patterns == normalize_scan_exclude_patterns(self.main_win.global_settings.get("scan_exclude_patterns", [])):
+            return
+        self.main_win.global_settings["scan_exclude_patterns"] = patterns
+        self.main_win.save_global_settings()
+
     def _on_auto_start_changed(self, is_checked):
         ok, msg = set_app_auto_start_enabled(is_checked)
         if ok:
@@ -9888,8 +13373,8 @@ class SettingPage(ScrollArea):
         try:
             if os.path.exists(CACHE_FILE):
                 os.remove(CACHE_FILE)
-            threading.Thread(target=self.main_win._async_detect, daemon=True).start()
-            InfoBar.success("刷新成功", "软件缓存已清除并重新开始硬盘测速检测！", parent=self.main_win)
+            self.main_win._request_disk_detect()
+            InfoBar.success("刷新成功", "已清除学习到的扫描线程数，下次扫描时重新调优", parent=self.main_win)
         except Exception as e:
             InfoBar.error("刷新失败", f"无法清除缓存文件: {e}", parent=self.main_win)
 
@@ -10488,6 +13973,14 @@ class CleanPage(ScrollArea):
         for item in its:
             job_queue.put(item)
 
+        # 管理员 + NTFS 时先用 MFT 助手一次读盘预取全部目录规则的大小，估算线程直接命中目录大小缓存
+        dir_targets = []
+        for _, entry in its:
+            parsed = parse_rule_entry(entry)
+            if parsed and parsed[2] == "dir":
+                dir_targets.append(expand_env(parsed[1]))
+        prefetch_mft_dir_sizes(dir_targets, stop_event=self.stop, use_cache=True)
+
         # 估算主要是文件系统 IO，这里并行多个规则能明显缩短总耗时
         def _worker():
             while not self.stop.is_set():
@@ -11762,9 +15255,9 @@ class BigFilePage(DeferredPageMixin, ScrollArea):
         super().showEvent(event)
         self._ensure_content(immediate=False)
         host = self.window()
-        if self._disk_type in {"检测中...", "Unknown"} and hasattr(host, "_request_disk_detect"):
+        if self._disk_type == "检测中..." and hasattr(host, "_request_disk_detect"):
             try:
-                host._request_disk_detect(force=True)
+                host._request_disk_detect()
             except Exception:
                 pass
 
@@ -11863,6 +15356,7 @@ class BigFilePage(DeferredPageMixin, ScrollArea):
         result_limit = self.sp_mx.value()
         roots = self.drive_sel.selected_drives()
         skip_optional = self.chk_skip_special.isChecked()
+        excludes = build_scan_excludes(getattr(self.window(), "global_settings", None))
         if not roots:
             self.sig.big_done.emit("warning", "错误：未选择磁盘")
             return
@@ -11872,42 +15366,63 @@ class BigFilePage(DeferredPageMixin, ScrollArea):
         start_page_worker(
             self,
             self._scan_w,
-            args=(min_mb, result_limit, roots, skip_optional),
+            args=(min_mb, result_limit, roots, skip_optional, excludes),
             before_start=_prep,
         )
 
-    def _scan_w(self, min_mb, result_limit, roots, skip_optional):
+    def _scan_w(self, min_mb, result_limit, roots, skip_optional, excludes=None):
         t0 = time.time()
         w, dtype = get_scan_threads_for_drives_cached(roots)
         self.sig.disk_ready.emit(dtype, w)
         self.sig.big_log.emit(f"扫描 (≥{min_mb}MB) | 线程: {w}"); self.sig.big_clr.emit()
         self.sig.big_prog.emit(0, 0)
         self.sig.big_scan_count.emit(0)
+        published = [False]
+
+        def _emit_rows(rows):
+            batch = []
+            for sz, pa in rows:
+                batch.append((str(sz), pa))
+                if len(batch) >= UI_BATCH_CHUNK:
+                    self.sig.big_add_batch.emit(batch[:])
+                    batch.clear()
+            if batch:
+                self.sig.big_add_batch.emit(batch[:])
+                batch.clear()
+
+        def _partial(rows):
+            # MFT 逐个盘符完成时先展示阶段性 top-K，最终结果到来时整体替换
+            if self.stop.is_set():
+                return
+            self.sig.big_clr.emit()
+            _emit_rows(rows[:result_limit])
+            published[0] = True
+
         res = scan_big_files(
             roots,
             min_mb*1024*1024,
-            DEFAULT_EXCLUDES,
+            excludes if excludes is not None else DEFAULT_EXCLUDES,
             self.stop,
             workers=w,
             result_limit=result_limit,
             progress_cb=lambda scanned: self.sig.big_scan_count.emit(scanned),
-            skip_optional=skip_optional
+            skip_optional=skip_optional,
+            fs_index=get_filesystem_index(),
+            partial_cb=_partial,
+            progress_range_cb=lambda done, total: self.sig.big_prog.emit(done, total),
         )
+        tuned_w, tuned_dtype = get_scan_threads_for_drives_cached(roots)
+        if (tuned_w, tuned_dtype) != (w, dtype):
+            self.sig.disk_ready.emit(tuned_dtype, tuned_w)
         if self.stop.is_set():
             res.clear()
             self.sig.big_done.emit("warning", f"扫描已取消，耗时 {time.time()-t0:.1f} 秒")
             return
         shown = res[:result_limit]
         shown_count = len(shown)
-        batch = []
-        for sz, pa in shown:
-            batch.append((str(sz), pa))
-            if len(batch) >= UI_BATCH_CHUNK:
-                self.sig.big_add_batch.emit(batch[:])
-                batch.clear()
-        if batch:
-            self.sig.big_add_batch.emit(batch[:])
-            batch.clear()
+        if published[0]:
+            self.sig.big_clr.emit()
+        _emit_rows(shown)
         shown.clear()
         res.clear()
         self.sig.big_done.emit("success", f"扫描完成，找到 {shown_count} 条，耗时 {time.time()-t0:.1f} 秒")
@@ -11944,7 +15459,7 @@ class MoreCleanPage(DeferredPageMixin, ScrollArea):
 
         dl = QHBoxLayout(); dl.setSpacing(10)
         self.cb_mode = ComboBox()
-        self.cb_mode.addItems(["重复文件查找", "空文件夹扫描", "无效快捷方式清理", "卸载注册表扫描", "右键菜单清理"])
+        self.cb_mode.addItems(["重复文件查找", "空文件夹扫描", "无效快捷方式清理", "卸载注册表扫描", "右键菜单清理", "综合扫描（单次遍历）"])
         self.cb_mode.setFixedWidth(200); self.cb_mode.currentIndexChanged.connect(self._on_mode_change)
         dl.addWidget(StrongBodyLabel("扫描类型:")); dl.addWidget(self.cb_mode); dl.addSpacing(20)
 
@@ -12178,13 +15693,18 @@ class MoreCleanPage(DeferredPageMixin, ScrollArea):
 
         big_page = getattr(self.window(), "pg_big", None)
         workers = big_page._disk_threads if big_page is not None else 4
+        excludes = build_scan_excludes(getattr(self.window(), "global_settings", None))
+        big_options = (500, 200, True)
+        if big_page is not None:
+            big_options = (big_page.sp_mb.value(), big_page.sp_mx.value(), big_page.chk_skip_special.isChecked())
 
         scan_targets = {
-            0: (self._scan_duplicates, (roots, workers)),
-            1: (self._scan_empty_dirs, (roots, workers)),
-            2: (self._scan_shortcuts, (roots, workers)),
+            0: (self._scan_duplicates, (roots, workers, excludes)),
+            1: (self._scan_empty_dirs, (roots, workers, excludes)),
+            2: (self._scan_shortcuts, (roots, workers, excludes)),
             3: (self._scan_registry, ()),
             4: (self._scan_context_menu, ()),
+            5: (self._scan_combined, (roots, workers, excludes, big_options)),
         }
         target = scan_targets.get(idx)
         if target is None:
@@ -12196,7 +15716,8 @@ class MoreCleanPage(DeferredPageMixin, ScrollArea):
 
         start_page_worker(self, target[0], args=target[1], before_start=_prep)
 
-    def _walk_files_threaded(self, roots, excl, workers, file_cb=None, dir_cb=None, ext_filter=None, collect_files=False, collect_dirs=False):
+    def _walk_files_threaded(self, roots, excl, workers, file_cb=None, dir_cb=None, ext_filter=None, collect_files=False, collect_dirs=False,
+                             file_result_mode="size_path"):
         return walk_files_threaded(
             roots,
             excl,
@@ -12207,215 +15728,265 @@ class MoreCleanPage(DeferredPageMixin, ScrollArea):
             collect_dirs=collect_dirs,
             file_cb=file_cb,
             dir_cb=dir_cb,
-            file_result_mode="size_path",
+            file_result_mode=file_result_mode,
             log_context="更多清理",
+            fs_index=get_filesystem_index(),
         )
 
-    def _scan_duplicates(self, roots, workers):
-        t0 = time.time()
-        first_path_by_size = {}
-        size_groups = defaultdict(list)
-        size_lock = threading.Lock()
+    def _iter_walk(self, roots, excl, workers, ext_filter=None, want_files=True, want_dirs=True):
+        return iter_walk(
+            roots,
+            excl,
+            workers,
+            stop_event=self.stop,
+            ext_filter=ext_filter,
+            want_files=want_files,
+            want_dirs=want_dirs,
+            log_context="更多清理",
+            fs_index=get_filesystem_index(),
+        )
 
+    def _scan_duplicates(self, roots, workers, excl=None):
+        t0 = time.time()
         self.sig.more_log.emit("[重复文件] 第一阶段：识别可疑大小分组...")
-
-        def _collect_candidates(file_size, path):
-            if file_size <= 0:
-                return
-            with size_lock:
-                existing_group = size_groups.get(file_size)
-                if existing_group:
-                    existing_group.append(path)
-                    return
-
-                first_path = first_path_by_size.get(file_size)
-                if first_path is None:
-                    first_path_by_size[file_size] = path
-                    return
-
-                size_groups[file_size] = [first_path, path]
-                first_path_by_size.pop(file_size, None)
-
-        self._walk_files_threaded(roots, DEFAULT_EXCLUDES, workers, file_cb=_collect_candidates)
+        candidates, _dirs = self._walk_files_threaded(
+            roots, excl or DEFAULT_EXCLUDES, workers, collect_files=True, file_result_mode="compact"
+        )
         if self.stop.is_set():
-            size_groups.clear()
-            first_path_by_size.clear()
+            candidates.clear()
             self.sig.more_done.emit(f"扫描已取消，耗时 {time.time()-t0:.1f} 秒")
             return
 
-        first_path_by_size.clear()
-        if not size_groups:
-            self.sig.more_done.emit(f"扫描完成，找到 0 个重复文件，耗时 {time.time()-t0:.1f} 秒")
+        hard_links = []
+        counts = self._resolve_duplicate_groups(candidates, workers=workers, hard_links=hard_links)
+        if counts is None:
+            self.sig.more_done.emit(f"扫描已取消，耗时 {time.time()-t0:.1f} 秒")
+            return
+        cnt, hidden_cnt = counts
+        self._emit_hard_link_rows(hard_links)
+        if hidden_cnt > 0:
+            self.sig.more_done.emit(f"扫描完成，展示 {cnt} 个重复文件，另有 {hidden_cnt} 个未展开，耗时 {time.time()-t0:.1f} 秒")
             return
+        self.sig.more_done.emit(f"扫描完成，找到 {cnt} 个重复文件，耗时 {time.time()-t0:.1f} 秒")
 
-        suspects = [(sz, paths) for sz, paths in size_groups.items() if len(paths) > 1]
-        size_groups.clear()
+    def _resolve_duplicate_groups(self, candidates, path_filter=None, workers=None, hard_links=None):
+        """对 CompactScanResults 中大小相同的候选做采样哈希与全量哈希，每确认一个大小分组就发布其重复文件行；
+        返回 (展示数量, 折叠数量)，被取消时返回 None。path_filter 用于在载入分组路径时排除不参与比较的文件。
+        各大小分组在 iter_duplicate_groups 的线程池中并行确认并按大小降序交回，组号与行顺序与线程数无关。
+        指向同一物理文件的路径只比较一次，hard_links 为列表时这些集合以 (size, paths) 按大小降序追加到其中。
+        """
+        suspects = list(candidates.group_indices_by_size().items())
+        suspects.sort(key=lambda item: -item[0])
         self.sig.more_log.emit(f"[重复文件] 第二阶段：校验 {len(suspects)} 个可疑大小分组...")
 
-        def _get_hash(path, head_bytes=None, tail_bytes=0, sample_offsets=None):
-            m = hashlib.sha256()
-            try:
-                with open(path, 'rb') as f:
-                    if sample_offsets:
-                        try:
-                            file_size = os.path.getsize(path)
-                        except Exception:
-                            file_size = 0
-                        seen_offsets = set()
-                        for offset, size in sample_offsets:
-                            if self.stop.is_set():
-                                return None
-                            if size <= 0 or file_size <= 0:
-                                continue
-                            real_offset = max(0, min(offset, max(0, file_size - size)))
-                            if real_offset in seen_offsets:
-                                continue
-                            seen_offsets.add(real_offset)
-                            f.seek(real_offset)
-                            m.update(f.read(size))
-                    elif head_bytes is not None:
-                        if self.stop.is_set():
-                            return None
-                        head = f.read(head_bytes)
-                        m.update(head)
-                        if tail_bytes > 0:
-                            try:
-                                file_size = os.path.getsize(path)
-                            except Exception:
-                                file_size = len(head)
-                            if file_size > len(head):
-                                if self.stop.is_set():
-                                    return None
-                                f.seek(max(0, file_size - tail_bytes))
-                                m.update(f.read(tail_bytes))
-                    else:
-                        for chunk in iter(lambda: f.read(1024 * 1024), b''):
-                            if self.stop.is_set():
-                                return None
-                            m.update(chunk)
-                return m.hexdigest()
-            except Exception:
-                return None
-
-        def _get_quick_hash(path, file_size):
-            if file_size <= 8 * 1024:
-                return _get_hash(path)
-            if file_size <= 512 * 1024:
-                return _get_hash(path, head_bytes=64 * 1024)
-            sample_size = 64 * 1024
-            mid_offset = max(0, (file_size // 2) - (sample_size // 2))
-            tail_offset = max(0, file_size - sample_size)
-            return _get_hash(
-                path,
-                sample_offsets=[
-                    (0, sample_size),
-                    (mid_offset, sample_size),
-                    (tail_offset, sample_size)
-                ]
-            )
+        def _groups():
+            for file_size, indices in suspects:
+                paths = candidates.paths_at(indices)
+                if path_filter is not None:
+                    paths = [p for p in paths if path_filter(p)]
+                yield file_size, paths
 
         # 先按文件大小筛，再用分层采样做快速分桶，最后只对疑似组做全量哈希
-        results = []
         tot = len(suspects)
-        for i, (file_size, paths) in enumerate(suspects, 1):
-            if self.stop.is_set(): break
+        hash_cache = get_content_hash_cache()
+        hits_before = hash_cache.hits if hash_cache is not None else 0
+        groups = iter_duplicate_groups(_groups(), stop_event=self.stop, workers=workers, hash_cache=hash_cache)
+        links = []
+        cnt = 0
+        hidden_cnt = 0
+        grp_id = 0
+        pending_rows = []
+        for i, (confirmed, group_links) in enumerate(groups, 1):
             self.sig.more_prog.emit(i, tot)
+            for file_size, full_digest, dup_list in confirmed:
+                grp_id += 1
+                shown, hidden = self._append_duplicate_rows(pending_rows, grp_id, file_size, full_digest, dup_list)
+                cnt += shown
+                hidden_cnt += hidden
+            confirmed.clear()
+            links.extend(group_links)
+            self._emit_more_rows(pending_rows)
+            pending_rows.clear()
+
+        candidates.clear()
+        suspects.clear()
+        if hash_cache is not None and hash_cache.hits > hits_before:
+            self.sig.more_log.emit(f"[重复文件] 内容哈希缓存命中 {hash_cache.hits - hits_before} 次")
+        if self.stop.is_set():
+            return None
+
+        if hidden_cnt > 0:
+            self.sig.more_log.emit(f"[重复文件] 已折叠 {hidden_cnt} 个超大重复组结果，仅展示每组前 {DUPLICATE_GROUP_DISPLAY_LIMIT} 项")
+        if hard_links is not None:
+            hard_links.extend(links)
+        return cnt, hidden_cnt
 
-            quick_dict = defaultdict(list)
+    def _emit_hard_link_rows(self, links):
+        """单独列出指向同一物理文件的路径集合；这些行不带复核信息，删除它们不会释放空间，也不会被重复文件清理执行。"""
+        pending_rows = []
+        for link_id, (file_size, paths) in enumerate(links, 1):
             for p in paths:
-                if self.stop.is_set():
-                    break
-                sig = _get_quick_hash(p, file_size)
-                if sig:
-                    quick_dict[sig].append(p)
+                pending_rows.append((False, DUPLICATE_HARD_LINK_TYPE, f"链接 {link_id}", human_size(file_size), p))
+                if len(pending_rows) >= UI_BATCH_CHUNK:
+                    self._emit_more_rows(pending_rows)
+                    pending_rows.clear()
+        if pending_rows:
+            self._emit_more_rows(pending_rows)
+            pending_rows.clear()
+        if links:
+            saved = sum(file_size * (len(paths) - 1) for file_size, paths in links)
+            self.sig.more_log.emit(
+                f"[重复文件] {len(links)} 组路径指向同一物理文件（硬链接），已单独列出，"
+                f"未重复读取的数据约 {human_size(saved)}，删除它们不会释放空间"
+            )
+        count = sum(len(paths) for _file_size, paths in links)
+        links.clear()
+        return count
+
+    def _append_duplicate_rows(self, pending_rows, grp_id, file_size, full_digest, dup_list):
+        """把一个重复文件分组的行追加到 pending_rows，第一项作为保留基准；满一批即发布。返回 (展示数量, 折叠数量)。"""
+        shown_list = dup_list[:DUPLICATE_GROUP_DISPLAY_LIMIT]
+        hidden = max(0, len(dup_list) - len(shown_list))
+        reference_path = dup_list[0]
+        for idx, p in enumerate(shown_list):
+            duplicate_check = {
+                "group": grp_id,
+                "reference": reference_path,
+                "size": int(file_size),
+                "digest": full_digest,
+            }
+            pending_rows.append(((idx > 0), "重复文件", f"组 {grp_id}", human_size(file_size), p, duplicate_check))
+            if len(pending_rows) >= UI_BATCH_CHUNK:
+                self._emit_more_rows(pending_rows)
+                pending_rows.clear()
+        if hidden > 0:
+            pending_rows.append((False, "重复文件", f"组 {grp_id}", f"{human_size(file_size)} | 另有 {hidden} 个未展开", ""))
+        dup_list.clear()
+        return len(shown_list), hidden
 
-            for quick_paths in quick_dict.values():
-                if self.stop.is_set():
-                    break
-                if len(quick_paths) < 2:
-                    continue
-                full_dict = defaultdict(list)
-                for p in quick_paths:
-                    if self.stop.is_set():
-                        break
-                    fh = _get_hash(p)
-                    if fh:
-                        full_dict[fh].append(p)
-                for full_digest, duplicates in full_dict.items():
-                    if len(duplicates) > 1:
-                        results.append((file_size, full_digest, duplicates))
-                full_dict.clear()
-            quick_dict.clear()
+    def _scan_combined(self, roots, workers, excl=None, big_options=(500, 200, True)):
+        """一次遍历完成重复文件、空文件夹、无效快捷方式、大文件与目录占用分析，结果分别发布到对应页面。"""
+        t0 = time.time()
+        min_mb, big_limit, skip_optional = big_options
+        self.sig.more_prog.emit(0, 0)
+        self.sig.more_log.emit("[综合扫描] 单次遍历：重复文件 / 空文件夹 / 快捷方式 / 大文件 / 目录占用")
+        last_report = [0.0]
+
+        def _progress(files, dirs):
+            now = time.time()
+            if now - last_report[0] >= 1.0:
+                last_report[0] = now
+                self.sig.more_log.emit(f"[综合扫描] 已遍历 {dirs} 个目录，{files} 个文件")
 
+        result = run_combined_analysis(
+            roots,
+            excl or DEFAULT_EXCLUDES,
+            workers,
+            stop_event=self.stop,
+            min_big_bytes=min_mb * 1024 * 1024,
+            big_limit=big_limit,
+            skip_optional=skip_optional,
+            fs_index=get_filesystem_index(),
+            progress_cb=_progress,
+        )
         if self.stop.is_set():
-            suspects.clear()
-            results.clear()
             self.sig.more_done.emit(f"扫描已取消，耗时 {time.time()-t0:.1f} 秒")
             return
+        self.sig.more_log.emit(f"[综合扫描] 遍历完成：{result.dirs} 个目录，{result.files} 个文件，耗时 {time.time()-t0:.1f} 秒")
 
-        for idx, (file_size, full_digest, duplicates) in enumerate(results):
-            duplicates.sort(key=lambda p: os.path.normcase(p))
-            results[idx] = (file_size, full_digest, duplicates)
-        results.sort(key=lambda item: (-item[0], os.path.normcase(item[2][0])))
-        suspects.clear()
-
-        cnt = 0
-        hidden_cnt = 0
+        # 大文件发布到大文件页
+        self.sig.big_clr.emit()
+        batch = []
+        for size, path in result.big_files[:big_limit]:
+            batch.append((str(size), path))
+            if len(batch) >= UI_BATCH_CHUNK:
+                self.sig.big_add_batch.emit(batch[:])
+                batch.clear()
+        if batch:
+            self.sig.big_add_batch.emit(batch[:])
+        self.sig.big_log.emit(f"[综合扫描] 找到 {len(result.big_files)} 个 ≥{min_mb}MB 的大文件")
+        self.sig.more_log.emit(f"[大文件] 已发布 {len(result.big_files)} 个结果到大文件页")
+
+        # 目录占用：输出每个根目录下最大的子目录
+        for root in roots:
+            root_key = os.path.normcase(os.path.abspath(root))
+            children = [
+                (size, path) for path, size in result.dir_totals.items()
+                if os.path.normcase(os.path.dirname(os.path.abspath(path))) == root_key and path != root
+            ]
+            children.sort(reverse=True)
+            for size, path in children[:10]:
+                self.sig.more_log.emit(f"[目录占用] {human_size(size)}  {path}")
+        published = publish_dir_totals(result, stop_event=self.stop)
+        if published:
+            self.sig.more_log.emit(f"[目录占用] 已缓存 {published} 个目录的大小，估算清理规则大小时将直接复用")
+        result.dir_totals.clear()
+
+        invalid_cnt = 0
         pending_rows = []
-        for grp_id, (file_size, full_digest, dup_list) in enumerate(results, 1):
-            shown_list = dup_list[:DUPLICATE_GROUP_DISPLAY_LIMIT]
-            hidden = max(0, len(dup_list) - len(shown_list))
-            reference_path = dup_list[0]
-            for idx, p in enumerate(shown_list):
-                duplicate_check = {
-                    "group": grp_id,
-                    "reference": reference_path,
-                    "size": int(file_size),
-                    "digest": full_digest,
-                }
-                pending_rows.append(((idx > 0), "重复文件", f"组 {grp_id}", human_size(file_size), p, duplicate_check))
-                cnt += 1
-                if len(pending_rows) >= UI_BATCH_CHUNK:
-                    self._emit_more_rows(pending_rows)
-                    pending_rows.clear()
-            if hidden > 0:
-                hidden_cnt += hidden
-                pending_rows.append((False, "重复文件", f"组 {grp_id}", f"{human_size(file_size)} | 另有 {hidden} 个未展开", ""))
+        for p in result.shortcuts:
+            if self.stop.is_set(): break
+            detail = get_invalid_shortcut_detail(p, log_context="解析快捷方式")
+            if detail:
+                invalid_cnt += 1
+                pending_rows.append((False, "无效快捷方式", os.path.basename(p), detail, p))
                 if len(pending_rows) >= UI_BATCH_CHUNK:
                     self._emit_more_rows(pending_rows)
                     pending_rows.clear()
-            dup_list.clear()
-        if pending_rows:
-            self._emit_more_rows(pending_rows)
-            pending_rows.clear()
-        results.clear()
-        if hidden_cnt > 0:
-            self.sig.more_log.emit(f"[重复文件] 已折叠 {hidden_cnt} 个超大重复组结果，仅展示每组前 {DUPLICATE_GROUP_DISPLAY_LIMIT} 项")
-            self.sig.more_done.emit(f"扫描完成，展示 {cnt} 个重复文件，另有 {hidden_cnt} 个未展开，耗时 {time.time()-t0:.1f} 秒")
+        self._emit_more_rows(pending_rows)
+        pending_rows.clear()
+        result.shortcuts.clear()
+
+        def _on_empty(d):
+            pending_rows.append((False, "空文件夹", os.path.basename(d), "无内容", d))
+            if len(pending_rows) >= UI_BATCH_CHUNK:
+                self._emit_more_rows(pending_rows)
+                pending_rows.clear()
+
+        empty_set = confirm_empty_dirs(result.empty_dir_candidates, stop_event=self.stop, on_empty=_on_empty)
+        self._emit_more_rows(pending_rows)
+        pending_rows.clear()
+        empty_total = len(empty_set)
+        empty_set.clear()
+
+        hard_links = []
+        dup_counts = self._resolve_duplicate_groups(
+            result.duplicate_candidates,
+            workers=workers,
+            hard_links=hard_links,
+        ) if not self.stop.is_set() else None
+        if dup_counts is None or self.stop.is_set():
+            self.sig.more_done.emit(f"扫描已取消，耗时 {time.time()-t0:.1f} 秒")
             return
-        self.sig.more_done.emit(f"扫描完成，找到 {cnt} 个重复文件，耗时 {time.time()-t0:.1f} 秒")
+        dup_cnt, _hidden = dup_counts
+        self._emit_hard_link_rows(hard_links)
+        self.sig.more_done.emit(
+            f"综合扫描完成：重复文件 {dup_cnt} 个，空文件夹 {empty_total} 个，无效快捷方式 {invalid_cnt} 个，"
+            f"大文件 {len(result.big_files)} 个，耗时 {time.time()-t0:.1f} 秒"
+        )
 
-    def _scan_empty_dirs(self, roots, workers):
+    def _scan_empty_dirs(self, roots, workers, excl=None):
         t0 = time.time()
-        _, dirs = self._walk_files_threaded(roots, DEFAULT_EXCLUDES, workers, collect_dirs=True)
+        self.sig.more_prog.emit(0, 0)
+        dirs = collect_empty_dir_candidates(self._iter_walk(roots, excl or DEFAULT_EXCLUDES, workers), stop_event=self.stop)
         if self.stop.is_set():
             dirs.clear()
             self.sig.more_done.emit(f"扫描已取消，耗时 {time.time()-t0:.1f} 秒")
             return
-        dirs.sort(key=len, reverse=True); empty_set = set(); tot = len(dirs)
         pending_rows = []
-        for i, d in enumerate(dirs):
-            if self.stop.is_set(): break
-            if i % 500 == 0: self.sig.more_prog.emit(i, tot)
-            try:
-                if is_directory_empty(d, known_empty_dirs=empty_set):
-                    empty_set.add(d)
-                    pending_rows.append((False, "空文件夹", os.path.basename(d), "无内容", d))
-                    if len(pending_rows) >= UI_BATCH_CHUNK:
-                        self._emit_more_rows(pending_rows)
-                        pending_rows.clear()
-            except Exception as e:
-                log_sampled_background_error("空文件夹扫描", e)
+
+        def _on_empty(d):
+            pending_rows.append((False, "空文件夹", os.path.basename(d), "无内容", d))
+            if len(pending_rows) >= UI_BATCH_CHUNK:
+                self._emit_more_rows(pending_rows)
+                pending_rows.clear()
+
+        empty_set = confirm_empty_dirs(
+            dirs,
+            stop_event=self.stop,
+            progress_cb=lambda i, tot: self.sig.more_prog.emit(i, tot),
+            on_empty=_on_empty,
+        )
         if self.stop.is_set():
             dirs.clear()
             empty_set.clear()
@@ -12430,34 +16001,39 @@ class MoreCleanPage(DeferredPageMixin, ScrollArea):
         empty_set.clear()
         self.sig.more_done.emit(f"扫描完成，找到 {empty_total} 个空文件夹，耗时 {time.time()-t0:.1f} 秒")
 
-    def _scan_shortcuts(self, roots, workers):
+    def _scan_shortcuts(self, roots, workers, excl=None):
         t0 = time.time()
-        files, _ = self._walk_files_threaded(roots, DEFAULT_EXCLUDES, workers, ext_filter=".lnk", collect_files=True)
-        if self.stop.is_set():
-            files.clear()
-            self.sig.more_done.emit(f"扫描已取消，耗时 {time.time()-t0:.1f} 秒")
-            return
-        tot = len(files); invalid_cnt = 0
+        self.sig.more_prog.emit(0, 0)
+        invalid_cnt = 0
+        checked = 0
+        last_report = time.time()
         pending_rows = []
-        for i, (_, p) in enumerate(files):
+        # 边遍历边校验，不再先收集全部 .lnk 路径；总数未知，按已检查数量汇报进度
+        for batch in self._iter_walk(roots, excl or DEFAULT_EXCLUDES, workers, ext_filter=".lnk", want_dirs=False):
             if self.stop.is_set(): break
-            if i % 100 == 0: self.sig.more_prog.emit(i, tot)
-            detail = get_invalid_shortcut_detail(p, log_context="解析快捷方式")
-            if detail:
-                pending_rows.append((False, "无效快捷方式", os.path.basename(p), detail, p))
-                invalid_cnt += 1
-                if len(pending_rows) >= UI_BATCH_CHUNK:
-                    self._emit_more_rows(pending_rows)
-                    pending_rows.clear()
+            for _size, p, _is_dir in batch:
+                if self.stop.is_set(): break
+                checked += 1
+                if checked % 100 == 0:
+                    self.sig.more_prog.emit(checked, 0)
+                    now = time.time()
+                    if now - last_report >= 1.0:
+                        last_report = now
+                        self.sig.more_log.emit(f"[快捷方式] 已检查 {checked} 个，发现 {invalid_cnt} 个无效")
+                detail = get_invalid_shortcut_detail(p, log_context="解析快捷方式")
+                if detail:
+                    pending_rows.append((False, "无效快捷方式", os.path.basename(p), detail, p))
+                    invalid_cnt += 1
+                    if len(pending_rows) >= UI_BATCH_CHUNK:
+                        self._emit_more_rows(pending_rows)
+                        pending_rows.clear()
         if self.stop.is_set():
-            files.clear()
             pending_rows.clear()
             self.sig.more_done.emit(f"扫描已取消，耗时 {time.time()-t0:.1f} 秒")
             return
         if pending_rows:
             self._emit_more_rows(pending_rows)
             pending_rows.clear()
-        files.clear()
         self.sig.more_done.emit(f"扫描完成，找到 {invalid_cnt} 个无效快捷方式，耗时 {time.time()-t0:.1f} 秒")
 
     def _scan_registry(self):
@@ -12582,9 +16158,24 @@ class MoreCleanPage(DeferredPageMixin, ScrollArea):
         mode_idx = self.cb_mode.currentIndex()
         is_reg = mode_idx in (3, 4)
         duplicate_expectations = None
+        entry_kinds = None
+        other_entries = []
+        if mode_idx == 5:
+            # 综合扫描的结果混合了多种类型，按行类型分别走对应的删除校验
+            entry_kinds = {}
+            duplicate_rows = []
+            for row in selected_entries:
+                if not row.get("path"):
+                    continue
+                if row.get("type") in ("重复文件", DUPLICATE_HARD_LINK_TYPE):
+                    duplicate_rows.append(row)
+                    continue
+                entry_kinds[_normalize_safety_path(row["path"])] = "empty" if row.get("type") == "空文件夹" else "file"
+                other_entries.append(row)
+            selected_entries = duplicate_rows
 
         # 为避免误删系统盘内容，重复文件模式禁止清理 C 盘文件
-        if mode_idx == 0:
+        if mode_idx in (0, 5):
             blocked = []
             retained = []
             missing_checks = []
@@ -12633,6 +16224,18 @@ class MoreCleanPage(DeferredPageMixin, ScrollArea):
                 _normalize_safety_path(row.get("path", "")): dict(row["duplicate_check"])
                 for row in allowed_entries
             }
+            if entry_kinds is not None:
+                for path in paths:
+                    entry_kinds[_normalize_safety_path(path)] = "duplicate"
+                # 同一路径可能以多种类型出现在混合结果中，只处理一次并按最严格的重复文件复核
+                unique_paths = []
+                seen_paths = set()
+                for path in paths + [row["path"] for row in other_entries]:
+                    key = _normalize_safety_path(path)
+                    if key not in seen_paths:
+                        seen_paths.add(key)
+                        unique_paths.append(path)
+                paths = unique_paths
 
             if not paths:
                 return
@@ -12661,31 +16264,35 @@ class MoreCleanPage(DeferredPageMixin, ScrollArea):
             start_page_worker(
                 self,
                 self._del_files_w,
-                args=(paths, self.chk_perm.isChecked(), mode_idx == 1, duplicate_expectations),
+                args=(paths, self.chk_perm.isChecked(), mode_idx == 1, duplicate_expectations, entry_kinds),
             )
 
-    def _del_files_w(self, paths, pm, require_empty=False, duplicate_expectations=None):
+    def _del_files_w(self, paths, pm, require_empty=False, duplicate_expectations=None, entry_kinds=None):
+        """entry_kinds 为 {规范化路径: "duplicate"/"empty"/"file"} 时按每项类型分别复核，用于综合扫描的混合结果。"""
         t0 = time.time()
         ok=fl=sk=0; tot=len(paths); lf=lambda s:self.sig.more_log.emit(s)
         duplicate_reference_cache = {} if duplicate_expectations is not None else None
+        hash_cache = get_content_hash_cache() if duplicate_expectations is not None else None
         for i,p in enumerate(paths,1):
             if self.stop.is_set():
                 self.sig.more_done.emit(f"清理已取消：成功 {ok}，失败 {fl}，跳过 {sk}，耗时 {time.time()-t0:.1f} 秒")
                 return
-            if duplicate_expectations is not None:
+            kind = entry_kinds.get(_normalize_safety_path(p), "file") if entry_kinds is not None else None
+            if duplicate_expectations is not None and kind in (None, "duplicate"):
                 expectation = duplicate_expectations.get(_normalize_safety_path(p))
                 valid, reason = validate_duplicate_deletion_candidate(
                     p,
                     expectation,
                     stop_event=self.stop,
                     reference_cache=duplicate_reference_cache,
+                    hash_cache=hash_cache,
                 )
                 if not valid:
                     sk += 1
                     lf(f"[重复文件复核] 已跳过: {p} -> {reason}")
                     self.sig.more_prog.emit(i,tot)
                     continue
-            if require_empty:
+            if require_empty if kind is None else kind == "empty":
                 result = delete_empty_directory_safely(p, pm, lf)
                 if result == "deleted":
                     ok += 1
@@ -12697,6 +16304,8 @@ class MoreCleanPage(DeferredPageMixin, ScrollArea):
                 if delete_path(p,pm,lf): ok+=1
                 else: fl+=1
             self.sig.more_prog.emit(i,tot)
+        if hash_cache is not None:
+            hash_cache.flush()
         self.sig.more_done.emit(f"清理完成：成功 {ok}，失败 {fl}，跳过 {sk}，耗时 {time.time()-t0:.1f} 秒")
 
     def _del_reg_w(self, paths):
@@ -12828,7 +16437,6 @@ class MainWindow(MSFluentWindow):
         self._detected_disk_info = None
         self._disk_detect_lock = threading.Lock()
         self._disk_detecting = False
-        self._last_forced_disk_detect_ts = 0.0
         self._prewarm_attr_names = ("pg_rule_store", "pg_uninstall", "pg_big", "pg_more")
         self._update_lock = threading.Lock()
         self._update_checking = False
@@ -12862,7 +16470,7 @@ class MainWindow(MSFluentWindow):
 
         self._init_nav(); self._init_win(); self._init_tray(); self._conn()
         self.apply_language()
-        self._request_disk_detect(force=False)
+        self._request_disk_detect()
         QTimer.singleShot(2000, lambda: None if self._is_shutting_down() else self.check_updates(manual=False))
         QTimer.singleShot(900, lambda: None if self._is_shutting_down() else self._warmup_schedule_page())
         QTimer.singleShot(1500, lambda: None if self._is_shutting_down() else self._schedule_lazy_prewarm())
@@ -13345,6 +16953,11 @@ class MainWindow(MSFluentWindow):
         sections.append(session_text if session_text else "(无)")
         sections.append("")
 
+        metrics_text = format_recent_scan_metrics().strip()
+        sections.append("===== 扫描指标 =====")
+        sections.append(metrics_text if metrics_text else "(无)")
+        sections.append("")
+
         page_logs = [
             ("常规清理", getattr(self.pg_clean, "log", None)),
             ("大文件扫描", getattr(self.pg_big, "log", None)),
@@ -14023,37 +17636,23 @@ class MainWindow(MSFluentWindow):
         self._more_flush_timer.stop()
         self.pg_more.reset_result_view()
 
-    def _request_disk_detect(self, force=False):
+    def _request_disk_detect(self):
         if self._is_shutting_down():
             return
         try:
             with self._disk_detect_lock:
                 if self._disk_detecting:
                     return
-                now = time.time()
-                if force and now - self._last_forced_disk_detect_ts < 8:
-                    return
                 self._disk_detecting = True
-                if force:
-                    self._last_forced_disk_detect_ts = now
-            threading.Thread(target=self._async_detect, args=(force,), daemon=True).start()
+            threading.Thread(target=self._async_detect, daemon=True).start()
         except Exception as e:
             log_sampled_background_error("请求磁盘检测失败", e)
 
-    def _async_detect(self, force=False):
+    def _async_detect(self):
         try:
             if self._is_shutting_down():
                 return
-            if force:
-                threads, dtype = get_scan_threads("C")
-                try:
-                    drives = _load_scan_cache()
-                    drives["C"] = {"threads": threads, "dtype": dtype, "ts": time.time()}
-                    _save_scan_cache(drives)
-                except Exception as e:
-                    log_sampled_background_error("更新磁盘检测缓存失败", e)
-            else:
-                threads, dtype = get_scan_threads_cached("C")
+            threads, dtype = get_scan_threads_cached("C")
             if not self._is_shutting_down():
                 self._detected_disk_info = (dtype, threads)
                 self.sig.disk_ready.emit(dtype, threads)
@@ -14167,7 +17766,10 @@ class MainWindow(MSFluentWindow):
 
     def _page_prog(self, page, v, m):
         if m <= 0:
+            # 总数未知（流式扫描）时进度条保持不确定状态，只在状态栏显示已处理数量
             page.pb.setRange(0, 0)
+            if v > 0:
+                page.footer.set_status(f"{page.sl.text().split('  ')[0]}  已处理 {v} 项")
         else:
             page.pb.setRange(0, max(1, m))
             page.pb.setValue(v)
@@ -14248,14 +17850,7 @@ class MainWindow(MSFluentWindow):
         del self._pending_big_rows[:len(chunk)]
         rows = []
         for sz_str, pa in chunk:
-            size_int = int(sz_str)
-            rows.append({
-                "checked": False,
-                "name": os.path.basename(pa) if pa else "",
-                "size": size_int,
-                "size_text": human_size(size_int),
-                "path": pa
-            })
+            rows.append({"checked": False, "size": int(sz_str), "path": pa})
         self.pg_big.add_result_rows(rows)
         if self._pending_big_rows:
             self._big_flush_timer.start(0)
@@ -14391,5 +17986,7 @@ def main():
     app = QApplication(sys.argv); setFontFamilies(["微软雅黑"]); setTheme(resolve_theme_enum(initial_theme_mode)); setThemeColor(get_windows_accent_color())
     w = MainWindow(); w.show(); sys.exit(app.exec())
 
-if __name__=="__main__": main()
+if __name__=="__main__":
+    multiprocessing.freeze_support()
+    main()
 
@@ -3,8 +3,10 @@ import hashlib
 import io
 import json
 import os
+import shutil
 import tempfile
 import threading
+import time
 import types
 import unittest
 from unittest import mock
@@ -805,6 +807,1154 @@ class SafetyRegressionTests(unittest.TestCase):
         self.assertTrue(required.issubset(pack))
         self.assertEqual(payload["version"], manifest["languages"]["en_us"]["version"])
 
+    def test_filesystem_index_serves_repeat_walks_without_rescanning(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            nested = os.path.join(root, "nested")
+            os.makedirs(os.path.join(nested, "empty"))
+            with open(os.path.join(nested, "big.bin"), "wb") as stream:
+                stream.write(b"x" * 4096)
+            with open(os.path.join(root, "note.lnk"), "wb") as stream:
+                stream.write(b"L")
+            index = main.FileSystemIndex(os.path.join(temp_dir, "index.sqlite3"))
+            try:
+                files, dirs = main.walk_files_threaded(
+                    [root], [], 2, collect_files=True, collect_dirs=True, fs_index=index
+                )
+                self.assertEqual(len(files), 2)
+                self.assertEqual(len(dirs), 2)
+                self.assertTrue(index.covers([root], []))
+
+                with mock.patch.object(main.os, "scandir", side_effect=AssertionError("rescanned")):
+                    indexed_files, indexed_dirs = main.walk_files_threaded(
+                        [root], [], 2, ext_filter=".lnk", collect_files=True, collect_dirs=True, fs_index=index
+                    )
+                    big = main.scan_big_files([root], 1024, [], threading.Event(), workers=2, fs_index=index)
+                    nested_size = index.subtree_size(nested)
+
+                self.assertEqual([os.path.basename(p) for _size, p in indexed_files], ["note.lnk"])
+                self.assertEqual(sorted(indexed_dirs), sorted(dirs))
+                self.assertEqual(big, [(4096, os.path.join(nested, "big.bin"))])
+                self.assertEqual(nested_size, 4096)
+
+                index.forget(nested)
+                self.assertEqual(index.subtree_size(nested), 0)
+            finally:
+                index.close()
+
+    def test_incremental_walk_reuses_unchanged_directory_listings(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            nested = os.path.join(root, "nested")
+            os.makedirs(os.path.join(root, "stable", "deep"))
+            os.makedirs(nested)
+            with open(os.path.join(root, "stable", "deep", "old.lnk"), "wb") as stream:
+                stream.write(b"L")
+            index = main.FileSystemIndex(os.path.join(temp_dir, "index.sqlite3"))
+            real_scandir = os.scandir
+            listed = []
+
+            def counting_scandir(path):
+                listed.append(path)
+                return real_scandir(path)
+
+            try:
+                main.walk_files_threaded([root], [], 2, collect_dirs=True, fs_index=index, incremental=True)
+                with (
+                    mock.patch.object(main, "FS_INDEX_MAX_AGE_SEC", -1),
+                    mock.patch.object(main.os, "scandir", side_effect=counting_scandir),
+                ):
+                    files, dirs = main.walk_files_threaded(
+                        [root], [], 2, ext_filter=".lnk", collect_files=True, collect_dirs=True,
+                        fs_index=index, incremental=True,
+                    )
+                    self.assertEqual(listed, [])
+                    self.assertEqual(len(dirs), 3)
+                    self.assertEqual([os.path.basename(p) for _size, p in files], ["old.lnk"])
+
+                    time.sleep(0.01)
+                    with open(os.path.join(nested, "new.lnk"), "wb") as stream:
+                        stream.write(b"L")
+                    files, _dirs = main.walk_files_threaded(
+                        [root], [], 2, ext_filter=".lnk", collect_files=True,
+                        fs_index=index, incremental=True,
+                    )
+                self.assertEqual(listed, [nested])
+                self.assertEqual(sorted(os.path.basename(p) for _size, p in files), ["new.lnk", "old.lnk"])
+            finally:
+                index.close()
+
+    def test_scan_exclusion_matcher_prunes_prefixes_and_globs(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            for rel in ("Builds/out", "app/node_modules/pkg", "app/src", "app/.git/objects"):
+                os.makedirs(os.path.join(root, *rel.split("/")))
+            excludes = [os.path.join(root, "Builds"), "node_modules", os.path.join(root, "app", ".g*")]
+            matcher = main.ScanExclusionMatcher(excludes)
+
+            self.assertTrue(matcher.matches(os.path.join(root, "Builds", "out")))
+            self.assertFalse(matcher.matches(os.path.join(root, "Builds2")))
+            self.assertTrue(matcher.matches(os.path.join(root, "app", "node_modules")))
+            self.assertTrue(matcher.matches_path_or_ancestor(os.path.join(root, "app", "node_modules", "pkg", "a.js")))
+            self.assertTrue(matcher.matches(os.path.join(root, "app", ".git")))
+            self.assertFalse(matcher.matches(os.path.join(root, "app", "src")))
+            self.assertTrue(main.should_exclude(os.path.join(root, "Builds"), excludes))
+
+            _files, dirs = main.walk_files_threaded([root], excludes, 2, collect_dirs=True)
+
+        self.assertEqual(
+            sorted(os.path.relpath(path, root) for path in dirs),
+            sorted(["app", os.path.join("app", "src")]),
+        )
+        self.assertEqual(main.normalize_scan_exclude_patterns(' D:\\Builds ;node_modules;;"*.git"'), ["D:\\Builds", "node_modules", "*.git"])
+
+    def test_work_stealing_walker_visits_every_directory_once_and_honours_stop(self):
+        children = {str(i): [f"{i}/{j}" for j in range(40)] for i in range(30)}
+        visited = []
+        visited_lock = threading.Lock()
+
+        def visit(path, push):
+            with visited_lock:
+                visited.append(path)
+            for child in children.get(path, []) if path != "root" else list(children):
+                push(child)
+
+        walker = main.WorkStealingWalker(["root"], visit, workers=8)
+        self.assertTrue(walker.run())
+        self.assertTrue(walker.completed)
+        self.assertEqual(len(visited), 1 + 30 + 30 * 40)
+        self.assertEqual(len(set(visited)), len(visited))
+
+        stop = threading.Event()
+
+        def stopping_visit(path, push):
+            stop.set()
+            push(path + "/x")
+
+        walker = main.WorkStealingWalker(["root"], stopping_visit, workers=4, stop_event=stop)
+        self.assertTrue(walker.run())
+        self.assertFalse(walker.completed)
+
+    def test_process_scan_backend_merges_per_root_results(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            roots = [os.path.join(temp_dir, "c"), os.path.join(temp_dir, "d")]
+            sizes = {os.path.join(roots[0], "a", "one.bin"): 3000, os.path.join(roots[1], "two.bin"): 5000,
+                     os.path.join(roots[1], "b", "tiny.bin"): 10}
+            for path, size in sizes.items():
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as stream:
+                    stream.write(b"x" * size)
+
+            published = []
+            main.add_scan_metrics_listener(published.append)
+            try:
+                big = main.scan_big_files(roots, 1024, [], threading.Event(), workers=4, result_limit=1, use_processes=True)
+                files, dirs = main.walk_files_threaded(roots, [], 4, collect_files=True, collect_dirs=True, use_processes=True)
+            finally:
+                main.remove_scan_metrics_listener(published.append)
+
+        finals = [snapshot for snapshot in published if snapshot["final"]]
+        self.assertEqual([snapshot["backend"] for snapshot in finals], ["process", "process"])
+        self.assertEqual(finals[1]["files"], 3)
+        self.assertEqual(big, [(5000, os.path.join(roots[1], "two.bin"))])
+        self.assertEqual(sorted(files), sorted((size, path) for path, size in sizes.items()))
+        self.assertEqual(sorted(dirs), sorted([os.path.join(roots[0], "a"), os.path.join(roots[1], "b")]))
+
+    def test_iter_walk_streams_batches_and_finds_empty_dirs(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            for i in range(20):
+                os.makedirs(os.path.join(root, f"busy{i}", "inner"))
+                with open(os.path.join(root, f"busy{i}", "inner", "a.lnk"), "wb") as stream:
+                    stream.write(b"L")
+            os.makedirs(os.path.join(root, "empty", "nested"))
+
+            seen = []
+            for batch in main.iter_walk([root], [], 4, batch_size=3, max_pending=1):
+                self.assertLessEqual(len(batch), 3)
+                seen.extend(batch)
+            self.assertEqual(sum(1 for _size, _path, is_dir in seen if not is_dir), 20)
+            self.assertEqual(sum(1 for _size, _path, is_dir in seen if is_dir), 42)
+
+            walker = main.iter_walk([root], [], 4, batch_size=1, max_pending=1)
+            next(walker)
+            walker.close()
+
+            candidates = main.collect_empty_dir_candidates(main.iter_walk([root], [], 4, batch_size=5))
+            self.assertEqual(candidates[0], os.path.join(root, "empty", "nested"))
+            empty = main.confirm_empty_dirs(candidates)
+
+        self.assertEqual(sorted(empty), sorted([os.path.join(root, "empty"), os.path.join(root, "empty", "nested")]))
+
+    def test_combined_analysis_feeds_every_analyzer_from_one_walk(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            os.makedirs(os.path.join(root, "a", "deep"))
+            os.makedirs(os.path.join(root, "b"))
+            os.makedirs(os.path.join(root, "hollow", "inner"))
+            for rel, size in (("a/one.bin", 64), ("b/two.bin", 64), ("a/deep/big.iso", 4096), ("b/link.lnk", 3)):
+                with open(os.path.join(root, *rel.split("/")), "wb") as stream:
+                    stream.write(b"x" * size)
+
+            progress = []
+            result = main.run_combined_analysis(
+                [root], [], 2, min_big_bytes=1024, big_limit=5, progress_cb=lambda f, d: progress.append((f, d))
+            )
+
+        self.assertEqual((result.files, result.dirs), (4, 5))
+        groups = result.duplicate_candidates.group_indices_by_size()
+        self.assertEqual(list(groups), [64])
+        self.assertEqual(
+            sorted(result.duplicate_candidates.paths_at(groups[64])),
+            sorted([os.path.join(root, "a", "one.bin"), os.path.join(root, "b", "two.bin")]),
+        )
+        self.assertEqual(result.empty_dir_candidates[0], os.path.join(root, "hollow", "inner"))
+        self.assertEqual(result.shortcuts, [os.path.join(root, "b", "link.lnk")])
+        self.assertEqual(result.big_files, [(4096, os.path.join(root, "a", "deep", "big.iso"))])
+        self.assertEqual(result.dir_totals[os.path.join(root, "a")], 64 + 4096)
+        self.assertEqual(result.dir_totals[root], 64 + 64 + 4096 + 3)
+        self.assertEqual(progress[-1], (4, 5))
+
+    def test_tree_size_aggregator_walks_each_root_once(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            for rel, size in (("a/x.bin", 10), ("a/deep/y.bin", 20), ("b/z.bin", 30), ("top.bin", 5)):
+                path = os.path.join(root, *rel.split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as stream:
+                    stream.write(b"x" * size)
+
+            sizes = main.TreeSizeAggregator()
+            self.assertEqual(sizes.size(os.path.join(root, "a")), 30)
+            self.assertEqual(sizes.size(os.path.join(root, "b")), 30)
+            real_scandir = os.scandir
+            with mock.patch.object(main.os, "scandir", side_effect=real_scandir) as scandir:
+                self.assertEqual(sizes.size(os.path.join(root, "a", "deep")), 20)
+                self.assertEqual(sizes.size(root), 65)
+            scanned = {os.path.normcase(call.args[0]) for call in scandir.call_args_list}
+            self.assertEqual(scanned, {os.path.normcase(root)})
+            self.assertTrue(sizes.size_detailed(root).complete)
+            self.assertEqual(main.dir_size(root), 65)
+
+            stale = main.DirectorySizeCache(ttl=60)
+            stale.put(root, main.DirectorySizeResult(size=999), signature=main._dir_size_signature(root))
+            with mock.patch.object(main, "_dir_size_cache", stale):
+                self.assertEqual(main.TreeSizeAggregator().size(root), 65)
+                self.assertEqual(main.TreeSizeAggregator(use_cache=True).size(root), 999)
+                main.TreeSizeAggregator().size(os.path.join(root, "b"))
+                self.assertIsNone(stale.get(os.path.join(root, "b")))
+
+    def test_dir_size_cache_validates_signature_and_evicts(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            nested = os.path.join(root, "nested")
+            os.makedirs(nested)
+            with open(os.path.join(nested, "a.bin"), "wb") as stream:
+                stream.write(b"x" * 10)
+            cache = main.DirectorySizeCache(max_entries=2, ttl=60)
+            with mock.patch.object(main, "_dir_size_cache", cache):
+                self.assertEqual(main.dir_size(root, use_cache=True), 10)
+                with mock.patch.object(main.os, "scandir", side_effect=AssertionError("cache miss")):
+                    self.assertEqual(main.dir_size(root, use_cache=True), 10)
+                with open(os.path.join(nested, "a.bin"), "ab") as stream:
+                    stream.write(b"x" * 10)
+                self.assertEqual(main.dir_size(root), 20)
+                self.assertEqual(main.dir_size(root, use_cache=True), 10)
+                with open(os.path.join(nested, "a.bin"), "wb") as stream:
+                    stream.write(b"x" * 10)
+
+                with open(os.path.join(root, "b.bin"), "wb") as stream:
+                    stream.write(b"x" * 5)
+                os.utime(root, ns=(0, 123456789))
+                self.assertEqual(main.dir_size(root, use_cache=True), 15)
+
+                self.assertEqual(main.dir_size(nested, use_cache=True), 10)
+                cache.invalidate(os.path.join(nested, "a.bin"))
+                self.assertIsNone(cache.get(root))
+                self.assertIsNone(cache.get(nested))
+
+                for path in (root, nested, temp_dir):
+                    main.dir_size(path, use_cache=True)
+                self.assertIsNone(cache.get(root))
+                self.assertIsNotNone(cache.get(temp_dir))
+
+                cache.ttl = 0
+                self.assertIsNone(cache.get(temp_dir))
+
+    def test_compact_scan_results_round_trip_rows_and_share_directories(self):
+        base = os.path.join(tempfile.gettempdir(), "compact")
+        store = main.CompactScanResults(fields=("type", "detail"))
+        store.extend([
+            {"checked": False, "type": "重复文件", "name": "a.bin", "detail": "组 1", "path": os.path.join(base, "x", "a.bin"),
+             "duplicate_check": {"reference": "r"}},
+            {"checked": True, "type": "注册表", "name": "Display Name", "detail": "-", "path": "HKLM\\Software\\Vendor"},
+            (7, os.path.join(base, "x", "b.bin")),
+        ])
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store[0]["path"], os.path.join(base, "x", "a.bin"))
+        self.assertEqual(store[0].get("duplicate_check"), {"reference": "r"})
+        self.assertIsNone(store[2].get("duplicate_check"))
+        self.assertEqual(store[1]["name"], "Display Name")
+        self.assertEqual(store[1]["path"], "HKLM\\Software\\Vendor")
+        self.assertEqual(store[2]["name"], "b.bin")
+        self.assertEqual(store._dirs[0], store._dirs[2])
+        self.assertEqual([row["path"] for row in store[1:]], [store.path(1), store.path(2)])
+
+        store[0]["checked"] = True
+        store.sort(key=lambda row: row["size"], reverse=True)
+        self.assertEqual(store[0]["size"], 7)
+        self.assertEqual([store[i]["type"] for i in store.iter_checked()], ["重复文件", "注册表"])
+        self.assertEqual(store[1].to_dict()["duplicate_check"], {"reference": "r"})
+        store.set_all_checked(True)
+        self.assertTrue(store.all_checked())
+
+    def test_compact_walk_materializes_paths_from_parent_tree(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            for rel in ("node_modules/a/index.js", "node_modules/b/index.js", "node_modules/b/lib/util.js", "top.txt"):
+                path = os.path.join(root, *rel.split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as stream:
+                    stream.write(b"x" * len(rel))
+
+            plain_files, plain_dirs = main.walk_files_threaded([root], [], 3, collect_files=True, collect_dirs=True)
+            files, dirs = main.walk_files_threaded(
+                [root], [], 3, collect_files=True, collect_dirs=True, file_result_mode="compact"
+            )
+
+        self.assertIsInstance(files, main.CompactScanResults)
+        self.assertEqual(sorted((files.size(i), files.path(i)) for i in range(len(files))), sorted(plain_files))
+        self.assertEqual(sorted(dirs.paths()), sorted(plain_dirs))
+        names = [files._names[i] for i in range(len(files)) if files._names[i] == "index.js"]
+        self.assertEqual(len(names), 2)
+        self.assertIs(names[0], names[1])
+
+    def test_scan_metrics_report_throughput_roots_and_new_error_categories(self):
+        snapshots = []
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            for i in range(6):
+                os.makedirs(os.path.join(root, f"d{i}"))
+                with open(os.path.join(root, f"d{i}", "f.bin"), "wb") as stream:
+                    stream.write(b"x" * 100)
+
+            def _file_cb(_size, _path):
+                main.log_sampled_background_error("指标测试类别", RuntimeError("boom"), limit=0)
+
+            main.add_scan_metrics_listener(snapshots.append)
+            try:
+                main.walk_files_threaded([root], [], 2, file_cb=_file_cb, log_context="指标测试")
+            finally:
+                main.remove_scan_metrics_listener(snapshots.append)
+
+        final = [snap for snap in snapshots if snap["final"] and snap["name"] == "指标测试"][-1]
+        self.assertEqual((final["files"], final["bytes_stat"], final["backend"]), (6, 600, "threads"))
+        self.assertGreaterEqual(final["dirs"], 7)
+        self.assertEqual(list(final["root_elapsed"]), [root])
+        self.assertEqual(final["errors"], {"指标测试类别": 6})
+        self.assertIn("指标测试 (threads)", main.format_recent_scan_metrics())
+
+    def test_scan_autotuner_climbs_to_throughput_peak_and_walker_resizes(self):
+        tuner = main.ScanAutotuner(4, max_workers=32, window=1.0, budget=60.0)
+        throughput = {1: 100, 2: 180, 3: 250, 4: 300, 6: 420, 9: 380, 14: 300}
+        now, units = 0.0, 0
+        self.assertIsNone(tuner.observe(now, units))
+        while not tuner.settled:
+            now += 1.0
+            units += throughput[tuner.current]
+            tuner.observe(now, units)
+        self.assertEqual(tuner.best, 6)
+
+        visited = []
+        visited_lock = threading.Lock()
+
+        def visit(path, push):
+            time.sleep(0.001)
+            with visited_lock:
+                visited.append(path)
+            if path.count("/") < 3:
+                for i in range(6):
+                    push(f"{path}/{i}")
+            return 1
+
+        walker = main.WorkStealingWalker(["r"], visit, workers=2, autotune=True, max_workers=8)
+        walker.start()
+        walker.set_active_workers(8)
+        walker.set_active_workers(1)
+        walker.set_active_workers(3)
+        self.assertTrue(walker.wait(30))
+        self.assertTrue(walker.join(5))
+        self.assertTrue(walker.completed)
+        self.assertEqual(len(visited), 1 + 6 + 36 + 216)
+        self.assertEqual(walker.work_done(), 2 * len(visited))
+
+    def test_device_walkers_use_per_volume_thread_limits(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            roots = [os.path.join(temp_dir, name) for name in ("ssd", "hdd", "ssd2")]
+            for root in roots:
+                os.makedirs(os.path.join(root, "sub"))
+                with open(os.path.join(root, "sub", "big.bin"), "wb") as stream:
+                    stream.write(b"x" * 2048)
+            devices = {roots[0]: "S:", roots[1]: "H:", roots[2]: "S:"}
+            limits = {"S:": (6, "Tuned"), "H:": (1, "Tuned")}
+            created = []
+            real_walker = main.WorkStealingWalker
+
+            def recording_walker(device_roots, visit, workers=4, **kwargs):
+                created.append((sorted(device_roots), workers))
+                return real_walker(device_roots, visit, workers=workers, **kwargs)
+
+            with (
+                mock.patch.object(main, "_scan_device_key", side_effect=lambda root: devices[root]),
+                mock.patch.object(main, "get_scan_threads_cached", side_effect=lambda letter: limits[letter]),
+                mock.patch.object(main, "WorkStealingWalker", side_effect=recording_walker),
+            ):
+                self.assertEqual([key for key, _ in main.group_roots_by_device(roots)], ["S:", "H:"])
+                big = main.scan_big_files(roots, 1024, [], threading.Event(), workers=12)
+
+        self.assertEqual(sorted(created), sorted([(sorted([roots[0], roots[2]]), 6), ([roots[1]], 1)]))
+        self.assertEqual(sorted(path for _size, path in big), sorted(os.path.join(root, "sub", "big.bin") for root in roots))
+
+    def test_fast_mft_scan_streams_partial_results_and_kills_helper_on_stop(self):
+        class FakeHelper:
+            def __init__(self, lines, hold_open):
+                self.killed = threading.Event()
+                self.returncode = None
+                self.stderr = io.BytesIO(b"")
+                self._lines = lines
+                self._hold_open = hold_open
+                self.stdout = self._stream()
+
+            def _stream(self):
+                for line in self._lines:
+                    yield line.encode("utf-8")
+                if self._hold_open:
+                    self.killed.wait(5)
+
+            def kill(self):
+                self.returncode = 1
+                self.killed.set()
+
+            def wait(self, timeout=None):
+                if self.returncode is None:
+                    self.returncode = 0
+                return self.returncode
+
+        lines = [
+            '{"progress":16384,"total":32768,"root":"C:\\\\"}\n',
+            '{"progress":32768,"total":32768,"root":"C:\\\\"}\n',
+            '{"size":900,"path":"C:\\\\a.bin"}\n',
+            '{"size":700,"path":"C:\\\\b.bin"}\n',
+            '{"size":800,"path":"C:\\\\c.bin"}\n',
+            '{"root_done":"C:\\\\","rows":3}\n',
+            '{"progress":100,"total":100,"root":"D:\\\\"}\n',
+            '{"size":950,"path":"D:\\\\d.bin"}\n',
+            '{"root_done":"D:\\\\","rows":1}\n',
+        ]
+        helpers = []
+
+        def spawn(hold_open):
+            def _popen(*_args, **_kwargs):
+                helpers.append(FakeHelper(lines[:6] if hold_open else lines, hold_open))
+                return helpers[-1]
+            return _popen
+
+        base_patches = (
+            mock.patch.dict(os.environ, {"C_CLEANER_PLUS_MFT_JSON": "1"}),
+            mock.patch.object(main, "_is_drive_root_path", return_value=True),
+            mock.patch.object(main, "_fast_mft_bigfile_exe_path", return_value="fast_large_files.exe"),
+        )
+        partials, ranges, counts = [], [], []
+        with mock.patch.object(main.os, "name", "nt"), base_patches[0], base_patches[1], base_patches[2], \
+                mock.patch.object(main.subprocess, "Popen", side_effect=spawn(False)):
+            results = main._scan_big_files_fast_mft(
+                ["C:\\", "D:\\"], 750, [], threading.Event(), result_limit=2,
+                partial_cb=partials.append, progress_cb=counts.append,
+                progress_range_cb=lambda done, total: ranges.append((done, total)),
+            )
+        self.assertEqual(results, [(950, "D:\\d.bin"), (900, "C:\\a.bin")])
+        self.assertEqual(partials[0], [(900, "C:\\a.bin"), (800, "C:\\c.bin")])
+        self.assertEqual(ranges[-1], (32868, 32868))
+        self.assertEqual(counts, [0, 2, 3, 3])
+
+        stop = threading.Event()
+
+        def _stop_after_first_root(rows):
+            partials.append(rows)
+            stop.set()
+
+        with mock.patch.object(main.os, "name", "nt"), base_patches[0], base_patches[1], base_patches[2], \
+                mock.patch.object(main.subprocess, "Popen", side_effect=spawn(True)):
+            started = time.monotonic()
+            results = main._scan_big_files_fast_mft(["C:\\"], 0, [], stop, partial_cb=_stop_after_first_root)
+        self.assertEqual(results, [])
+        self.assertTrue(helpers[-1].killed.is_set())
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_fast_mft_binary_output_parses_records_and_falls_back_to_json(self):
+        record = main._FAST_MFT_RECORD.pack
+
+        def binary_row(size, path):
+            data = path.encode("utf-8")
+            return record(size, len(data)) + data
+
+        stream = b"".join([
+            main.FAST_MFT_BINARY_MAGIC,
+            record(5, main._FAST_MFT_PROGRESS) + main._FAST_MFT_TOTAL.pack(10),
+            binary_row(900, "C:\\大文件.bin"),
+            binary_row(100, "C:\\small.bin"),
+            binary_row(800, "C:\\b.bin"),
+            record(3, main._FAST_MFT_ROOT_DONE),
+        ])
+        calls = []
+
+        class FakeHelper:
+            def __init__(self, cmd, stdout, stderr, returncode):
+                calls.append(cmd)
+                self.stdout = io.BufferedReader(io.BytesIO(stdout), buffer_size=7)
+                self.stderr = io.BytesIO(stderr)
+                self.returncode = returncode
+
+            def kill(self):
+                pass
+
+            def wait(self, timeout=None):
+                return self.returncode
+
+        def popen(cmd, **_kwargs):
+            if "--format" in cmd:
+                if len(calls) == 0:
+                    return FakeHelper(cmd, stream, b"", 0)
+                return FakeHelper(cmd, b"", b"unknown argument: --format", 1)
+            return FakeHelper(cmd, b'{"size":700,"path":"C:\\\\json.bin"}\n', b"", 0)
+
+        events = list(main._iter_fast_mft_binary(io.BytesIO(stream), ["C:\\"], lambda size: size >= 500, chunk_size=5))
+        self.assertEqual(events, [
+            ("progress", "C:\\", 5, 10),
+            ("row", 900, "C:\\大文件.bin"),
+            ("row", 800, "C:\\b.bin"),
+            ("root_done", "C:\\", 3),
+        ])
+        with self.assertRaises(ValueError):
+            list(main._iter_fast_mft_binary(io.BytesIO(stream[:-3]), ["C:\\"], lambda size: True))
+
+        with mock.patch.object(main.os, "name", "nt"), \
+                mock.patch.dict(os.environ, {"C_CLEANER_PLUS_MFT_JSON": ""}), \
+                mock.patch.object(main, "_is_drive_root_path", return_value=True), \
+                mock.patch.object(main, "_fast_mft_bigfile_exe_path", return_value="fast_large_files.exe"), \
+                mock.patch.object(main.subprocess, "Popen", side_effect=popen):
+            self.assertEqual(
+                main._scan_big_files_fast_mft(["C:\\"], 500, [], threading.Event(), result_limit=1),
+                [(900, "C:\\大文件.bin")],
+            )
+            self.assertEqual(
+                main._scan_big_files_fast_mft(["C:\\"], 500, [], threading.Event()),
+                [(700, "C:\\json.bin")],
+            )
+        self.assertEqual(["--format" in cmd for cmd in calls], [True, True, False])
+
+    def test_mft_dir_size_prefetch_fills_directory_size_cache(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dirs = [os.path.join(temp_dir, name) for name in ("a", "b", "c")]
+            for path in dirs:
+                os.mkdir(path)
+            with open(os.path.join(dirs[0], "real.bin"), "wb") as stream:
+                stream.write(b"x" * 10)
+            calls = []
+
+            class FakeHelper:
+                def __init__(self, cmd, **_kwargs):
+                    calls.append(cmd)
+                    self.stdin = io.BytesIO()
+                    self.stdin.close = lambda: calls.append(self.stdin.getvalue().decode("utf-8"))
+                    rows = [{"size": 4096, "path": dirs[0]}, {"size": 7, "path": dirs[1]}, {"root_done": "C:\\", "rows": 2}]
+                    self.stdout = io.BytesIO("".join(json.dumps(row) + "\n" for row in rows).encode("utf-8"))
+                    self.stderr = io.BytesIO(b"")
+                    self.returncode = 0
+
+                def kill(self):
+                    pass
+
+                def wait(self, timeout=None):
+                    return 0
+
+            with mock.patch.object(main.os, "name", "nt"), \
+                    mock.patch.dict(os.environ, {"C_CLEANER_PLUS_MFT_JSON": "1"}), \
+                    mock.patch.object(main.os.path, "splitdrive", return_value=("C:", "")), \
+                    mock.patch.object(main, "is_admin", return_value=True), \
+                    mock.patch.object(main, "_fast_mft_bigfile_exe_path", return_value="fast_large_files.exe"), \
+                    mock.patch.object(main, "_dir_size_cache", main.DirectorySizeCache()), \
+                    mock.patch.object(main.subprocess, "Popen", side_effect=FakeHelper):
+                self.assertEqual(main.prefetch_mft_dir_sizes(dirs, min_queries=4), {})
+                self.assertEqual(calls, [])
+                prefetched = main.prefetch_mft_dir_sizes(dirs + [os.path.join(temp_dir, "missing")], min_queries=3)
+                self.assertEqual({path: result.size for path, result in prefetched.items()}, {dirs[0]: 4096, dirs[1]: 7})
+                self.assertIsNone(main._dir_size_cache.get(dirs[0]))
+                sizes = main.TreeSizeAggregator()
+                sizes.remember(prefetched)
+                self.assertEqual(sizes.size(dirs[0]), 4096)
+                main.prefetch_mft_dir_sizes(dirs + [os.path.join(temp_dir, "missing")], min_queries=3, use_cache=True)
+                self.assertEqual(main.dir_size(dirs[0], use_cache=True), 4096)
+                self.assertEqual(main.dir_size(dirs[1], use_cache=True), 7)
+                self.assertEqual(main.dir_size_detailed(dirs[0]).size, 10)
+
+        self.assertIn("--dir-sizes", calls[0])
+        self.assertEqual(calls[1].split("\n"), dirs)
+        self.assertEqual(calls[3].split("\n"), dirs)
+
+    def test_duplicate_hash_pool_limits_device_reads_and_keeps_group_order(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            groups = []
+            for size in (4096, 3000, 2000, 1000):
+                paths = []
+                for name, fill in (("a", b"x"), ("b", b"x"), ("c", b"y")):
+                    path = os.path.join(temp_dir, f"{name}{size}.bin")
+                    with open(path, "wb") as stream:
+                        stream.write(fill * size)
+                    paths.append(path)
+                groups.append((size, paths))
+            groups.append((5, [os.path.join(temp_dir, "alone.bin")]))
+
+            active = [0]
+            peak = [0]
+            lock = threading.Lock()
+            original_hash = main.duplicate_file_hash
+
+            def counting_hash(*args, **kwargs):
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.01)
+                try:
+                    return original_hash(*args, **kwargs)
+                finally:
+                    with lock:
+                        active[0] -= 1
+
+            with mock.patch.object(main, "DEFAULT_SCAN_THREADS", 1), \
+                    mock.patch.object(main, "duplicate_file_hash", counting_hash), \
+                    mock.patch.dict(os.environ, {"C_CLEANER_PLUS_DUPLICATE_COMPARE": "hash"}):
+                results = list(main.iter_duplicate_groups(iter(groups), workers=4))
+
+            self.assertEqual(peak[0], 1)
+            self.assertEqual(len(results), len(groups))
+            self.assertEqual(results[-1], ([], []))
+            for (size, paths), (confirmed, _links) in zip(groups, results):
+                if size == 5:
+                    continue
+                self.assertEqual(len(confirmed), 1)
+                self.assertEqual(confirmed[0][0], size)
+                self.assertEqual(confirmed[0][1], hashlib.sha256(b"x" * size).hexdigest())
+                self.assertEqual(confirmed[0][2], sorted(paths[:2], key=os.path.normcase))
+
+            stop = threading.Event()
+            stop.set()
+            self.assertEqual(list(main.iter_duplicate_groups(iter(groups), stop_event=stop, workers=4)), [])
+
+    def test_content_hash_cache_reuses_digests_until_file_identity_changes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = [os.path.join(temp_dir, name) for name in ("a.bin", "b.bin")]
+            old = time.time() - 3600
+            for path in paths:
+                with open(path, "wb") as stream:
+                    stream.write(b"z" * 20000)
+                os.utime(path, (old, old))
+            cache = main.ContentHashCache(os.path.join(temp_dir, "cache", "hashes.sqlite3"))
+            expected = hashlib.sha256(b"z" * 20000).hexdigest()
+
+            first = main.resolve_duplicate_size_group(20000, paths, hash_cache=cache)
+            self.assertEqual(first, [(20000, expected, paths)])
+            cache.close()
+
+            reopened = main.ContentHashCache(cache.path)
+            with mock.patch.object(main, "duplicate_file_hash", side_effect=AssertionError("re-read")):
+                again = main.resolve_duplicate_size_group(20000, paths, hash_cache=reopened)
+                ok, digest, _signature, reason = main._stable_file_digest(paths[0], 20000, hash_cache=reopened)
+            self.assertEqual(again, first)
+            self.assertTrue(ok, reason)
+            self.assertEqual(digest, expected)
+
+            with open(paths[1], "r+b") as stream:
+                stream.write(b"y")
+            os.utime(paths[1], (old + 1, old + 1))
+            ok, digest, _signature, reason = main._stable_file_digest(paths[1], 20000, hash_cache=reopened)
+            self.assertTrue(ok, reason)
+            self.assertNotEqual(digest, expected)
+
+            fresh = os.path.join(temp_dir, "fresh.bin")
+            with open(fresh, "wb") as stream:
+                stream.write(b"z" * 20000)
+            main._stable_file_digest(fresh, 20000, hash_cache=reopened)
+            reopened.flush()
+            self.assertEqual(reopened.get(main._file_stat_signature(os.stat(fresh)), main.HASH_KIND_FULL), "")
+
+            huge = (12, 1, 2, 1 << 100)
+            reopened.put(huge, main.HASH_KIND_FULL, "ab")
+            reopened.flush()
+            self.assertEqual(reopened.get(huge, main.HASH_KIND_FULL), "ab")
+
+            reopened.close()
+            pruned = main.ContentHashCache(cache.path, max_entries=1)
+            with pruned._lock:
+                count = pruned._connection().execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+            pruned.close()
+            self.assertEqual(count, 1)
+
+    def test_lockstep_duplicate_compare_drops_early_mismatches(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            size = 300 * 1024
+            base = bytes(range(256)) * (size // 256)
+            contents = {
+                "a.bin": base,
+                "b.bin": base,
+                "head.bin": b"!" + base[1:],
+                "tail.bin": base[:-1] + b"!",
+                "tail2.bin": base[:-1] + b"!",
+            }
+            paths = []
+            for name, payload in contents.items():
+                path = os.path.join(temp_dir, name)
+                with open(path, "wb") as stream:
+                    stream.write(payload)
+                paths.append(path)
+
+            read_bytes = {}
+            real_open = open
+
+            class CountingStream:
+                def __init__(self, path):
+                    self._path = path
+                    self._stream = real_open(path, "rb")
+
+                def read(self, size=-1):
+                    chunk = self._stream.read(size)
+                    read_bytes[os.path.basename(self._path)] = read_bytes.get(os.path.basename(self._path), 0) + len(chunk)
+                    return chunk
+
+                def fileno(self):
+                    return self._stream.fileno()
+
+                def close(self):
+                    self._stream.close()
+
+            with mock.patch.object(main, "open", create=True, new=lambda path, mode="r": CountingStream(path)):
+                results = main.resolve_duplicate_size_group(size, paths, mode="lockstep")
+
+            self.assertEqual(
+                results,
+                [
+                    (size, hashlib.sha256(base).hexdigest(), [paths[0], paths[1]]),
+                    (size, hashlib.sha256(contents["tail.bin"]).hexdigest(), [paths[3], paths[4]]),
+                ],
+            )
+            self.assertEqual(read_bytes["head.bin"], main.DUPLICATE_LOCKSTEP_FIRST_CHUNK)
+            self.assertEqual(read_bytes["a.bin"], size)
+            self.assertEqual(main.resolve_duplicate_size_group(size, paths, mode="hash"), results)
+
+            stop = threading.Event()
+            stop.set()
+            self.assertIsNone(main.compare_files_lockstep(size, paths, stop_event=stop))
+
+    def test_shared_reader_reuses_buffer_and_matches_plain_reads(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            payload = os.urandom(300 * 1024 + 17)
+            left = os.path.join(temp_dir, "left.bin")
+            right = os.path.join(temp_dir, "right.bin")
+            for path in (left, right):
+                with open(path, "wb") as stream:
+                    stream.write(payload)
+
+            with open(left, "rb") as stream:
+                chunks = [(bytes(chunk), chunk.obj) for chunk in main.iter_stream_chunks(stream, 64 * 1024, length=200000)]
+            self.assertEqual(b"".join(data for data, _ in chunks), payload[:200000])
+            self.assertEqual([len(data) for data, _ in chunks], [65536, 65536, 65536, 3392])
+            self.assertEqual(len({id(owner) for _, owner in chunks}), 1)
+
+            expected = hashlib.sha256(payload).hexdigest()
+            with mock.patch.object(main, "READ_MMAP_MIN_SIZE", 1024):
+                for mmap_flag in ("", "1"):
+                    with mock.patch.dict(os.environ, {"C_CLEANER_PLUS_HASH_MMAP": mmap_flag}):
+                        self.assertEqual(main.duplicate_file_hash(left), expected)
+                        ok, digest, _signature, reason = main._stable_file_digest(left, len(payload))
+                        self.assertTrue(ok, reason)
+                        self.assertEqual(digest, expected)
+
+            self.assertEqual(main._files_equal_exact(left, right, chunk_size=4096), (True, ""))
+            self.assertEqual(main._file_prefix_matches(left, right, 100000), (True, ""))
+            with open(right, "r+b") as stream:
+                stream.seek(len(payload) - 1)
+                stream.write(b"\x00" if payload[-1] else b"\x01")
+            self.assertEqual(main._files_equal_exact(left, right, chunk_size=4096), (False, "文件内容不同"))
+            self.assertEqual(main._file_prefix_matches(left, right, len(payload) - 1), (True, ""))
+            self.assertFalse(main._file_prefix_matches(left, right, len(payload))[0])
+
+    def test_hard_links_are_hashed_once_and_reported_separately(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            payload = b"h" * 4096
+            original = os.path.join(temp_dir, "a-original.bin")
+            link = os.path.join(temp_dir, "b-link.bin")
+            copy = os.path.join(temp_dir, "c-copy.bin")
+            other = os.path.join(temp_dir, "d-other.bin")
+            for path, data in ((original, payload), (copy, payload), (other, b"o" * 4096)):
+                with open(path, "wb") as stream:
+                    stream.write(data)
+            try:
+                os.link(original, link)
+            except (OSError, NotImplementedError) as e:
+                self.skipTest(f"hard links unavailable: {e}")
+
+            opened = []
+            real_open = open
+
+            def tracking_open(path, mode="r", *args, **kwargs):
+                opened.append(os.path.basename(path))
+                return real_open(path, mode, *args, **kwargs)
+
+            with mock.patch.object(main, "open", create=True, new=tracking_open):
+                results = list(main.iter_duplicate_groups(iter([(4096, [link, copy, original, other])]), workers=2))
+
+            digest = hashlib.sha256(payload).hexdigest()
+            self.assertEqual(results, [([(4096, digest, [original, copy])], [(4096, [original, link])])])
+            self.assertNotIn("b-link.bin", opened)
+
+            with mock.patch.object(main, "norm_path", side_effect=lambda p: p):
+                ok, message = main.validate_duplicate_deletion_candidate(
+                    link,
+                    {"reference": original, "size": len(payload), "digest": digest},
+                )
+            self.assertFalse(ok)
+            self.assertIn("硬链接", message)
+
+    def test_filesystem_index_keeps_overlapping_roots_independent(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            users = os.path.join(root, "Users")
+            os.makedirs(users)
+            for path, size in ((os.path.join(root, "top.bin"), 10), (os.path.join(users, "inner.bin"), 20)):
+                with open(path, "wb") as stream:
+                    stream.write(b"x" * size)
+
+            for order in ((root, users), (users, root)):
+                index = main.FileSystemIndex(os.path.join(temp_dir, f"index-{len(order[0])}.sqlite3"))
+                try:
+                    for scan_root in order:
+                        main.walk_files_threaded([scan_root], [], 2, collect_files=True, fs_index=index)
+                    with mock.patch.object(main.os, "scandir", side_effect=AssertionError("rescanned")):
+                        root_files, _dirs = main.walk_files_threaded([root], [], 2, collect_files=True, fs_index=index)
+                        user_files, _dirs = main.walk_files_threaded([users], [], 2, collect_files=True, fs_index=index)
+                    self.assertEqual(sorted(size for size, _path in root_files), [10, 20])
+                    self.assertEqual([size for size, _path in user_files], [20])
+                    self.assertEqual(index.subtree_size(root), 30)
+                    self.assertEqual(index.subtree_size(users), 20)
+                finally:
+                    index.close()
+
+    def test_filesystem_index_stores_file_ids_beyond_sqlite_integer_range(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            os.makedirs(root)
+            index = main.FileSystemIndex(os.path.join(temp_dir, "index.sqlite3"))
+            try:
+                writer = index.begin_scan([root], [])
+                huge = (0x8001 << 48) | 5
+                sub_stat = types.SimpleNamespace(st_size=0, st_mtime_ns=1, st_dev=3, st_ino=huge)
+                writer.add(os.path.join(root, "sub"), True, sub_stat, child_count=0)
+                writer.add(root, True, os.stat(root), child_count=1)
+                writer.close()
+                self.assertFalse(writer.failed)
+                listing = index.cached_listing(root, os.stat(root), main._fs_index_key(root))
+                self.assertEqual([entry.stat().st_ino for entry in listing], [huge])
+            finally:
+                index.close()
+
+    def test_filesystem_index_restats_rows_before_serving_them(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            os.makedirs(root)
+            gone = os.path.join(root, "gone.bin")
+            grown = os.path.join(root, "grown.bin")
+            for path in (gone, grown):
+                with open(path, "wb") as stream:
+                    stream.write(b"x" * 2048)
+            index = main.FileSystemIndex(os.path.join(temp_dir, "index.sqlite3"))
+            try:
+                main.walk_files_threaded([root], [], 2, collect_files=True, fs_index=index)
+                os.remove(gone)
+                with open(grown, "ab") as stream:
+                    stream.write(b"y" * 2048)
+
+                with mock.patch.object(main.os, "scandir", side_effect=AssertionError("rescanned")):
+                    files, _dirs = main.walk_files_threaded([root], [], 2, collect_files=True, fs_index=index)
+                    big = main.scan_big_files([root], 1024, [], threading.Event(), workers=2, fs_index=index)
+
+                self.assertEqual(files, [(4096, grown)])
+                self.assertEqual(big, [(4096, grown)])
+                self.assertEqual(index.subtree_size(root), 4096)
+            finally:
+                index.close()
+
+    def test_exact_compare_detects_differences_in_full_and_partial_chunks(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            left = os.path.join(temp_dir, "left.bin")
+            right = os.path.join(temp_dir, "right.bin")
+            payload = bytes(range(256)) * 40
+            with open(left, "wb") as stream:
+                stream.write(payload)
+            for offset in (None, 5, len(payload) - 1):
+                data = bytearray(payload)
+                if offset is not None:
+                    data[offset] ^= 0xFF
+                with open(right, "wb") as stream:
+                    stream.write(data)
+                equal, _message = main._files_equal_exact(left, right, chunk_size=4096)
+                self.assertEqual(equal, offset is None)
+                matches, _message = main._file_prefix_matches(left, right, len(payload) - 2)
+                self.assertEqual(matches, offset in (None, len(payload) - 1))
+
+    def test_incremental_walk_skips_unchanged_subtrees_without_restats_or_rewrites(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            stable = os.path.join(root, "stable")
+            changing = os.path.join(root, "changing")
+            for rel in ("stable/a.bin", "stable/deep/b.bin", "changing/c.bin", "changing/gone/d.bin"):
+                path = os.path.join(root, *rel.split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as stream:
+                    stream.write(b"x" * 10)
+            index = main.FileSystemIndex(os.path.join(temp_dir, "index.sqlite3"))
+            real_stat = os.stat
+            real_scandir = os.scandir
+            stat_paths = []
+            listed = []
+
+            def counting_stat(path, *args, **kwargs):
+                stat_paths.append(str(path))
+                return real_stat(path, *args, **kwargs)
+
+            def counting_scandir(path):
+                listed.append(path)
+                return real_scandir(path)
+
+            def _walk():
+                with (
+                    mock.patch.object(main, "FS_INDEX_MAX_AGE_SEC", -1),
+                    mock.patch.object(main.os, "stat", side_effect=counting_stat),
+                    mock.patch.object(main.os, "scandir", side_effect=counting_scandir),
+                    mock.patch.object(index, "_insert_rows", wraps=index._insert_rows) as inserts,
+                ):
+                    files, _dirs = main.walk_files_threaded([root], [], 2, collect_files=True, fs_index=index, incremental=True)
+                return sorted(os.path.relpath(path, root) for _size, path in files), inserts
+
+            try:
+                main.walk_files_threaded([root], [], 2, collect_files=True, fs_index=index, incremental=True)
+                files, inserts = _walk()
+                self.assertEqual(len(files), 4)
+                self.assertEqual(listed, [])
+                self.assertFalse(any(path.endswith(".bin") for path in stat_paths))
+                inserts.assert_not_called()
+
+                shutil.rmtree(os.path.join(changing, "gone"))
+                time.sleep(0.01)
+                with open(os.path.join(changing, "new.bin"), "wb") as stream:
+                    stream.write(b"y")
+                files, inserts = _walk()
+                self.assertEqual(listed, [changing])
+                written = {row[0] for call in inserts.call_args_list for row in call.args[0]}
+                self.assertTrue(all(key.startswith(main._fs_index_key(changing)) for key in written))
+                self.assertNotIn(os.path.join("changing", "gone", "d.bin"), files)
+                self.assertIn(os.path.join("changing", "new.bin"), files)
+                keys = {row[0] for row in index._connection().execute("SELECT key FROM entries")}
+                self.assertNotIn(main._fs_index_key(os.path.join(changing, "gone")), keys)
+                self.assertNotIn(main._fs_index_key(os.path.join(changing, "gone", "d.bin")), keys)
+                self.assertIn(main._fs_index_key(os.path.join(stable, "deep", "b.bin")), keys)
+                self.assertEqual(index.subtree_size(root), 31)
+            finally:
+                index.close()
+
+    def test_duplicate_deletion_rereads_files_despite_cached_digest(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            reference = os.path.join(temp_dir, "keep.bin")
+            candidate = os.path.join(temp_dir, "dup.bin")
+            with open(reference, "wb") as stream:
+                stream.write(b"a" * 4096)
+            with open(candidate, "wb") as stream:
+                stream.write(b"b" * 4096)
+            old = time.time() - 3600
+            for path in (reference, candidate):
+                os.utime(path, (old, old))
+            expected = hashlib.sha256(b"a" * 4096).hexdigest()
+            expectation = {"reference": reference, "digest": expected, "size": 4096}
+            cache = main.ContentHashCache(os.path.join(temp_dir, "hashes.sqlite3"))
+            try:
+                with mock.patch.object(main, "norm_path", side_effect=os.path.normpath):
+                    for path in (reference, candidate):
+                        cache.put(main._file_stat_signature(os.stat(path)), main.HASH_KIND_FULL, expected)
+                    valid, _reason = main.validate_duplicate_deletion_candidate(
+                        candidate, expectation, hash_cache=cache
+                    )
+                    self.assertFalse(valid)
+
+                    cache.put(main._file_stat_signature(os.stat(candidate)), main.HASH_KIND_FULL, "0" * 64)
+                    with mock.patch.object(main, "hash_stream", side_effect=AssertionError("re-read")):
+                        valid, reason = main.validate_duplicate_deletion_candidate(
+                            candidate, expectation, hash_cache=cache
+                        )
+                    self.assertFalse(valid)
+                    self.assertEqual(reason, "文件内容在扫描后不再相同")
+            finally:
+                cache.close()
+
+    def test_walkers_share_process_wide_thread_budget(self):
+        budget = main.ScanThreadBudget(4)
+        release = threading.Event()
+
+        def visit(path, push):
+            release.wait(10)
+            return 1
+
+        first = main.WorkStealingWalker(["a"], visit, workers=3, autotune=True, max_workers=8, budget=budget)
+        second = main.WorkStealingWalker(["b"], visit, workers=3, autotune=True, max_workers=8, budget=budget)
+        first.start()
+        second.start()
+        self.assertEqual(first.stats()[2], 3)
+        self.assertEqual(second.stats()[2], 1)
+        first.set_active_workers(8)
+        self.assertEqual(first.stats()[2], 3)
+        second.set_active_workers(1)
+        first.set_active_workers(8)
+        self.assertEqual(first.stats()[2], 3)
+        release.set()
+        self.assertTrue(first.wait(10) and second.wait(10))
+        self.assertTrue(first.join(5) and second.join(5))
+        self.assertEqual(budget.used, 0)
+
+    def test_scan_metrics_count_streamed_index_rows_and_only_their_own_errors(self):
+        snapshots = []
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            os.makedirs(os.path.join(root, "sub"))
+            for name in ("a.bin", "b.bin"):
+                with open(os.path.join(root, "sub", name), "wb") as stream:
+                    stream.write(b"x")
+            index = main.FileSystemIndex(os.path.join(temp_dir, "index.sqlite3"))
+
+            def _file_cb(_size, _path):
+                main.log_sampled_background_error("本次扫描类别", RuntimeError("boom"), limit=0)
+                other = threading.Thread(
+                    target=main.log_sampled_background_error, args=("其他线程类别", RuntimeError("x"), 0)
+                )
+                other.start()
+                other.join()
+
+            main.add_scan_metrics_listener(snapshots.append)
+            try:
+                main.walk_files_threaded([root], [], 2, collect_files=True, fs_index=index)
+                main.walk_files_threaded([root], [], 2, file_cb=_file_cb, fs_index=index, log_context="索引指标")
+            finally:
+                main.remove_scan_metrics_listener(snapshots.append)
+                index.close()
+
+        final = [snap for snap in snapshots if snap["final"] and snap["name"] == "索引指标"][-1]
+        self.assertEqual((final["backend"], final["files"]), ("index", 2))
+        self.assertEqual(final["errors"], {"本次扫描类别": 2})
+
+    def test_combined_analysis_publishes_top_level_dir_totals_to_size_cache(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            for rel, size in (("a/deep/x.bin", 10), ("a/y.bin", 20), ("b/z.bin", 5)):
+                path = os.path.join(root, *rel.split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as stream:
+                    stream.write(b"x" * size)
+
+            with mock.patch.object(main, "_dir_size_cache", main.DirectorySizeCache(ttl=60)):
+                result = main.run_combined_analysis([root], [], 2)
+                stopped = threading.Event()
+                stopped.set()
+                self.assertEqual(main.publish_dir_totals(result, stop_event=stopped), 0)
+                self.assertEqual(main.publish_dir_totals(result), 3)
+                with mock.patch.object(main.os, "scandir", side_effect=AssertionError("rescanned")):
+                    sizes = main.TreeSizeAggregator(use_cache=True)
+                    self.assertEqual(sizes.size(os.path.join(root, "a")), 30)
+                    self.assertEqual(sizes.size(os.path.join(root, "b")), 5)
+                    self.assertEqual(sizes.size(root), 35)
+
+    def test_combined_analysis_skips_publishing_dirs_with_excluded_descendants(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = os.path.join(temp_dir, "root")
+            for rel, size in (("a/y.bin", 100), ("a/deep/skip/x.bin", 1000), ("b/z.bin", 5)):
+                path = os.path.join(root, *rel.split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as stream:
+                    stream.write(b"x" * size)
+
+            cache = main.DirectorySizeCache(ttl=60)
+            with mock.patch.object(main, "_dir_size_cache", cache):
+                result = main.run_combined_analysis([root], [os.path.join(root, "a", "deep", "skip")], 2)
+                self.assertEqual(result.dir_totals[os.path.join(root, "a")], 100)
+                self.assertEqual(main.publish_dir_totals(result), 1)
+                self.assertIsNone(cache.get(os.path.join(root, "a")))
+                self.assertIsNone(cache.get(root))
+                self.assertEqual(cache.get(os.path.join(root, "b")).size, 5)
+
+                result = main.run_combined_analysis([root], ["skip"], 2)
+                self.assertEqual(result.dir_signatures, {})
+
+    def test_shortcut_scan_reports_progress_while_streaming(self):
+        emitted = {"more_prog": [], "more_log": [], "more_done": []}
+
+        def _emitter(name):
+            return types.SimpleNamespace(emit=lambda *values: emitted[name].append(values))
+
+        batches = [[(1, rf"D:\links\{i}.lnk", False) for i in range(start, start + 150)] for start in (0, 150)]
+        fake_page = types.SimpleNamespace(
+            stop=threading.Event(),
+            sig=types.SimpleNamespace(**{name: _emitter(name) for name in emitted}),
+            _iter_walk=lambda *args, **kwargs: iter(batches),
+            _emit_more_rows=lambda rows: None,
+        )
+        with mock.patch.object(main, "get_invalid_shortcut_detail", return_value=""):
+            main.MoreCleanPage._scan_shortcuts(fake_page, [r"D:\links"], 2)
+
+        self.assertEqual(emitted["more_prog"], [(0, 0), (100, 0), (200, 0), (300, 0)])
+        self.assertEqual(len(emitted["more_done"]), 1)
+
+
+    def test_duplicate_groups_publish_rows_as_each_group_is_confirmed(self):
+        emitted = {"more_prog": [], "more_log": []}
+        published = []
+
+        def _emitter(name):
+            return types.SimpleNamespace(emit=lambda *values: emitted[name].append(values))
+
+        fake_page = types.SimpleNamespace(
+            stop=threading.Event(),
+            sig=types.SimpleNamespace(**{name: _emitter(name) for name in emitted}),
+            _emit_more_rows=lambda rows: published.append([row[4] for row in rows]),
+        )
+        fake_page._append_duplicate_rows = lambda *args: main.MoreCleanPage._append_duplicate_rows(fake_page, *args)
+        candidates = types.SimpleNamespace(
+            group_indices_by_size=lambda: {300: [0, 1], 200: [2, 3]},
+            paths_at=lambda indices: [rf"D:\dup\{i}.bin" for i in indices],
+            clear=lambda: None,
+        )
+        seen_before_second = []
+
+        def _groups(groups, **_kwargs):
+            groups = list(groups)
+            yield [(300, "a" * 64, groups[0][1])], []
+            seen_before_second.extend(published)
+            yield [(200, "b" * 64, groups[1][1])], []
+
+        with mock.patch.object(main, "iter_duplicate_groups", side_effect=_groups), \
+                mock.patch.object(main, "get_content_hash_cache", return_value=None):
+            counts = main.MoreCleanPage._resolve_duplicate_groups(fake_page, candidates)
+
+        self.assertEqual(counts, (4, 0))
+        self.assertEqual(seen_before_second, [[r"D:\dup\0.bin", r"D:\dup\1.bin"]])
+        self.assertEqual(published[-1], [r"D:\dup\2.bin", r"D:\dup\3.bin"])
+        self.assertEqual(emitted["more_prog"], [(1, 2), (2, 2)])
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,149 @@
+"""哈希读取路径吞吐与分配基准。
+
+生成（或使用已有的）大文件，分别用旧式 stream.read(chunk) 循环、共享 readinto 读取器
+（main.hash_stream）以及 mmap 模式计算 sha256，输出耗时、MB/秒和 tracemalloc 记录的分配峰值；
+随后用两个流逐块比较同一文件，对比直接比较 memoryview 与 main.chunks_equal 的吞吐。
+生成文件后页缓存通常是热的，需要测冷读时请先清空系统缓存或用 --file 指定其他盘上的文件。
+
+用法：
+    python tools/benchmarks/hash_read_throughput.py --size-mb 2048
+    python tools/benchmarks/hash_read_throughput.py --file D:\\video.mkv --chunk-kb 4096 --repeat 5
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import main  # noqa: E402
+
+WRITE_BLOCK = 8 * 1024 * 1024
+
+
+def build_file(path, size_mb):
+    block = os.urandom(WRITE_BLOCK)
+    remaining = size_mb * 1024 * 1024
+    with open(path, "wb") as stream:
+        while remaining > 0:
+            stream.write(block[:min(remaining, WRITE_BLOCK)])
+            remaining -= WRITE_BLOCK
+
+
+def legacy_hash(path, chunk_size):
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for chunk in iter(lambda: stream.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def shared_reader_hash(path, chunk_size):
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        main.advise_sequential(stream)
+        main.hash_stream(stream, digest, chunk_size)
+    return digest.hexdigest()
+
+
+def mmap_hash(path, chunk_size):
+    previous = os.environ.get("C_CLEANER_PLUS_HASH_MMAP")
+    os.environ["C_CLEANER_PLUS_HASH_MMAP"] = "1"
+    try:
+        return shared_reader_hash(path, chunk_size)
+    finally:
+        if previous is None:
+            os.environ.pop("C_CLEANER_PLUS_HASH_MMAP", None)
+        else:
+            os.environ["C_CLEANER_PLUS_HASH_MMAP"] = previous
+
+
+def memoryview_compare(path, chunk_size):
+    with open(path, "rb") as left_stream, open(path, "rb") as right_stream:
+        right_chunks = main.iter_stream_chunks(right_stream, chunk_size, slot=1)
+        for left_chunk in main.iter_stream_chunks(left_stream, chunk_size, slot=0):
+            if left_chunk != next(right_chunks, None):
+                return "different"
+    return "equal"
+
+
+def shared_reader_compare(path, chunk_size):
+    with open(path, "rb") as left_stream, open(path, "rb") as right_stream:
+        main.advise_sequential(left_stream)
+        main.advise_sequential(right_stream)
+        right_chunks = main.iter_stream_chunks(right_stream, chunk_size, slot=1)
+        for left_chunk in main.iter_stream_chunks(left_stream, chunk_size, slot=0):
+            right_chunk = next(right_chunks, None)
+            if right_chunk is None or not main.chunks_equal(left_chunk, right_chunk):
+                return "different"
+    return "equal"
+
+
+def measure(fn, path, chunk_size, repeat):
+    best = None
+    digest = ""
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        digest = fn(path, chunk_size)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, digest
+
+
+def measure_peak(fn, path, chunk_size):
+    """返回一次哈希过程中 tracemalloc 记录的分配峰值；复用的读缓冲区在计时阶段已分配，不计入。"""
+    tracemalloc.start()
+    try:
+        fn(path, chunk_size)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=2048, help="生成文件的大小 (MB)")
+    parser.add_argument("--chunk-kb", type=int, default=1024, help="每次读取的块大小 (KB)")
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式取最快的一次")
+    parser.add_argument("--file", default=None, help="使用已有文件而不生成")
+    parser.add_argument("--dir", default=None, help="在指定目录下生成文件（默认系统临时目录）")
+    args = parser.parse_args()
+    chunk_size = args.chunk_kb * 1024
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as temp_dir:
+        path = args.file
+        if not path:
+            path = os.path.join(temp_dir, "hash_input.bin")
+            t0 = time.perf_counter()
+            build_file(path, args.size_mb)
+            print(f"生成 {args.size_mb} MB 文件, 耗时 {time.perf_counter() - t0:.1f}s")
+        size_mb = os.path.getsize(path) / 1048576
+        modes = [("read()", legacy_hash), ("readinto", shared_reader_hash)]
+        if os.path.getsize(path) >= main.READ_MMAP_MIN_SIZE:
+            modes.append(("mmap", mmap_hash))
+        print(f"{'方式':<10}{'耗时(s)':>10}{'MB/秒':>10}{'分配峰值(KB)':>14}")
+        reference = None
+        for name, fn in modes:
+            elapsed, digest = measure(fn, path, chunk_size, args.repeat)
+            if reference is None:
+                reference = digest
+            elif digest != reference:
+                print(f"警告: {name} 的摘要与 read() 不一致")
+            peak = measure_peak(fn, path, chunk_size)
+            print(f"{name:<10}{elapsed:>10.3f}{size_mb / elapsed:>10.0f}{peak / 1024:>14.0f}")
+
+        print()
+        print(f"{'逐块比较':<14}{'耗时(s)':>10}{'MB/秒':>10}")
+        for name, fn in (("memoryview !=", memoryview_compare), ("chunks_equal", shared_reader_compare)):
+            elapsed, outcome = measure(fn, path, chunk_size, args.repeat)
+            if outcome != "equal":
+                print(f"警告: {name} 认为同一文件内容不同")
+            print(f"{name:<14}{elapsed:>10.3f}{size_mb / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main_cli()
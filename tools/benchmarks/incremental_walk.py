@@ -0,0 +1,136 @@
+"""增量遍历重复扫描基准。
+
+在临时目录中生成合成目录树，按定时任务“无效快捷方式清理”的方式（ext_filter=".lnk"）遍历：
+先不带索引直接遍历，再做一次非增量的索引遍历（整棵重写索引，即增量模式之前定时任务的做法），
+随后重复增量遍历：未变化的目录直接复用索引中的清单，不再逐个 stat 文件，也不重写索引行。
+--changed 在每次增量遍历前往指定数量的目录里各新建一个文件，观察少量变化时的耗时。
+输出每轮耗时、目录吞吐量、Python 层 os.stat 调用次数（DirEntry.stat 不计入）、写入索引的行数，
+以及相对整棵重写索引那一轮的加速比。页缓存是热的，需要测冷读时请先清空系统缓存。
+
+用法：
+    python tools/benchmarks/incremental_walk.py --width 200 --depth 3 --files 20
+    python tools/benchmarks/incremental_walk.py --width 400 --depth 2 --files 50 --changed 10 --repeat 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import main  # noqa: E402
+
+
+def build_tree(base, width, depth, files):
+    """每层 width 个子目录，最底层以外按 sqrt(width) 继续展开，每个目录放 files 个小文件（含一个 .lnk）。"""
+    fanout = max(2, int(width ** 0.5))
+    created = []
+    level = [base]
+    for d in range(depth):
+        next_level = []
+        per_dir = width if d == 0 else fanout
+        for parent in level:
+            for i in range(per_dir):
+                path = os.path.join(parent, f"d{i}")
+                os.mkdir(path)
+                for j in range(files):
+                    name = "link.lnk" if j == 0 else f"f{j}.bin"
+                    with open(os.path.join(path, name), "wb") as stream:
+                        stream.write(b"x" * 16)
+                next_level.append(path)
+                created.append(path)
+        level = next_level
+    return created
+
+
+class Counters:
+    """统计遍历期间 os.stat 调用次数与写入索引的行数。"""
+
+    def __init__(self, index):
+        self.index = index
+        self.stats = 0
+        self.rows = 0
+        self._stat = None
+        self._insert = None
+
+    def __enter__(self):
+        self._stat = os.stat
+        self._insert = self.index._insert_rows if self.index is not None else None
+
+        def _counting_stat(*args, **kwargs):
+            self.stats += 1
+            return self._stat(*args, **kwargs)
+
+        def _counting_insert(rows):
+            self.rows += len(rows)
+            return self._insert(rows)
+
+        os.stat = _counting_stat
+        if self.index is not None:
+            self.index._insert_rows = _counting_insert
+        return self
+
+    def __exit__(self, *_exc):
+        os.stat = self._stat
+        if self.index is not None:
+            self.index._insert_rows = self._insert
+
+
+def shortcut_walk(root, workers, index, incremental):
+    files, _dirs = main.walk_files_threaded(
+        [root], [], workers, ext_filter=".lnk", collect_files=True,
+        fs_index=index, incremental=incremental,
+    )
+    return len(files)
+
+
+def timed(root, workers, index, incremental):
+    with Counters(index) as counters:
+        t0 = time.perf_counter()
+        found = shortcut_walk(root, workers, index, incremental)
+        elapsed = time.perf_counter() - t0
+    return elapsed, found, counters.stats, counters.rows
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=200, help="第一层子目录数量")
+    parser.add_argument("--depth", type=int, default=3, help="目录层数")
+    parser.add_argument("--files", type=int, default=20, help="每个目录的文件数量")
+    parser.add_argument("--workers", type=int, default=8, help="遍历线程数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复增量遍历的次数")
+    parser.add_argument("--changed", type=int, default=0, help="每次重复遍历前新建文件的目录数")
+    parser.add_argument("--dir", default=None, help="在指定目录下生成合成树与索引（默认系统临时目录）")
+    args = parser.parse_args()
+
+    # 让遍历始终走目录清单而不是直接读取整份新鲜索引
+    main.FS_INDEX_MAX_AGE_SEC = -1
+    with tempfile.TemporaryDirectory(dir=args.dir) as base:
+        root = os.path.join(base, "tree")
+        os.mkdir(root)
+        t0 = time.perf_counter()
+        dirs = build_tree(root, args.width, args.depth, args.files)
+        print(f"合成目录树: {len(dirs)} 个目录, {len(dirs) * args.files} 个文件, 生成耗时 {time.perf_counter() - t0:.1f}s")
+        index = main.FileSystemIndex(os.path.join(base, "index.sqlite3"))
+        try:
+            print(f"{'遍历':<12}{'耗时(s)':>10}{'目录/秒':>12}{'stat 次数':>12}{'写入行数':>10}{'加速比':>8}")
+            rounds = [("plain", None, False), ("整棵重写", index, False)]
+            rounds += [(f"增量 {i + 1}", index, True) for i in range(args.repeat)]
+            baseline = None
+            for i, (name, fs_index, incremental) in enumerate(rounds):
+                if incremental and args.changed:
+                    for n, path in enumerate(dirs[:args.changed]):
+                        with open(os.path.join(path, f"new_{i}_{n}.lnk"), "wb") as stream:
+                            stream.write(b"L")
+                elapsed, found, stats, rows = timed(root, args.workers, fs_index, incremental)
+                if fs_index is not None and not incremental:
+                    baseline = elapsed
+                speedup = f"{baseline / elapsed:>8.2f}" if baseline else f"{'-':>8}"
+                print(f"{name:<12}{elapsed:>10.3f}{len(dirs) / elapsed:>12.0f}{stats:>12}{rows:>10}{speedup}  ({found} 个 .lnk)")
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    main_cli()
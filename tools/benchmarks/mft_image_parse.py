@@ -0,0 +1,220 @@
+"""fast_large_files MFT 解析吞吐基准。
+
+生成（或加载已有的）合成 NTFS 镜像：引导扇区 + 一段连续的 $MFT，包含 --records 条
+1 KiB 文件记录，按每个目录 --files-per-dir 个文件组成一棵逐层加深的目录树，少量文件
+超过 --min-mb。然后以 --image 模式运行 fast_large_files，输出耗时、记录/秒、MB/秒以及
+返回行数，用于在非 Windows 环境下分析和回归 MFT 解析器的性能。helper 的输出在本脚本内
+按同样的格式解析，不导入 main（main 依赖 winreg 与 PySide6）。
+
+先构建 helper（Linux/macOS 下可执行文件没有 .exe 后缀）：
+    cargo build --release --manifest-path tools/fast_large_files/Cargo.toml
+
+用法：
+    python tools/benchmarks/mft_image_parse.py --records 1000000
+    python tools/benchmarks/mft_image_parse.py --records 5000000 --image /data/mft5m.img --repeat 3
+"""
+import argparse
+import json
+import os
+import struct
+import subprocess
+import tempfile
+import time
+
+SECTOR_SIZE = 512
+CLUSTER_SIZE = 4096
+RECORD_SIZE = 1024
+MFT_LCN = 4
+ROOT_RECORD = 5
+FIRST_USER_RECORD = 16
+WRITE_BATCH = 16384
+
+# 与 main.py 中 FAST_MFT_BINARY_MAGIC / _FAST_MFT_RECORD 等常量保持一致
+BINARY_MAGIC = b"FLF1"
+BINARY_RECORD = struct.Struct("<QH")
+BINARY_TOTAL = struct.Struct("<Q")
+BINARY_PROGRESS = 0xFFFF
+BINARY_ROOT_DONE = 0xFFFE
+
+
+def _attribute(attr_type, non_resident, body):
+    length = (16 + len(body) + 7) & ~7
+    attr = bytearray(length)
+    struct.pack_into("<IIB", attr, 0, attr_type, length, 1 if non_resident else 0)
+    attr[16:16 + len(body)] = body
+    return bytes(attr)
+
+
+def _file_name_attribute(parent, name):
+    encoded = name.encode("utf-16-le")
+    value_len = 66 + len(encoded)
+    body = bytearray(8 + value_len)
+    struct.pack_into("<IH", body, 0, value_len, 24)
+    struct.pack_into("<Q", body, 8, parent)
+    body[8 + 64] = len(encoded) // 2
+    body[8 + 65] = 1
+    body[8 + 66:] = encoded
+    return _attribute(0x30, False, body)
+
+
+def _data_attribute(size, runlist=b""):
+    body = bytearray(48 + len(runlist) + 1)
+    struct.pack_into("<H", body, 16, 64)
+    struct.pack_into("<Q", body, 32, size)
+    body[48:48 + len(runlist)] = runlist
+    return _attribute(0x80, True, body)
+
+
+def _file_record(is_dir, attrs):
+    """与 helper 单元测试相同的最小文件记录：固定 fixup 序列号 1，属性从 0x38 开始。"""
+    record = bytearray(RECORD_SIZE)
+    record[0:4] = b"FILE"
+    struct.pack_into("<HH", record, 4, 0x30, 3)
+    struct.pack_into("<HH", record, 20, 0x38, 0x0003 if is_dir else 0x0001)
+    offset = 0x38
+    for attr in attrs:
+        record[offset:offset + len(attr)] = attr
+        offset += len(attr)
+    struct.pack_into("<I", record, offset, 0xFFFFFFFF)
+    record[0x30] = 1
+    record[SECTOR_SIZE - 2] = 1
+    record[RECORD_SIZE - 2] = 1
+    return bytes(record)
+
+
+def build_image(path, records, files_per_dir, min_bytes):
+    """写出合成镜像，返回其中 >= min_bytes 的文件数。"""
+    mft_bytes = records * RECORD_SIZE
+    mft_clusters = -(-mft_bytes // CLUSTER_SIZE)
+    boot = bytearray(MFT_LCN * CLUSTER_SIZE)
+    boot[3:11] = b"NTFS    "
+    struct.pack_into("<HB", boot, 11, SECTOR_SIZE, CLUSTER_SIZE // SECTOR_SIZE)
+    struct.pack_into("<q", boot, 48, MFT_LCN)
+    boot[64] = 0xF6  # -10 => 1 KiB 记录
+
+    empty = bytes(RECORD_SIZE)
+    runlist = b"\x88" + struct.pack("<QQ", mft_clusters, MFT_LCN)
+    fixed = {
+        0: _file_record(False, [_data_attribute(mft_bytes, runlist)]),
+        ROOT_RECORD: _file_record(True, [_file_name_attribute(ROOT_RECORD, ".")]),
+    }
+    large = 0
+    dirs = [ROOT_RECORD]
+    state = 0x2545F491
+    with open(path, "wb") as stream:
+        stream.write(boot)
+        batch = bytearray()
+        for num in range(records):
+            if num < FIRST_USER_RECORD:
+                batch += fixed.get(num, empty)
+            elif (num - FIRST_USER_RECORD) % (files_per_dir + 1) == 0:
+                state = (state * 1103515245 + 12345) & 0x7FFFFFFF
+                parent = dirs[state % len(dirs)]
+                batch += _file_record(True, [_file_name_attribute(parent, f"dir{num}")])
+                dirs.append(num)
+            else:
+                state = (state * 1103515245 + 12345) & 0x7FFFFFFF
+                size = (state % 4096) * 1024
+                if state % 97 == 0:
+                    size = min_bytes + state % (512 << 20)
+                    large += 1
+                batch += _file_record(False, [_file_name_attribute(dirs[-1], f"file{num}.bin"), _data_attribute(size)])
+            if len(batch) >= WRITE_BATCH * RECORD_SIZE:
+                stream.write(batch)
+                batch.clear()
+        stream.write(batch)
+        stream.write(bytes(mft_clusters * CLUSTER_SIZE - mft_bytes))
+    return large
+
+
+def default_helper():
+    exe_name = "fast_large_files.exe" if os.name == "nt" else "fast_large_files"
+    base = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "fast_large_files", "target"))
+    for profile in ("release", "debug"):
+        candidate = os.path.join(base, profile, exe_name)
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def count_binary_rows(data):
+    """按 FLF1 + u64/u16 定长头 + UTF-8 路径解析二进制输出，返回结果行数。"""
+    if data[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+        raise ValueError("unexpected MFT helper output header")
+    pos = len(BINARY_MAGIC)
+    rows = 0
+    with memoryview(data) as view:
+        while pos < len(view):
+            if len(view) - pos < BINARY_RECORD.size:
+                raise ValueError("truncated MFT helper output")
+            _value, length = BINARY_RECORD.unpack_from(view, pos)
+            pos += BINARY_RECORD.size
+            if length == BINARY_PROGRESS:
+                pos += BINARY_TOTAL.size
+            elif length != BINARY_ROOT_DONE:
+                str(view[pos:pos + length], "utf-8", "replace")
+                pos += length
+                rows += 1
+    return rows
+
+
+def count_json_rows(data):
+    rows = 0
+    for line in data.splitlines():
+        if line.strip():
+            row = json.loads(line)
+            if "progress" not in row and "root_done" not in row:
+                rows += 1
+    return rows
+
+
+def run_helper(helper, image, min_bytes, limit, output_format):
+    cmd = [
+        helper, "--image", image, "--root", "C:\\",
+        "--min-bytes", str(min_bytes), "--limit", str(limit), "--format", output_format,
+    ]
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True)
+    elapsed = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode("utf-8", "replace").strip())
+    rows = count_binary_rows(proc.stdout) if output_format == "binary" else count_json_rows(proc.stdout)
+    return elapsed, rows
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=1_000_000, help="MFT 记录数（含前 16 条系统记录）")
+    parser.add_argument("--files-per-dir", type=int, default=40, help="每个目录的文件数")
+    parser.add_argument("--min-mb", type=int, default=300, help="大文件阈值 (MB)")
+    parser.add_argument("--limit", type=int, default=0, help="返回条数上限，0 表示不限")
+    parser.add_argument("--format", choices=("binary", "json"), default="binary", help="helper 输出格式")
+    parser.add_argument("--repeat", type=int, default=3, help="取最快的一次")
+    parser.add_argument("--image", default=None, help="镜像路径；不存在时生成并保留，未指定则生成到临时目录")
+    parser.add_argument("--helper", default=None, help="fast_large_files 可执行文件路径")
+    args = parser.parse_args()
+
+    helper = args.helper or default_helper()
+    if not helper:
+        parser.error("未找到 fast_large_files，请先 cargo build --release 或通过 --helper 指定")
+    min_bytes = args.min_mb * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image = args.image or os.path.join(temp_dir, "synthetic_mft.img")
+        if not os.path.isfile(image):
+            t0 = time.perf_counter()
+            large = build_image(image, args.records, args.files_per_dir, min_bytes)
+            print(f"合成镜像: {args.records} 条记录, {large} 个大文件, 生成耗时 {time.perf_counter() - t0:.1f}s")
+        records = max(0, os.path.getsize(image) - MFT_LCN * CLUSTER_SIZE) // RECORD_SIZE
+        mft_mb = records * RECORD_SIZE / 1048576
+        best = None
+        rows = 0
+        for _ in range(args.repeat):
+            elapsed, rows = run_helper(helper, image, min_bytes, args.limit, args.format)
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{'记录数':<10}{'耗时(s)':>10}{'记录/秒':>14}{'MB/秒':>10}{'返回行':>10}")
+        print(f"{records:<10}{best:>10.3f}{records / best:>14.0f}{mft_mb / best:>10.0f}{rows:>10}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,151 @@
+"""目录遍历引擎扩展性基准。
+
+在临时目录中生成一棵宽而浅的合成目录树，分别用不同线程数运行
+walk_files_threaded（WorkStealingWalker）和旧式共享 queue.Queue 轮询遍历，
+输出耗时、目录吞吐量以及相对单线程的加速比。--memory 额外对比收集全部文件时
+(size, path) 元组与路径树（file_result_mode="compact"）两种结果形式的内存峰值。
+
+用法：
+    python tools/benchmarks/walker_scaling.py --width 400 --depth 2 --files 4 --workers 1,2,4,8,16
+    python tools/benchmarks/walker_scaling.py --width 60 --depth 4 --files 20 --workers 4 --memory
+"""
+import argparse
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import main  # noqa: E402
+
+
+def build_tree(base, width, depth, files):
+    """每层 width 个子目录，最底层以外按 sqrt(width) 继续展开，每个目录放 files 个小文件。"""
+    fanout = max(2, int(width ** 0.5))
+    count = 0
+    level = [base]
+    for d in range(depth):
+        next_level = []
+        per_dir = width if d == 0 else fanout
+        for parent in level:
+            for i in range(per_dir):
+                path = os.path.join(parent, f"d{i}")
+                os.mkdir(path)
+                for j in range(files):
+                    with open(os.path.join(path, f"f{j}.bin"), "wb") as stream:
+                        stream.write(b"x" * 16)
+                next_level.append(path)
+                count += 1
+        level = next_level
+    return count
+
+
+def queue_walk(root, workers):
+    """旧实现的简化版：共享队列 + get(timeout) 轮询 + join 线程。"""
+    dir_queue = queue.Queue()
+    dir_queue.put(root)
+    files = [0]
+    lock = threading.Lock()
+
+    def _worker():
+        while True:
+            try:
+                d = dir_queue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if d is None:
+                dir_queue.task_done()
+                break
+            local = 0
+            with os.scandir(d) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        dir_queue.put(entry.path)
+                    else:
+                        entry.stat(follow_symlinks=False)
+                        local += 1
+            with lock:
+                files[0] += local
+            dir_queue.task_done()
+
+    threads = [threading.Thread(target=_worker, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    done = threading.Event()
+    threading.Thread(target=lambda: (dir_queue.join(), done.set()), daemon=True).start()
+    while not done.wait(0.1):
+        pass
+    for _ in threads:
+        dir_queue.put(None)
+    for t in threads:
+        t.join()
+    return files[0]
+
+
+def stealing_walk(root, workers):
+    files, _dirs = main.walk_files_threaded([root], [], workers, collect_files=True)
+    return len(files)
+
+
+def measure_memory(root, workers, mode):
+    """返回 (结果条数, tracemalloc 峰值字节数)；结果保持存活到测量结束。"""
+    tracemalloc.start()
+    try:
+        files, _dirs = main.walk_files_threaded([root], [], workers, collect_files=True, file_result_mode=mode)
+        _current, peak = tracemalloc.get_traced_memory()
+        return len(files), peak
+    finally:
+        tracemalloc.stop()
+
+
+def measure(fn, root, workers, repeat):
+    best = None
+    found = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        found = fn(root, workers)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, found
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=400, help="第一层子目录数量")
+    parser.add_argument("--depth", type=int, default=2, help="目录层数")
+    parser.add_argument("--files", type=int, default=4, help="每个目录的文件数量")
+    parser.add_argument("--workers", default="1,2,4,8,16", help="逗号分隔的线程数列表")
+    parser.add_argument("--repeat", type=int, default=3, help="每组取最快的一次")
+    parser.add_argument("--dir", default=None, help="在指定目录下生成合成树（默认系统临时目录）")
+    parser.add_argument("--memory", action="store_true", help="对比元组结果与路径树结果的内存峰值")
+    args = parser.parse_args()
+    worker_counts = [int(item) for item in args.workers.split(",") if item.strip()]
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as base:
+        root = os.path.join(base, "tree")
+        os.mkdir(root)
+        t0 = time.perf_counter()
+        dirs = build_tree(root, args.width, args.depth, args.files)
+        print(f"合成目录树: {dirs} 个目录, {dirs * args.files} 个文件, 生成耗时 {time.perf_counter() - t0:.1f}s")
+        print(f"{'引擎':<14}{'线程':>6}{'耗时(s)':>10}{'目录/秒':>12}{'加速比':>8}")
+        for name, fn in (("queue-poll", queue_walk), ("work-stealing", stealing_walk)):
+            baseline = None
+            for workers in worker_counts:
+                elapsed, found = measure(fn, root, workers, args.repeat)
+                if found != dirs * args.files:
+                    print(f"警告: {name} 找到 {found} 个文件, 期望 {dirs * args.files}")
+                baseline = baseline or elapsed
+                print(f"{name:<14}{workers:>6}{elapsed:>10.3f}{dirs / elapsed:>12.0f}{baseline / elapsed:>8.2f}")
+        if args.memory:
+            print(f"{'结果形式':<14}{'条目':>10}{'峰值(MB)':>12}{'字节/条':>10}")
+            for mode in ("size_path", "compact"):
+                count, peak = measure_memory(root, worker_counts[-1], mode)
+                print(f"{mode:<14}{count:>10}{peak / 1048576:>12.1f}{peak / max(1, count):>10.0f}")
+
+
+if __name__ == "__main__":
+    main_cli()
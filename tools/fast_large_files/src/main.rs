@@ -1,29 +1,26 @@
-#[cfg(not(windows))]
 fn main() {
-    eprintln!("fast_large_files only supports Windows NTFS volumes");
-    std::process::exit(1);
-}
-
-#[cfg(windows)]
-fn main() {
-    if let Err(err) = windows::run() {
+    if let Err(err) = scanner::run() {
         eprintln!("{err}");
         std::process::exit(1);
     }
 }
 
-#[cfg(windows)]
-mod windows {
-    use std::collections::HashSet;
+/// Live volumes are only opened on Windows; `--image` reads an NTFS image file through the
+/// same parser on any platform, which is what the benchmarks and non-Windows tests use.
+mod scanner {
+    use std::collections::{HashMap, HashSet};
     use std::env;
     use std::error::Error;
     use std::fs::File;
-    use std::io::{self, Read, Seek, SeekFrom};
+    use std::io::{self, BufWriter, Read, Seek, SeekFrom, Write};
+    #[cfg(windows)]
     use std::os::windows::fs::OpenOptionsExt;
     use std::path::{Component, Path, PathBuf};
+    use std::thread;
 
     type Result<T> = std::result::Result<T, Box<dyn Error>>;
 
+    #[cfg(windows)]
     const FILE_SHARE_ALL: u32 = 0x7;
     const ROOT_RECORD: usize = 5;
     const INVALID_INDEX: usize = usize::MAX;
@@ -38,50 +35,181 @@ mod windows {
     const FILE_ATTRIBUTE_REPARSE_POINT: u32 = 0x0000_0400;
 
     const CHUNK_RECORDS: usize = 16 * 1024;
+    const MIN_RECORDS_PER_THREAD: usize = 1024;
+    const MAX_PARSE_THREADS: usize = 16;
     const READ_CHUNK_SIZE: u64 = 1 << 20;
 
+    /// Output is streamed so the caller can show progress before the scan ends: progress
+    /// records while MFT records are read, then each root's rows (largest first, at most
+    /// --limit) followed by a root-done record. With `--dir-sizes` the rows are directory
+    /// subtree sizes instead of large files (see `DirSizeQuery`). The global top-K across roots is merged by
+    /// the caller. See `RecordWriter` for the JSON-lines and binary encodings.
     pub fn run() -> Result<()> {
         let args = Args::parse()?;
-        let mut rows = Vec::new();
+        let stdout = io::stdout();
+        let mut out = RecordWriter::new(BufWriter::new(stdout.lock()), args.format);
+        out.begin()?;
 
         for root in &args.roots {
-            let mut root_rows = scan_root(
-                root,
-                args.min_bytes,
-                args.limit,
-                args.skip_optional,
-                &args.excludes,
-            )?;
-            rows.append(&mut root_rows);
-        }
-
-        rows.sort_by(|a, b| {
-            b.size
-                .cmp(&a.size)
-                .then_with(|| normalize_path(&a.path).cmp(&normalize_path(&b.path)))
-        });
-        if args.limit > 0 && rows.len() > args.limit {
-            rows.truncate(args.limit);
-        }
+            let root_text = root.display().to_string();
+            let mut report = |done: usize, total: usize| out.progress(&root_text, done, total);
+            let mut rows = match &args.image {
+                Some(image) => scan_volume(
+                    File::open(image)?,
+                    &drive_root_for(root)?,
+                    &args.options,
+                    &mut report,
+                )?,
+                None => scan_root(root, &args.options, &mut report)?,
+            };
 
-        for row in rows {
-            println!(
-                "{{\"size\":{},\"path\":\"{}\"}}",
-                row.size,
-                json_escape(&row.path.display().to_string())
-            );
+            rows.sort_by_cached_key(|row| (std::cmp::Reverse(row.size), normalize_path(&row.path)));
+            let mut written = 0usize;
+            for row in &rows {
+                if out.row(row.size, &display_path(&row.path))? {
+                    written += 1;
+                }
+            }
+            out.root_done(&root_text, written)?;
         }
 
         Ok(())
     }
 
+    #[derive(Debug, Clone, Copy, PartialEq, Eq)]
+    enum OutputFormat {
+        Json,
+        Binary,
+    }
+
+    const BINARY_MAGIC: &[u8; 4] = b"FLF1";
+    const BINARY_PROGRESS: u16 = 0xFFFF;
+    const BINARY_ROOT_DONE: u16 = 0xFFFE;
+    const BINARY_MAX_PATH: usize = 0xFFFD;
+
+    /// Encodes the output stream.
+    ///
+    /// JSON lines: `{"progress":N,"total":M,"root":"C:\\"}`, `{"size":S,"path":"..."}` and
+    /// `{"root_done":"C:\\","rows":K}`.
+    ///
+    /// Binary (`--format binary`): the magic `FLF1`, then records of little-endian
+    /// `u64 value, u16 length` followed by `length` UTF-8 path bytes. Lengths 0xFFFE and
+    /// 0xFFFF are reserved: 0xFFFF is progress (value = records read, followed by a u64
+    /// total) and 0xFFFE marks the end of a root (value = rows written). Roots are reported
+    /// in the order they were passed, so control records carry no root path.
+    struct RecordWriter<W: Write> {
+        out: W,
+        format: OutputFormat,
+    }
+
+    impl<W: Write> RecordWriter<W> {
+        fn new(out: W, format: OutputFormat) -> Self {
+            Self { out, format }
+        }
+
+        fn begin(&mut self) -> io::Result<()> {
+            if self.format == OutputFormat::Binary {
+                self.out.write_all(BINARY_MAGIC)?;
+            }
+            Ok(())
+        }
+
+        fn progress(&mut self, root: &str, done: usize, total: usize) -> io::Result<()> {
+            match self.format {
+                OutputFormat::Json => writeln!(
+                    self.out,
+                    "{{\"progress\":{done},\"total\":{total},\"root\":\"{}\"}}",
+                    json_escape(root)
+                )?,
+                OutputFormat::Binary => {
+                    self.binary_header(done as u64, BINARY_PROGRESS)?;
+                    self.out.write_all(&(total as u64).to_le_bytes())?;
+                }
+            }
+            self.out.flush()
+        }
+
+        /// Returns false when the path does not fit the binary length field and was skipped.
+        fn row(&mut self, size: u64, path: &str) -> io::Result<bool> {
+            match self.format {
+                OutputFormat::Json => writeln!(
+                    self.out,
+                    "{{\"size\":{size},\"path\":\"{}\"}}",
+                    json_escape(path)
+                )?,
+                OutputFormat::Binary => {
+                    if path.len() > BINARY_MAX_PATH {
+                        eprintln!("skipping path longer than {BINARY_MAX_PATH} bytes: {path}");
+                        return Ok(false);
+                    }
+                    self.binary_header(size, path.len() as u16)?;
+                    self.out.write_all(path.as_bytes())?;
+                }
+            }
+            Ok(true)
+        }
+
+        fn root_done(&mut self, root: &str, rows: usize) -> io::Result<()> {
+            match self.format {
+                OutputFormat::Json => writeln!(
+                    self.out,
+                    "{{\"root_done\":\"{}\",\"rows\":{rows}}}",
+                    json_escape(root)
+                )?,
+                OutputFormat::Binary => self.binary_header(rows as u64, BINARY_ROOT_DONE)?,
+            }
+            self.out.flush()
+        }
+
+        fn binary_header(&mut self, value: u64, length: u16) -> io::Result<()> {
+            let mut header = [0u8; 10];
+            header[..8].copy_from_slice(&value.to_le_bytes());
+            header[8..].copy_from_slice(&length.to_le_bytes());
+            self.out.write_all(&header)
+        }
+    }
+
     #[derive(Debug)]
     struct Args {
         roots: Vec<PathBuf>,
-        excludes: Vec<PathBuf>,
+        format: OutputFormat,
+        image: Option<PathBuf>,
+        options: ScanOptions,
+    }
+
+    #[derive(Debug, Clone)]
+    struct ScanOptions {
         min_bytes: u64,
         limit: usize,
         skip_optional: bool,
+        excludes: Vec<PathBuf>,
+        /// MFT parse threads; 0 picks one per available core (capped at `MAX_PARSE_THREADS`).
+        threads: usize,
+        dir_sizes: Option<DirSizeQuery>,
+    }
+
+    /// `--dir-sizes`: report aggregated subtree sizes instead of large files. Every directory
+    /// within `depth` levels below the root is reported under its reconstructed path, and
+    /// every `--query` / `--query-list` directory on the scanned drive is reported under the
+    /// exact text it was queried with. Queries that do not resolve to a directory (missing,
+    /// behind a reparse point, or spelled with short names) are left out so the caller can
+    /// fall back for them.
+    #[derive(Debug, Clone, Default)]
+    struct DirSizeQuery {
+        depth: usize,
+        queries: Vec<String>,
+    }
+
+    impl ScanOptions {
+        fn parse_threads(&self) -> usize {
+            if self.threads > 0 {
+                return self.threads;
+            }
+            thread::available_parallelism()
+                .map(|n| n.get())
+                .unwrap_or(1)
+                .min(MAX_PARSE_THREADS)
+        }
     }
 
     impl Args {
@@ -91,6 +219,12 @@ mod windows {
             let mut min_bytes = 300 * 1024 * 1024;
             let mut limit = 300usize;
             let mut skip_optional = false;
+            let mut format = OutputFormat::Json;
+            let mut image = None;
+            let mut threads = 0usize;
+            let mut dir_sizes = false;
+            let mut depth = 0usize;
+            let mut queries = Vec::new();
 
             let mut args = env::args().skip(1);
             while let Some(arg) = args.next() {
@@ -116,6 +250,44 @@ mod windows {
                             "1" | "true" | "yes" | "y"
                         );
                     }
+                    "--threads" => {
+                        threads = next_value(&mut args, "--threads")?
+                            .parse()
+                            .map_err(|_| invalid_input("--threads must be an integer"))?;
+                    }
+                    "--dir-sizes" => dir_sizes = true,
+                    "--depth" => {
+                        depth = next_value(&mut args, "--depth")?
+                            .parse()
+                            .map_err(|_| invalid_input("--depth must be an integer"))?;
+                    }
+                    "--query" => queries.push(next_value(&mut args, "--query")?),
+                    "--query-list" => {
+                        let source = next_value(&mut args, "--query-list")?;
+                        let text = if source == "-" {
+                            let mut text = String::new();
+                            io::stdin().read_to_string(&mut text)?;
+                            text
+                        } else {
+                            std::fs::read_to_string(&source)?
+                        };
+                        queries.extend(
+                            text.lines()
+                                .map(str::trim)
+                                .filter(|line| !line.is_empty())
+                                .map(str::to_string),
+                        );
+                    }
+                    "--image" => image = Some(PathBuf::from(next_value(&mut args, "--image")?)),
+                    "--format" => {
+                        format = match next_value(&mut args, "--format")?.as_str() {
+                            "json" => OutputFormat::Json,
+                            "binary" => OutputFormat::Binary,
+                            _ => {
+                                return Err(invalid_input("--format must be json or binary").into())
+                            }
+                        };
+                    }
                     "--help" | "-h" => {
                         print_help();
                         std::process::exit(0);
@@ -127,19 +299,43 @@ mod windows {
                 }
             }
 
+            if dir_sizes && roots.is_empty() {
+                let mut drives = Vec::new();
+                for query in &queries {
+                    if let Some(drive) = query_drive(query) {
+                        if !drives.contains(&drive) {
+                            drives.push(drive);
+                        }
+                    }
+                }
+                roots.extend(
+                    drives
+                        .iter()
+                        .map(|drive| PathBuf::from(format!("{drive}:\\"))),
+                );
+            }
             if roots.is_empty() {
                 roots.push(PathBuf::from("C:\\"));
             }
             if min_bytes == 0 {
                 return Err(invalid_input("--min-bytes must be greater than zero").into());
             }
+            if image.is_some() && roots.len() != 1 {
+                return Err(invalid_input("--image takes a single --root naming its drive").into());
+            }
 
             Ok(Self {
                 roots,
-                excludes,
-                min_bytes,
-                limit,
-                skip_optional,
+                format,
+                image,
+                options: ScanOptions {
+                    min_bytes,
+                    limit,
+                    skip_optional,
+                    excludes,
+                    threads,
+                    dir_sizes: dir_sizes.then_some(DirSizeQuery { depth, queries }),
+                },
             })
         }
     }
@@ -151,7 +347,7 @@ mod windows {
 
     fn print_help() {
         eprintln!(
-            "Usage: fast_large_files.exe --root C:\\ --min-bytes 524288000 --limit 200 --skip-optional 1 [--exclude PATH]..."
+            "Usage: fast_large_files.exe --root C:\\ --min-bytes 524288000 --limit 200 --skip-optional 1 [--threads N] [--format json|binary] [--image FILE] [--exclude PATH]...\n       fast_large_files.exe --dir-sizes [--depth N] [--query DIR]... [--query-list FILE|-] [--root C:\\]..."
         );
     }
 
@@ -187,20 +383,21 @@ mod windows {
 
     fn scan_root(
         root: &Path,
-        min_bytes: u64,
-        limit: usize,
-        skip_optional: bool,
-        exclude_prefixes: &[PathBuf],
+        options: &ScanOptions,
+        progress: &mut dyn FnMut(usize, usize) -> io::Result<()>,
+    ) -> Result<Vec<FastLargeFile>> {
+        let drive_root = drive_root_for(root)?;
+        let drive = drive_letter(&drive_root).unwrap_or('C');
+        scan_volume(open_volume(drive)?, &drive_root, options, progress)
+    }
+
+    /// Parses the NTFS volume behind `volume` (a live volume handle or an image file).
+    fn scan_volume<R: Read + Seek>(
+        volume: R,
+        drive_root: &Path,
+        options: &ScanOptions,
+        progress: &mut dyn FnMut(usize, usize) -> io::Result<()>,
     ) -> Result<Vec<FastLargeFile>> {
-        let drive = drive_letter(root).ok_or_else(|| {
-            invalid_input(format!(
-                "fast MFT backend only supports drive roots, got {}",
-                root.display()
-            ))
-        })?;
-        let drive = drive.to_ascii_uppercase();
-        let drive_root = PathBuf::from(format!("{drive}:\\"));
-        let volume = open_volume(drive)?;
         let mut reader = SectorReader::new(volume);
 
         let (layout, mft_runs, mft_size) = load_layout_and_mft_runs(&mut reader)?;
@@ -211,7 +408,14 @@ mod windows {
         }
 
         let mut records = vec![FastRecord::default(); entry_count];
-        read_records_from_runs(&mut reader, &mft_runs, layout, &mut records)?;
+        read_records_from_runs(
+            &mut reader,
+            &mft_runs,
+            layout,
+            &mut records,
+            options.parse_threads(),
+            progress,
+        )?;
         merge_extension_records(&mut records);
 
         if ROOT_RECORD < records.len() {
@@ -220,16 +424,30 @@ mod windows {
             records[ROOT_RECORD].parent = ROOT_RECORD as u64;
         }
 
+        if let Some(query) = &options.dir_sizes {
+            return Ok(directory_size_entries(&records, drive_root, query));
+        }
         Ok(build_large_file_entries(
             &records,
-            &drive_root,
-            min_bytes,
-            limit,
-            skip_optional,
-            exclude_prefixes,
+            drive_root,
+            options.min_bytes,
+            options.limit,
+            options.skip_optional,
+            &options.excludes,
         ))
     }
 
+    fn drive_root_for(root: &Path) -> Result<PathBuf> {
+        let drive = drive_letter(root).ok_or_else(|| {
+            invalid_input(format!(
+                "fast MFT backend only supports drive roots, got {}",
+                root.display()
+            ))
+        })?;
+        Ok(PathBuf::from(format!("{}:\\", drive.to_ascii_uppercase())))
+    }
+
+    #[cfg(windows)]
     fn open_volume(drive: char) -> io::Result<File> {
         let volume_path = format!("\\\\.\\{drive}:");
         File::options()
@@ -238,6 +456,25 @@ mod windows {
             .open(volume_path)
     }
 
+    #[cfg(not(windows))]
+    fn open_volume(_drive: char) -> io::Result<File> {
+        Err(io::Error::new(
+            io::ErrorKind::Unsupported,
+            "live NTFS volumes can only be opened on Windows; use --image FILE",
+        ))
+    }
+
+    /// Paths are built by pushing MFT names onto `X:\`; off Windows `PathBuf` joins them
+    /// with `/`, so normalise to the Windows separator the caller expects.
+    fn display_path(path: &Path) -> String {
+        let text = path.display().to_string();
+        if cfg!(windows) {
+            text
+        } else {
+            text.replacen(":\\/", ":\\", 1).replace('/', "\\")
+        }
+    }
+
     fn load_layout_and_mft_runs<R: Read + Seek>(
         reader: &mut R,
     ) -> Result<(NtfsLayout, Vec<DataRun>, u64)> {
@@ -290,61 +527,146 @@ mod windows {
         Ok((layout, runs, mft_size))
     }
 
+    /// One contiguous read of whole MFT records: `records` records starting at
+    /// `first_record`, located at `disk_offset` on the volume.
+    #[derive(Debug, Clone, Copy, PartialEq, Eq)]
+    struct MftRead {
+        disk_offset: u64,
+        first_record: usize,
+        records: usize,
+    }
+
+    /// Splits the $MFT data runs into reads of at most `CHUNK_RECORDS` records, skipping
+    /// sparse runs and anything past `record_count`.
+    fn plan_mft_reads(runs: &[DataRun], layout: NtfsLayout, record_count: usize) -> Vec<MftRead> {
+        let chunk_bytes = (layout.record_size * CHUNK_RECORDS) as u64;
+        let mut reads = Vec::new();
+        let mut logical_offset = 0u64;
+
+        for run in runs {
+            let run_bytes = run.clusters.saturating_mul(layout.cluster_size);
+            if run.lcn >= 0 {
+                let mut run_offset = 0u64;
+                while run_offset < run_bytes {
+                    let len = (run_bytes - run_offset).min(chunk_bytes);
+                    let first_record =
+                        ((logical_offset + run_offset) / layout.record_size as u64) as usize;
+                    let records = ((len / layout.record_size as u64) as usize)
+                        .min(record_count.saturating_sub(first_record));
+                    if records == 0 {
+                        break;
+                    }
+                    reads.push(MftRead {
+                        disk_offset: run.lcn as u64 * layout.cluster_size + run_offset,
+                        first_record,
+                        records,
+                    });
+                    run_offset += len;
+                }
+            }
+            logical_offset = logical_offset.saturating_add(run_bytes);
+        }
+
+        reads
+    }
+
+    /// Reads the MFT in `CHUNK_RECORDS` chunks and parses them on `threads` workers. The
+    /// next chunk is read while the current one is parsed, so I/O and parsing overlap.
     fn read_records_from_runs<R: Read + Seek>(
         reader: &mut R,
         runs: &[DataRun],
         layout: NtfsLayout,
         records: &mut [FastRecord],
+        threads: usize,
+        progress: &mut dyn FnMut(usize, usize) -> io::Result<()>,
     ) -> Result<()> {
-        let mut buffer = vec![0u8; layout.record_size * CHUNK_RECORDS];
-        let mut logical_offset = 0u64;
+        let reads = plan_mft_reads(runs, layout, records.len());
+        let Some(first) = reads.first() else {
+            return Ok(());
+        };
+        let mut current = vec![0u8; layout.record_size * CHUNK_RECORDS];
+        let mut next = vec![0u8; layout.record_size * CHUNK_RECORDS];
+        let mut records_read = 0usize;
+        read_mft_chunk(reader, first, layout, &mut current)?;
+
+        for (idx, chunk) in reads.iter().enumerate() {
+            let chunk_bytes = chunk.records * layout.record_size;
+            let targets = &mut records[chunk.first_record..chunk.first_record + chunk.records];
+            let parse_input = &mut current[..chunk_bytes];
+            thread::scope(|scope| -> io::Result<()> {
+                scope.spawn(|| {
+                    parse_record_chunk(parse_input, targets, chunk.first_record, layout, threads)
+                });
+                match reads.get(idx + 1) {
+                    Some(upcoming) => read_mft_chunk(reader, upcoming, layout, &mut next),
+                    None => Ok(()),
+                }
+            })?;
+            std::mem::swap(&mut current, &mut next);
 
-        for run in runs {
-            let run_bytes = run.clusters.saturating_mul(layout.cluster_size);
-            if run.lcn < 0 {
-                logical_offset = logical_offset.saturating_add(run_bytes);
-                continue;
-            }
+            records_read = (records_read + chunk.records).min(records.len());
+            progress(records_read, records.len())?;
+        }
 
-            let mut run_offset = 0u64;
-            while run_offset < run_bytes {
-                let remaining = (run_bytes - run_offset) as usize;
-                let mut read_len = remaining.min(buffer.len());
-                read_len = (read_len / layout.record_size) * layout.record_size;
-                if read_len == 0 {
-                    break;
-                }
+        Ok(())
+    }
 
-                let disk_offset = run.lcn as u64 * layout.cluster_size + run_offset;
-                reader.seek(SeekFrom::Start(disk_offset))?;
-                reader.read_exact(&mut buffer[..read_len])?;
-
-                let base_record =
-                    ((logical_offset + run_offset) / layout.record_size as u64) as usize;
-                for (record_offset, record_bytes) in buffer[..read_len]
-                    .chunks_exact(layout.record_size)
-                    .enumerate()
-                {
-                    let record_num = base_record + record_offset;
-                    if record_num >= records.len() {
-                        break;
-                    }
+    fn read_mft_chunk<R: Read + Seek>(
+        reader: &mut R,
+        chunk: &MftRead,
+        layout: NtfsLayout,
+        buffer: &mut [u8],
+    ) -> io::Result<()> {
+        reader.seek(SeekFrom::Start(chunk.disk_offset))?;
+        reader.read_exact(&mut buffer[..chunk.records * layout.record_size])
+    }
 
-                    let mut temp = record_bytes.to_vec();
-                    if let Some(record) =
-                        parse_file_record(record_num as u64, &mut temp, layout.bytes_per_sector)
-                    {
-                        records[record_num] = record;
-                    }
-                }
+    /// Parses the raw records in `data` into `targets` (same length in records). Fixups
+    /// are applied in place; the chunk is split across up to `threads` scoped workers.
+    fn parse_record_chunk(
+        data: &mut [u8],
+        targets: &mut [FastRecord],
+        first_record: usize,
+        layout: NtfsLayout,
+        threads: usize,
+    ) {
+        let workers = threads.min(targets.len() / MIN_RECORDS_PER_THREAD).max(1);
+        let per_worker = targets.len().div_ceil(workers);
+        if workers == 1 {
+            parse_record_range(data, targets, first_record, layout);
+            return;
+        }
 
-                run_offset += read_len as u64;
+        thread::scope(|scope| {
+            for (part, (bytes, slots)) in data
+                .chunks_mut(per_worker * layout.record_size)
+                .zip(targets.chunks_mut(per_worker))
+                .enumerate()
+            {
+                let base = first_record + part * per_worker;
+                scope.spawn(move || parse_record_range(bytes, slots, base, layout));
             }
+        });
+    }
 
-            logical_offset = logical_offset.saturating_add(run_bytes);
+    fn parse_record_range(
+        data: &mut [u8],
+        targets: &mut [FastRecord],
+        first_record: usize,
+        layout: NtfsLayout,
+    ) {
+        for (offset, (record_bytes, slot)) in data
+            .chunks_exact_mut(layout.record_size)
+            .zip(targets.iter_mut())
+            .enumerate()
+        {
+            let record_num = (first_record + offset) as u64;
+            if let Some(record) =
+                parse_file_record(record_num, record_bytes, layout.bytes_per_sector)
+            {
+                *slot = record;
+            }
         }
-
-        Ok(())
     }
 
     fn parse_file_record(
@@ -618,11 +940,12 @@ mod windows {
 
         let mut rows = Vec::new();
         let mut seen = HashSet::new();
+        let mut dir_paths = DirPathCache::new(records, drive_root);
         for (idx, size) in refs {
             if limit > 0 && rows.len() >= limit {
                 break;
             }
-            let Some(path) = build_path(records, idx, drive_root) else {
+            let Some(path) = dir_paths.file_path(idx) else {
                 continue;
             };
             if is_ntfs_metadata_or_protected_path(&path, drive_root) {
@@ -644,34 +967,217 @@ mod windows {
         rows
     }
 
-    fn build_path(records: &[FastRecord], idx: usize, drive_root: &Path) -> Option<PathBuf> {
-        let mut current = idx;
-        let mut segments = Vec::new();
-        let mut guard = 0usize;
+    const DEPTH_UNRESOLVED: u32 = 0;
+    const DEPTH_VISITING: u32 = u32::MAX;
+    const DEPTH_INVALID: u32 = u32::MAX - 1;
+
+    /// Depth below the root (root = 1, stored as depth + 1 like `DirPathCache` slots) for every
+    /// directory whose parent chain reaches the root through active, non-reparse directories;
+    /// anything else, including parent cycles, is `DEPTH_INVALID`.
+    fn directory_depths(records: &[FastRecord]) -> Vec<u32> {
+        let mut depths = vec![DEPTH_UNRESOLVED; records.len()];
+        if ROOT_RECORD >= records.len() {
+            return depths;
+        }
+        depths[ROOT_RECORD] = 1;
+        let mut chain = Vec::new();
+        for start in 0..records.len() {
+            if depths[start] != DEPTH_UNRESOLVED {
+                continue;
+            }
+            chain.clear();
+            let mut current = start;
+            let base = loop {
+                match depths.get(current).copied() {
+                    Some(DEPTH_UNRESOLVED) => {
+                        let rec = &records[current];
+                        if !rec.active || !rec.is_dir || rec.is_reparse {
+                            depths[current] = DEPTH_INVALID;
+                            break None;
+                        }
+                        depths[current] = DEPTH_VISITING;
+                        chain.push(current);
+                        current = rec.parent as usize;
+                    }
+                    Some(DEPTH_VISITING) | Some(DEPTH_INVALID) | None => break None,
+                    Some(depth) => break Some(depth),
+                }
+            };
+            match base {
+                Some(mut depth) => {
+                    for &idx in chain.iter().rev() {
+                        depth += 1;
+                        depths[idx] = depth;
+                    }
+                }
+                None => {
+                    for &idx in &chain {
+                        depths[idx] = DEPTH_INVALID;
+                    }
+                }
+            }
+        }
+        depths
+    }
 
-        while current != ROOT_RECORD {
-            guard += 1;
-            if guard > records.len() {
-                return None;
+    /// Total size of regular files below each directory, indexed by record number. Files are
+    /// added to their parent, then directories are folded into their parents deepest first, so
+    /// the whole volume is aggregated in one pass. Reparse points (symlinks, junctions) are
+    /// neither counted nor descended, matching the Python directory walker.
+    fn subtree_sizes(records: &[FastRecord], depths: &[u32]) -> Vec<u64> {
+        let valid = |idx: usize| matches!(depths.get(idx), Some(&d) if d != DEPTH_INVALID && d != DEPTH_UNRESOLVED);
+        let mut sizes = vec![0u64; records.len()];
+        for rec in records {
+            if rec.active && !rec.is_dir && !rec.is_reparse && valid(rec.parent as usize) {
+                sizes[rec.parent as usize] += rec.size;
             }
-            let rec = records.get(current)?;
-            if !rec.active || rec.name.is_empty() {
-                return None;
+        }
+
+        let mut order: Vec<usize> = (0..records.len())
+            .filter(|&idx| idx != ROOT_RECORD && valid(idx))
+            .collect();
+        order.sort_unstable_by_key(|&idx| std::cmp::Reverse(depths[idx]));
+        for idx in order {
+            let parent = records[idx].parent as usize;
+            sizes[parent] = sizes[parent].saturating_add(sizes[idx]);
+        }
+        sizes
+    }
+
+    fn directory_size_entries(
+        records: &[FastRecord],
+        drive_root: &Path,
+        query: &DirSizeQuery,
+    ) -> Vec<FastLargeFile> {
+        let depths = directory_depths(records);
+        let sizes = subtree_sizes(records, &depths);
+        let mut rows = Vec::new();
+
+        if query.depth > 0 {
+            let mut dir_paths = DirPathCache::new(records, drive_root);
+            for (idx, &depth) in depths.iter().enumerate() {
+                if depth == DEPTH_INVALID || depth < 2 || depth as usize > query.depth + 1 {
+                    continue;
+                }
+                if let Some(path) = dir_paths.file_path(idx) {
+                    rows.push(FastLargeFile {
+                        path,
+                        size: sizes[idx],
+                    });
+                }
+            }
+        }
+
+        let drive = drive_letter(drive_root).map(|d| d.to_ascii_uppercase());
+        let on_drive: Vec<&String> = query
+            .queries
+            .iter()
+            .filter(|text| query_drive(text).is_some() && query_drive(text) == drive)
+            .collect();
+        if on_drive.is_empty() {
+            return rows;
+        }
+
+        let mut children: HashMap<(usize, String), usize> = HashMap::new();
+        for (idx, rec) in records.iter().enumerate() {
+            if idx != ROOT_RECORD && depths[idx] != DEPTH_INVALID && depths[idx] != DEPTH_UNRESOLVED
+            {
+                children.insert((rec.parent as usize, rec.name.to_lowercase()), idx);
+            }
+        }
+        for text in on_drive {
+            let mut current = Some(ROOT_RECORD);
+            for name in text[2..].split(['\\', '/']).filter(|part| !part.is_empty()) {
+                current = current
+                    .and_then(|parent| children.get(&(parent, name.to_lowercase())).copied());
+            }
+            if let Some(idx) = current {
+                rows.push(FastLargeFile {
+                    path: PathBuf::from(text),
+                    size: sizes[idx],
+                });
+            }
+        }
+        rows
+    }
+
+    const PATH_UNRESOLVED: u32 = 0;
+    const PATH_VISITING: u32 = u32::MAX;
+    const PATH_INVALID: u32 = u32::MAX - 1;
+
+    /// Directory paths resolved on demand and indexed by MFT record number, so files in the
+    /// same directory reuse one resolved prefix instead of climbing to the root each time.
+    /// `slots[record]` is `index + 1` into `paths` once resolved. Records on the chain being
+    /// resolved are marked `PATH_VISITING`, so a parent cycle is detected when the climb meets
+    /// one again. Every record on a chain that loops, leaves the table or reaches an inactive
+    /// or unnamed record is marked `PATH_INVALID`.
+    struct DirPathCache<'a> {
+        records: &'a [FastRecord],
+        slots: Vec<u32>,
+        paths: Vec<PathBuf>,
+    }
+
+    impl<'a> DirPathCache<'a> {
+        fn new(records: &'a [FastRecord], drive_root: &Path) -> Self {
+            let mut slots = vec![PATH_UNRESOLVED; records.len()];
+            if ROOT_RECORD < slots.len() {
+                slots[ROOT_RECORD] = 1;
+            }
+            Self {
+                records,
+                slots,
+                paths: vec![drive_root.to_path_buf()],
             }
-            segments.push(rec.name.clone());
-            let parent = rec.parent as usize;
-            if parent >= records.len() {
+        }
+
+        fn file_path(&mut self, idx: usize) -> Option<PathBuf> {
+            if idx == ROOT_RECORD {
+                return Some(self.paths[0].clone());
+            }
+            let rec = self.records.get(idx)?;
+            if !rec.active || rec.name.is_empty() {
                 return None;
             }
-            current = parent;
+            let mut path = self.dir_path(rec.parent as usize)?.clone();
+            path.push(&rec.name);
+            Some(path)
         }
 
-        segments.reverse();
-        let mut path = drive_root.to_path_buf();
-        for segment in segments {
-            path.push(segment);
+        fn dir_path(&mut self, idx: usize) -> Option<&PathBuf> {
+            let mut chain = Vec::new();
+            let mut current = idx;
+            let resolved = loop {
+                match self.slots.get(current).copied() {
+                    Some(PATH_UNRESOLVED) => {
+                        let rec = &self.records[current];
+                        if !rec.active || rec.name.is_empty() {
+                            self.slots[current] = PATH_INVALID;
+                            break None;
+                        }
+                        self.slots[current] = PATH_VISITING;
+                        chain.push(current);
+                        current = rec.parent as usize;
+                    }
+                    Some(PATH_VISITING) | Some(PATH_INVALID) | None => break None,
+                    Some(slot) => break Some(slot as usize - 1),
+                }
+            };
+
+            let Some(mut slot) = resolved else {
+                for idx in chain {
+                    self.slots[idx] = PATH_INVALID;
+                }
+                return None;
+            };
+            for &idx in chain.iter().rev() {
+                let mut path = self.paths[slot].clone();
+                path.push(&self.records[idx].name);
+                self.paths.push(path);
+                slot = self.paths.len() - 1;
+                self.slots[idx] = slot as u32 + 1;
+            }
+            Some(&self.paths[slot])
         }
-        Some(path)
     }
 
     fn should_skip_large_file_path(path: &Path, skip_optional: bool) -> bool {
@@ -799,6 +1305,12 @@ mod windows {
             .to_ascii_lowercase()
     }
 
+    fn query_drive(text: &str) -> Option<char> {
+        let mut chars = text.chars();
+        let drive = chars.next()?;
+        (drive.is_ascii_alphabetic() && chars.next()? == ':').then(|| drive.to_ascii_uppercase())
+    }
+
     fn drive_letter(path: &Path) -> Option<char> {
         let raw = path.to_string_lossy().replace('/', "\\");
         let mut chars = raw.chars();
@@ -1068,7 +1580,317 @@ mod windows {
         }
 
         #[test]
-        fn build_path_rejects_parent_cycles() {
+        fn binary_writer_emits_length_prefixed_records() {
+            let mut out = RecordWriter::new(Vec::new(), OutputFormat::Binary);
+            out.begin().unwrap();
+            out.progress("C:\\", 3, 9).unwrap();
+            assert!(out.row(513, "C:\\测试.bin").unwrap());
+            assert!(!out.row(1, &"x".repeat(BINARY_MAX_PATH + 1)).unwrap());
+            out.root_done("C:\\", 1).unwrap();
+
+            let data = out.out;
+            let path = "C:\\测试.bin".as_bytes();
+            assert_eq!(&data[..4], BINARY_MAGIC);
+            assert_eq!(read_u64(&data, 4), 3);
+            assert_eq!(read_u16(&data, 12), BINARY_PROGRESS);
+            assert_eq!(read_u64(&data, 14), 9);
+            assert_eq!(read_u64(&data, 22), 513);
+            assert_eq!(read_u16(&data, 30) as usize, path.len());
+            assert_eq!(&data[32..32 + path.len()], path);
+            let tail = 32 + path.len();
+            assert_eq!(read_u64(&data, tail), 1);
+            assert_eq!(read_u16(&data, tail + 8), BINARY_ROOT_DONE);
+            assert_eq!(data.len(), tail + 10);
+        }
+
+        const TEST_CLUSTER: u64 = 4096;
+        const TEST_RECORD: usize = 1024;
+        const TEST_MFT_LCN: u64 = 4;
+
+        fn attribute(attr_type: u32, non_resident: bool, body: &[u8]) -> Vec<u8> {
+            let len = (16 + body.len() + 7) & !7;
+            let mut attr = vec![0u8; len];
+            attr[0..4].copy_from_slice(&attr_type.to_le_bytes());
+            attr[4..8].copy_from_slice(&(len as u32).to_le_bytes());
+            attr[8] = non_resident as u8;
+            attr[16..16 + body.len()].copy_from_slice(body);
+            attr
+        }
+
+        fn file_name_attribute(parent: u64, name: &str) -> Vec<u8> {
+            let units: Vec<u16> = name.encode_utf16().collect();
+            let mut body = vec![0u8; 8 + 66 + units.len() * 2];
+            body[0..4].copy_from_slice(&((66 + units.len() * 2) as u32).to_le_bytes());
+            body[4..6].copy_from_slice(&(24u16).to_le_bytes());
+            body[8..16].copy_from_slice(&parent.to_le_bytes());
+            body[8 + 64] = units.len() as u8;
+            body[8 + 65] = 1;
+            for (idx, unit) in units.iter().enumerate() {
+                body[8 + 66 + idx * 2..8 + 68 + idx * 2].copy_from_slice(&unit.to_le_bytes());
+            }
+            attribute(ATTR_FILE_NAME, false, &body)
+        }
+
+        fn data_attribute(size: u64, runlist: &[u8]) -> Vec<u8> {
+            let mut body = vec![0u8; 48 + runlist.len() + 1];
+            body[16..18].copy_from_slice(&(64u16).to_le_bytes());
+            body[32..40].copy_from_slice(&size.to_le_bytes());
+            body[48..48 + runlist.len()].copy_from_slice(runlist);
+            attribute(ATTR_DATA, true, &body)
+        }
+
+        fn file_record(is_dir: bool, attrs: &[Vec<u8>]) -> Vec<u8> {
+            let mut record = vec![0u8; TEST_RECORD];
+            record[0..4].copy_from_slice(b"FILE");
+            record[4..6].copy_from_slice(&(0x30u16).to_le_bytes());
+            record[6..8].copy_from_slice(&(3u16).to_le_bytes());
+            record[20..22].copy_from_slice(&(0x38u16).to_le_bytes());
+            let flags = FILE_RECORD_IN_USE | if is_dir { FILE_RECORD_DIRECTORY } else { 0 };
+            record[22..24].copy_from_slice(&flags.to_le_bytes());
+            let mut offset = 0x38;
+            for attr in attrs {
+                record[offset..offset + attr.len()].copy_from_slice(attr);
+                offset += attr.len();
+            }
+            record[offset..offset + 4].copy_from_slice(&ATTR_END.to_le_bytes());
+            record[0x30] = 1;
+            record[510] = 1;
+            record[1022] = 1;
+            record
+        }
+
+        /// Builds a minimal NTFS image: a boot sector and a contiguous $MFT holding
+        /// `(record, parent, name, is_dir, size)` entries plus the root directory.
+        fn synthetic_image(
+            entries: &[(usize, u64, &str, bool, u64)],
+            record_count: usize,
+        ) -> Vec<u8> {
+            let mft_bytes = (record_count * TEST_RECORD) as u64;
+            let mft_clusters = mft_bytes.div_ceil(TEST_CLUSTER);
+            let mft_offset = (TEST_MFT_LCN * TEST_CLUSTER) as usize;
+            let mut image = vec![0u8; mft_offset + (mft_clusters * TEST_CLUSTER) as usize];
+            image[3..11].copy_from_slice(b"NTFS    ");
+            image[11..13].copy_from_slice(&(512u16).to_le_bytes());
+            image[13] = 8;
+            image[48..56].copy_from_slice(&TEST_MFT_LCN.to_le_bytes());
+            image[64] = (-10i8) as u8;
+
+            let mut runlist = vec![0x88];
+            runlist.extend_from_slice(&mft_clusters.to_le_bytes());
+            runlist.extend_from_slice(&TEST_MFT_LCN.to_le_bytes());
+            let mut records = vec![
+                (
+                    0,
+                    file_record(false, &[data_attribute(mft_bytes, &runlist)]),
+                ),
+                (
+                    ROOT_RECORD,
+                    file_record(true, &[file_name_attribute(ROOT_RECORD as u64, ".")]),
+                ),
+            ];
+            for &(num, parent, name, is_dir, size) in entries {
+                let mut attrs = vec![file_name_attribute(parent, name)];
+                if !is_dir {
+                    attrs.push(data_attribute(size, &[]));
+                }
+                records.push((num, file_record(is_dir, &attrs)));
+            }
+            for (num, record) in records {
+                let start = mft_offset + num * TEST_RECORD;
+                image[start..start + TEST_RECORD].copy_from_slice(&record);
+            }
+            image
+        }
+
+        #[test]
+        fn image_scan_parses_synthetic_volume() {
+            let image = synthetic_image(
+                &[
+                    (16, ROOT_RECORD as u64, "Users", true, 0),
+                    (17, 16, "测试", true, 0),
+                    (18, 17, "movie.mkv", false, 900 << 20),
+                    (19, ROOT_RECORD as u64, "small.txt", false, 10),
+                    (20, ROOT_RECORD as u64, "disk.vhdx", false, 500 << 20),
+                    (21, ROOT_RECORD as u64, "$Extend", false, 700 << 20),
+                ],
+                24,
+            );
+            let mut reported = Vec::new();
+            let options = ScanOptions {
+                min_bytes: 1 << 20,
+                limit: 0,
+                skip_optional: true,
+                excludes: Vec::new(),
+                threads: 1,
+                dir_sizes: None,
+            };
+            let rows = scan_volume(
+                io::Cursor::new(image),
+                Path::new("C:\\"),
+                &options,
+                &mut |done, total| {
+                    reported.push((done, total));
+                    Ok(())
+                },
+            )
+            .expect("synthetic image parses");
+
+            let found: Vec<(String, u64)> = rows
+                .iter()
+                .map(|row| (display_path(&row.path), row.size))
+                .collect();
+            assert_eq!(
+                found,
+                vec![("C:\\Users\\测试\\movie.mkv".to_string(), 900 << 20)]
+            );
+            assert_eq!(reported.last(), Some(&(24, 24)));
+        }
+
+        #[test]
+        fn mft_reads_split_runs_into_chunks_and_skip_sparse_runs() {
+            let layout = NtfsLayout {
+                bytes_per_sector: 512,
+                cluster_size: 4096,
+                record_size: 1024,
+            };
+            let chunk_clusters = (CHUNK_RECORDS / 4) as u64;
+            let runs = [
+                DataRun {
+                    lcn: 10,
+                    clusters: chunk_clusters + 2,
+                },
+                DataRun {
+                    lcn: -1,
+                    clusters: 1,
+                },
+                DataRun {
+                    lcn: 900_000,
+                    clusters: 3,
+                },
+            ];
+            let reads = plan_mft_reads(&runs, layout, CHUNK_RECORDS + 8 + 4 + 6);
+            assert_eq!(
+                reads,
+                vec![
+                    MftRead {
+                        disk_offset: 10 * 4096,
+                        first_record: 0,
+                        records: CHUNK_RECORDS
+                    },
+                    MftRead {
+                        disk_offset: (10 + chunk_clusters) * 4096,
+                        first_record: CHUNK_RECORDS,
+                        records: 8,
+                    },
+                    MftRead {
+                        disk_offset: 900_000 * 4096,
+                        first_record: CHUNK_RECORDS + 12,
+                        records: 6,
+                    },
+                ]
+            );
+        }
+
+        #[test]
+        fn threaded_parse_matches_single_thread() {
+            let names: Vec<String> = (16..4096).map(|num| format!("f{num}.bin")).collect();
+            let entries: Vec<(usize, u64, &str, bool, u64)> = names
+                .iter()
+                .enumerate()
+                .map(|(idx, name)| {
+                    (
+                        idx + 16,
+                        ROOT_RECORD as u64,
+                        name.as_str(),
+                        false,
+                        idx as u64 * 7,
+                    )
+                })
+                .collect();
+            let image = synthetic_image(&entries, 4096);
+            let parse = |threads: usize| {
+                let mut reader = SectorReader::new(io::Cursor::new(image.clone()));
+                let (layout, runs, size) = load_layout_and_mft_runs(&mut reader).unwrap();
+                let mut records = vec![FastRecord::default(); size as usize / layout.record_size];
+                read_records_from_runs(
+                    &mut reader,
+                    &runs,
+                    layout,
+                    &mut records,
+                    threads,
+                    &mut |_, _| Ok(()),
+                )
+                .unwrap();
+                records
+                    .iter()
+                    .map(|rec| (rec.active, rec.parent, rec.name.clone(), rec.size))
+                    .collect::<Vec<_>>()
+            };
+            let single = parse(1);
+            assert_eq!(
+                single[4095],
+                (true, ROOT_RECORD as u64, "f4095.bin".to_string(), 4079 * 7)
+            );
+            assert_eq!(parse(4), single);
+        }
+
+        #[test]
+        fn dir_sizes_aggregate_subtrees_for_queries_and_depth() {
+            let image = synthetic_image(
+                &[
+                    (16, ROOT_RECORD as u64, "Users", true, 0),
+                    (17, 16, "Data", true, 0),
+                    (18, 17, "a.bin", false, 300),
+                    (19, 16, "b.bin", false, 20),
+                    (20, ROOT_RECORD as u64, "top.bin", false, 1),
+                    (21, ROOT_RECORD as u64, "Empty", true, 0),
+                    (22, 23, "loop", true, 0),
+                    (23, 22, "back", true, 0),
+                    (24, 22, "hidden.bin", false, 1000),
+                ],
+                28,
+            );
+            let options = ScanOptions {
+                min_bytes: 1,
+                limit: 1,
+                skip_optional: false,
+                excludes: Vec::new(),
+                threads: 1,
+                dir_sizes: Some(DirSizeQuery {
+                    depth: 1,
+                    queries: vec![
+                        "c:\\users\\DATA".to_string(),
+                        "C:\\".to_string(),
+                        "C:\\Users\\b.bin".to_string(),
+                        "C:\\Missing".to_string(),
+                        "D:\\Users".to_string(),
+                    ],
+                }),
+            };
+            let rows = scan_volume(
+                io::Cursor::new(image),
+                Path::new("C:\\"),
+                &options,
+                &mut |_, _| Ok(()),
+            )
+            .expect("synthetic image parses");
+            let found: Vec<(String, u64)> = rows
+                .iter()
+                .map(|row| (display_path(&row.path), row.size))
+                .collect();
+            assert_eq!(
+                found,
+                vec![
+                    ("C:\\Users".to_string(), 320),
+                    ("C:\\Empty".to_string(), 0),
+                    ("c:\\users\\DATA".to_string(), 300),
+                    ("C:\\".to_string(), 321),
+                ]
+            );
+        }
+
+        #[test]
+        fn dir_path_cache_rejects_parent_cycles() {
             let mut records = vec![FastRecord::default(); 7];
             records[ROOT_RECORD] = FastRecord {
                 active: true,
@@ -1082,7 +1904,48 @@ mod windows {
                 name: "loop".to_string(),
                 ..FastRecord::default()
             };
-            assert!(build_path(&records, 6, Path::new("C:\\")).is_none());
+            assert!(DirPathCache::new(&records, Path::new("C:\\"))
+                .file_path(6)
+                .is_none());
+        }
+
+        #[test]
+        fn dir_path_cache_shares_resolved_directories() {
+            let record = |parent: usize, name: &str, is_dir: bool| FastRecord {
+                active: true,
+                parent: parent as u64,
+                name: name.to_string(),
+                is_dir,
+                ..FastRecord::default()
+            };
+            let mut records = vec![FastRecord::default(); 14];
+            records[ROOT_RECORD] = record(ROOT_RECORD, "", true);
+            records[6] = record(ROOT_RECORD, "Users", true);
+            records[7] = record(6, "Data", true);
+            records[8] = record(7, "a.bin", false);
+            records[9] = record(7, "b.bin", false);
+            records[10] = record(11, "x", true);
+            records[11] = record(10, "y", true);
+            records[12] = record(11, "lost.bin", false);
+            records[13] = record(6, "c.bin", false);
+
+            let mut cache = DirPathCache::new(&records, Path::new("C:\\"));
+            let path =
+                |cache: &mut DirPathCache, idx| cache.file_path(idx).map(|p| display_path(&p));
+            assert_eq!(
+                path(&mut cache, 8).as_deref(),
+                Some("C:\\Users\\Data\\a.bin")
+            );
+            assert_eq!(
+                path(&mut cache, 9).as_deref(),
+                Some("C:\\Users\\Data\\b.bin")
+            );
+            assert_eq!(cache.paths.len(), 3);
+            assert_eq!(path(&mut cache, 12), None);
+            assert_eq!(cache.slots[10], PATH_INVALID);
+            assert_eq!(cache.slots[11], PATH_INVALID);
+            assert_eq!(path(&mut cache, 13).as_deref(), Some("C:\\Users\\c.bin"));
+            assert_eq!(cache.paths.len(), 3);
         }
     }
 }